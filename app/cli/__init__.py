@@ -1,6 +1,43 @@
+import json
+import textwrap
+from enum import Enum
+from typing import Iterable
+
+import typer
+
 DECK_HELP_STR = "Specify the name of the source deck"
 
 PATH_HELP_STR = "Declare the base directory to search for valid source decks"
 DEPTH_HELP_STR = (
     "Limit how many subdirectory levels to search (default: all subdirectories)"
 )
+CHANGED_SINCE_HELP_STR = (
+    "Only consider markdown files changed since this git revision (e.g. origin/main)"
+)
+FILE_TIMEOUT_HELP_STR = (
+    "Fail any file that takes longer than this many seconds to parse, naming it"
+)
+SLOWEST_HELP_STR = "Report the N files that took longest to process"
+RENDERER_HELP_STR = (
+    "Markdown backend for card fields: markdown (Python-Markdown) or the faster "
+    "markdown-it (default: the RENDERER setting, markdown)"
+)
+
+
+class OutputFormat(str, Enum):
+    """Listing formats (``--format``): ``jsonl`` is one JSON object per line."""
+
+    TEXT = "text"
+    JSON = "json"
+    JSONL = "jsonl"
+
+
+def echo_json_array(items: Iterable[dict]) -> None:
+    """Streams items as a JSON array, byte-for-byte what
+    ``json.dumps(list(items), indent=2)`` would print."""
+    opened = False
+    for item in items:
+        text = textwrap.indent(json.dumps(item, indent=2), "  ")
+        typer.echo(("," if opened else "[") + "\n" + text, nl=False)
+        opened = True
+    typer.echo("\n]" if opened else "[]")
@@ -1,32 +1,65 @@
 from pathlib import Path
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 
 import typer
 
-from app.cli import DEPTH_HELP_STR, PATH_HELP_STR
+from app.cli import (
+    DEPTH_HELP_STR,
+    FILE_TIMEOUT_HELP_STR,
+    PATH_HELP_STR,
+    RENDERER_HELP_STR,
+    SLOWEST_HELP_STR,
+)
 from app.logic.drivers import (
-    compile_deck,
-    compile_decks,
+    changed_source_decks,
+    compile_sources,
+    extract_decks,
     list_source_decks,
-    validate_deck_files,
+    shard_decks,
 )
+from app.logic.packaging import Compression
+from app.logic.render import Renderer
+from app.logic.schedule import parse_shard
+from app.logic.sources import Deck
+from app.logic.timing import FileTimings
 from app.logic.validation import format_findings
 
 build_app = typer.Typer()
 
 
-def _abort_on_validation_errors(deck_names, search_path, search_depth) -> None:
+def _extract_or_abort(
+    deck_names, search_path, search_depth, file_timeout, timings, slowest, renderer
+) -> List[Deck]:
     """Validate before compiling so problems surface with file/line context
-    instead of an opaque mid-compile traceback."""
-    findings = validate_deck_files(
+    instead of an opaque mid-compile traceback. The same pass splits the
+    decks' files into chunks, so compiling does not parse them again."""
+    findings, sources = extract_decks(
         deck_names=deck_names,
         source_search_path=search_path,
         source_search_depth=search_depth,
+        file_timeout=file_timeout,
+        timings=timings,
+        renderer=renderer,
     )
     if findings:
         typer.echo(format_findings(findings))
     if any(f.level == "error" for f in findings):
+        if timings is not None:
+            typer.echo(timings.format_slowest(slowest))
+        raise typer.Exit(1)
+    return sources
+
+
+def _compile(sources, timings, slowest, **options) -> None:
+    """Compiles the extracted decks, then reports the slowest files."""
+    try:
+        compile_sources(sources, **options)
+    except ValueError as exc:
+        typer.echo(str(exc))
         raise typer.Exit(1)
+    finally:
+        if timings is not None:
+            typer.echo(timings.format_slowest(slowest))
 
 
 @build_app.callback(invoke_without_command=True)
@@ -48,33 +81,170 @@ def compile_src_decks(
         Optional[Path],
         typer.Option(help="Declare the output directory to write compiled packages to"),
     ] = Path("."),
+    compression: Annotated[
+        Compression,
+        typer.Option(
+            help="Package compression: store writes everything uncompressed; "
+            "deflate, fast and best deflate text and the collection at the "
+            "default, fastest or smallest level (images and audio stay stored)",
+        ),
+    ] = Compression.DEFLATE,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            "--incremental",
+            help="Copy unchanged media from the package already in the output "
+            "directory instead of recompressing it",
+        ),
+    ] = False,
+    bundle: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Write every selected deck into this single package, storing "
+            "shared media once (ignores --output)",
+        ),
+    ] = None,
+    changed_since: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Only compile decks with a source file changed since this git "
+            "revision (e.g. origin/main)",
+        ),
+    ] = None,
+    file_timeout: Annotated[
+        Optional[float],
+        typer.Option(min=0, metavar="SECONDS", help=FILE_TIMEOUT_HELP_STR),
+    ] = None,
+    slowest: Annotated[
+        Optional[int],
+        typer.Option(min=1, metavar="N", help=SLOWEST_HELP_STR),
+    ] = None,
+    renderer: Annotated[
+        Optional[Renderer],
+        typer.Option(help=RENDERER_HELP_STR),
+    ] = None,
+    delta_from: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Package only notes that are new or changed since this earlier "
+            "package or fingerprint file (Anki updates notes by uid on import)",
+        ),
+    ] = None,
+    fingerprints: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Write a fingerprint of every compiled note to this file, to "
+            "use as a later --delta-from",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            min=1, help="Compile decks in this many parallel processes, largest first"
+        ),
+    ] = 1,
+    shard: Annotated[
+        Optional[str],
+        typer.Option(
+            metavar="i/N",
+            help="Compile only the i-th of N groups of decks of about equal "
+            "cost, as one of N CI machines, and write a shard manifest to the "
+            "output directory (see merge-manifests)",
+        ),
+    ] = None,
 ) -> None:
     """Compiles valid deck(s) into Anki package(s)."""
 
     search_path = path
     search_depth = depth
     output_path = output
+    timings = FileTimings() if slowest else None
+    renderer_name = renderer.value if renderer is not None else None
 
-    source_names = list_source_decks(
-        source_search_path=search_path, source_search_depth=search_depth
-    )
+    shard_spec = None
+    if shard is not None:
+        try:
+            shard_spec = parse_shard(shard)
+        except ValueError as exc:
+            typer.echo(str(exc))
+            raise typer.Exit(1)
+        if deck is not None or bundle is not None:
+            typer.echo(
+                "--shard splits --all; it cannot be used with --deck or --bundle."
+            )
+            raise typer.Exit(1)
+
+    if changed_since is not None:
+        try:
+            source_names = changed_source_decks(
+                source_search_path=search_path,
+                source_search_depth=search_depth,
+                changed_since=changed_since,
+            )
+        except ValueError as exc:
+            typer.echo(str(exc))
+            raise typer.Exit(1)
+        if deck is None:
+            all_ = True  # every deck with a changed file
+        if not source_names or (not all_ and deck not in source_names):
+            typer.echo(f"No selected deck has changed since {changed_since}.")
+            if shard_spec is None:
+                return  # a shard still writes its (empty) manifest
+    else:
+        source_names = list_source_decks(
+            source_search_path=search_path, source_search_depth=search_depth
+        )
 
     if all_ is False and deck in source_names:
-        _abort_on_validation_errors([deck], search_path, search_depth)
-        compile_deck(
-            deck_name=deck,
-            source_search_path=search_path,
-            source_search_depth=search_depth,
+        _compile(
+            _extract_or_abort(
+                [deck],
+                search_path,
+                search_depth,
+                file_timeout,
+                timings,
+                slowest,
+                renderer_name,
+            ),
+            timings,
+            slowest,
             output_path=output_path,
+            compression=compression,
+            incremental=incremental,
+            bundle=bundle,
+            delta_from=delta_from,
+            fingerprints=fingerprints,
+            jobs=jobs,
         )
 
     elif all_ is True:
-        _abort_on_validation_errors(source_names, search_path, search_depth)
-        compile_decks(
-            deck_names=source_names,
-            source_search_path=search_path,
-            source_search_depth=search_depth,
+        if shard_spec is not None:
+            source_names = shard_decks(
+                source_names,
+                source_search_path=search_path,
+                source_search_depth=search_depth,
+                shard=shard_spec,
+            )
+        _compile(
+            _extract_or_abort(
+                source_names,
+                search_path,
+                search_depth,
+                file_timeout,
+                timings,
+                slowest,
+                renderer_name,
+            ),
+            timings,
+            slowest,
             output_path=output_path,
+            compression=compression,
+            incremental=incremental,
+            bundle=bundle,
+            delta_from=delta_from,
+            fingerprints=fingerprints,
+            jobs=jobs,
+            shard=shard_spec,
         )
 
     else:
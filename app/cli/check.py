@@ -1,12 +1,22 @@
 import json
+from contextlib import closing
 from pathlib import Path
-from typing import Annotated, List, Optional
+from typing import Annotated, Iterable, Iterator, List, Optional
 
 import typer
 
-from app.cli import DEPTH_HELP_STR, PATH_HELP_STR
-from app.logic.drivers import list_source_decks, validate_deck_files
-from app.logic.validation import findings_to_dicts, format_findings
+from app.cli import (
+    CHANGED_SINCE_HELP_STR,
+    DEPTH_HELP_STR,
+    FILE_TIMEOUT_HELP_STR,
+    PATH_HELP_STR,
+    SLOWEST_HELP_STR,
+    OutputFormat,
+    echo_json_array,
+)
+from app.logic.drivers import iter_deck_findings
+from app.logic.timing import FileTimings
+from app.logic.validation import Finding, FindingCounts, finding_to_dict
 
 check_app = typer.Typer()
 
@@ -21,32 +31,109 @@ def check_src_decks(
     path: Annotated[Optional[Path], typer.Option(help=PATH_HELP_STR)] = Path("."),
     depth: Annotated[Optional[int], typer.Option(min=0, help=DEPTH_HELP_STR)] = None,
     format_: Annotated[
-        str,
-        typer.Option("--format", help="Output format: text or json"),
-    ] = "text",
+        OutputFormat,
+        typer.Option(
+            "--format",
+            help="Output format: text, json, or jsonl (one JSON object per line)",
+        ),
+    ] = OutputFormat.TEXT,
+    max_findings: Annotated[
+        Optional[int],
+        typer.Option(min=1, help="Stop after reporting this many findings"),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(min=1, help="Validate files in this many parallel processes"),
+    ] = 1,
+    cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache",
+            help="Reuse results for unchanged files from the vault's cache "
+            "directory (duplicate uids are still checked across every file)",
+        ),
+    ] = False,
+    changed_since: Annotated[
+        Optional[str],
+        typer.Option(help=CHANGED_SINCE_HELP_STR),
+    ] = None,
+    file_timeout: Annotated[
+        Optional[float],
+        typer.Option(min=0, metavar="SECONDS", help=FILE_TIMEOUT_HELP_STR),
+    ] = None,
+    slowest: Annotated[
+        Optional[int],
+        typer.Option(min=1, metavar="N", help=SLOWEST_HELP_STR),
+    ] = None,
 ) -> None:
-    """Validates deck source files without compiling them."""
+    """Validates deck source files without compiling them.
 
-    if all_:
-        deck_names: List[str] = list_source_decks(
-            source_search_path=path, source_search_depth=depth
-        )
+    Findings are written as they are found, so memory stays flat however
+    large the vault is.
+    """
+
+    if (changed_since is not None and deck is None) or all_:
+        deck_names: Optional[List[str]] = None  # every deck (with a changed file)
     elif deck is not None:
         deck_names = [deck]
     else:
         typer.echo("Not a valid source selection.")
         raise typer.Exit(1)
 
-    findings = validate_deck_files(
-        deck_names=deck_names,
-        source_search_path=path,
-        source_search_depth=depth,
-    )
+    timings = FileTimings() if slowest else None
+    try:
+        deck_findings = iter_deck_findings(
+            deck_names=deck_names,
+            source_search_path=path,
+            source_search_depth=depth,
+            jobs=jobs,
+            use_cache=cache,
+            changed_since=changed_since,
+            file_timeout=file_timeout,
+            timings=timings,
+        )
+    except ValueError as exc:
+        typer.echo(str(exc))
+        raise typer.Exit(1)
 
-    if format_ == "json":
-        typer.echo(json.dumps(findings_to_dicts(findings), indent=2))
-    else:
-        typer.echo(format_findings(findings))
+    counts = FindingCounts()
+    findings = _capped(deck_findings, max_findings, counts)
 
-    if any(finding.level == "error" for finding in findings):
+    # Closed here rather than whenever it is collected: a run stopped by
+    # --max-findings leaves it suspended, holding the vault's caches open.
+    with closing(deck_findings):
+        if format_ == OutputFormat.JSON:
+            echo_json_array(finding_to_dict(finding) for finding in findings)
+        elif format_ == OutputFormat.JSONL:
+            for finding in findings:
+                typer.echo(json.dumps(finding_to_dict(finding)))
+        else:
+            for finding in findings:
+                typer.echo(finding.format())
+
+    if counts.truncated:
+        # Keep machine-readable output parseable; the note goes to stderr.
+        typer.echo(
+            f"stopped after {max_findings} finding(s) (--max-findings)",
+            err=format_ != OutputFormat.TEXT,
+        )
+    if format_ == OutputFormat.TEXT:
+        typer.echo(counts.summary())
+    if timings is not None:
+        typer.echo(timings.format_slowest(slowest), err=format_ != OutputFormat.TEXT)
+
+    if counts.errors:
         raise typer.Exit(1)
+
+
+def _capped(
+    findings: Iterable[Finding], limit: Optional[int], counts: FindingCounts
+) -> Iterator[Finding]:
+    """Passes findings through, tallying them into ``counts`` and stopping
+    after ``limit`` when given."""
+    for finding in findings:
+        if limit is not None and counts.total >= limit:
+            counts.truncated = True
+            return
+        counts.add(finding)
+        yield finding
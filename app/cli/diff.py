@@ -0,0 +1,79 @@
+import json
+from pathlib import Path
+from typing import Annotated, Iterable, Iterator, Optional, Tuple
+
+import typer
+
+from app.cli import (
+    DEPTH_HELP_STR,
+    PATH_HELP_STR,
+    RENDERER_HELP_STR,
+    OutputFormat,
+    echo_json_array,
+)
+from app.logic.drivers import diff_builds
+from app.logic.render import Renderer
+
+BUILD_HELP_STR = (
+    "A package (.apkg), a fingerprint file from build --fingerprints, a vault "
+    "directory, or a git revision of the vault at --path"
+)
+
+
+def diff_src_decks(
+    old: Annotated[str, typer.Argument(help=BUILD_HELP_STR)],
+    new: Annotated[str, typer.Argument(help=BUILD_HELP_STR)],
+    path: Annotated[Optional[Path], typer.Option(help=PATH_HELP_STR)] = Path("."),
+    depth: Annotated[Optional[int], typer.Option(min=0, help=DEPTH_HELP_STR)] = None,
+    format_: Annotated[
+        OutputFormat,
+        typer.Option(
+            "--format",
+            help="Output format: text, json, or jsonl (one JSON object per line)",
+        ),
+    ] = OutputFormat.TEXT,
+    renderer: Annotated[
+        Optional[Renderer],
+        typer.Option(help=RENDERER_HELP_STR),
+    ] = None,
+) -> None:
+    """Lists notes added, changed or removed between two builds, by uid.
+
+    Vaults and revisions are extracted as for build but not packaged. Notes
+    are compared by fingerprint (note type, fields and tags), so a note only
+    counts as changed when Anki would see it change.
+    """
+
+    try:
+        changes = diff_builds(
+            old,
+            new,
+            source_search_path=path,
+            source_search_depth=depth,
+            renderer=renderer.value if renderer is not None else None,
+        )
+    except ValueError as exc:
+        typer.echo(str(exc))
+        raise typer.Exit(1)
+
+    counts = {"added": 0, "changed": 0, "removed": 0}
+    changes = _counted(changes, counts)
+
+    if format_ == OutputFormat.JSON:
+        echo_json_array({"uid": uid, "change": change} for change, uid in changes)
+    elif format_ == OutputFormat.JSONL:
+        for change, uid in changes:
+            typer.echo(json.dumps({"uid": uid, "change": change}))
+    else:
+        for change, uid in changes:
+            typer.echo(f"{change:<8} {uid}")
+        typer.echo(", ".join(f"{count} {change}" for change, count in counts.items()))
+
+
+def _counted(
+    changes: Iterable[Tuple[str, str]], counts: dict
+) -> Iterator[Tuple[str, str]]:
+    """Passes changes through, tallying them into ``counts`` by kind."""
+    for change, uid in changes:
+        counts[change] += 1
+        yield change, uid
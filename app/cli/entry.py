@@ -4,8 +4,12 @@ import typer
 
 from app.cli.build import build_app
 from app.cli.check import check_app
+from app.cli.diff import diff_src_decks
 from app.cli.gen import gen_app
 from app.cli.list import list_app
+from app.cli.merge import merge_manifests
+from app.cli.stats import stats_app
+from app.cli.sync import sync_app
 from app.cli.uid import uid_app
 from app.config import settings
 
@@ -15,6 +19,10 @@ app.add_typer(check_app, name="check")
 app.add_typer(list_app, name="list")
 app.add_typer(gen_app, name="gen")
 app.add_typer(uid_app, name="uid")
+app.add_typer(sync_app, name="sync")
+app.add_typer(stats_app, name="stats")
+app.command("diff")(diff_src_decks)
+app.command("merge-manifests")(merge_manifests)
 
 
 @app.callback(invoke_without_command=True)
@@ -22,7 +30,15 @@ def default(
     version: Optional[bool] = typer.Option(
         False, "--version", help="Show version information"
     ),
+    gitignore: Optional[bool] = typer.Option(
+        False,
+        "--gitignore",
+        help="Skip what .gitignore files ignore when finding sources, "
+        "as well as what .ankcignore files do",
+    ),
 ) -> None:
     """Welcome to the AnkCompiler!"""
+    if gitignore:
+        settings.GITIGNORE = True
     if version:
         typer.echo(settings.VERSION)
@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+from typing import Annotated, List, Optional
+
+import typer
+
+from app.logic.drivers import merge_shard_manifests
+
+
+def merge_manifests(
+    manifests: Annotated[
+        List[Path],
+        typer.Argument(help="The shard manifests of one build --shard run, one each"),
+    ],
+    output: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Write the merged manifest to this file instead of printing it"
+        ),
+    ] = None,
+) -> None:
+    """Combines the manifests written by build --shard into one.
+
+    Fails unless every shard of the build is given exactly once and no deck
+    was built by two shards.
+    """
+
+    try:
+        merged = merge_shard_manifests(manifests, output=output)
+    except ValueError as exc:
+        typer.echo(str(exc))
+        raise typer.Exit(1)
+
+    if output is None:
+        typer.echo(json.dumps(merged, indent=2))
+    else:
+        decks = merged["decks"].values()
+        typer.echo(
+            f"Merged {merged['shards']} shard manifest(s): {len(decks)} deck(s), "
+            f"{sum(deck['notes'] for deck in decks)} note(s)."
+        )
@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+
+from app.cli import DEPTH_HELP_STR, PATH_HELP_STR
+from app.logic.drivers import deck_stats
+
+stats_app = typer.Typer()
+
+
+@stats_app.callback(invoke_without_command=True)
+def stats_src_decks(
+    all_: Annotated[
+        Optional[bool],
+        typer.Option("--all", help="Count every deck"),
+    ] = False,
+    deck: Annotated[Optional[str], typer.Option(help="Count an explicit deck")] = None,
+    path: Annotated[Optional[Path], typer.Option(help=PATH_HELP_STR)] = Path("."),
+    depth: Annotated[Optional[int], typer.Option(min=0, help=DEPTH_HELP_STR)] = None,
+    format_: Annotated[
+        str,
+        typer.Option("--format", help="Output format: text or json"),
+    ] = "text",
+) -> None:
+    """Counts notes, cards and bytes per deck, note type, tag and file.
+
+    Nothing is rendered or packaged, so this is far faster than a build.
+    """
+
+    if all_ is False and deck is not None:
+        deck_names = [deck]
+    elif all_ is True:
+        deck_names = None
+    else:
+        typer.echo("Not a valid source selection.")
+        raise typer.Exit(1)
+
+    try:
+        stats = deck_stats(
+            deck_names=deck_names, source_search_path=path, source_search_depth=depth
+        )
+    except ValueError as exc:
+        typer.echo(str(exc))
+        raise typer.Exit(1)
+    if format_ == "json":
+        typer.echo(json.dumps(stats.to_dict(), indent=2))
+    else:
+        typer.echo(stats.format())
@@ -0,0 +1,68 @@
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+
+from app.cli import DEPTH_HELP_STR, PATH_HELP_STR, RENDERER_HELP_STR
+from app.logic.drivers import extract_decks, list_source_decks, sync_sources
+from app.logic.render import Renderer
+from app.logic.validation import format_findings
+
+sync_app = typer.Typer()
+
+
+@sync_app.callback(invoke_without_command=True)
+def sync_src_decks(
+    collection: Annotated[
+        Path,
+        typer.Option(
+            help="The local Anki collection file to update (collection.anki2 in "
+            "your Anki profile folder; close Anki first)",
+        ),
+    ],
+    all_: Annotated[
+        Optional[bool],
+        typer.Option("--all", help="Sync every deck"),
+    ] = False,
+    deck: Annotated[Optional[str], typer.Option(help="Sync an explicit deck")] = None,
+    path: Annotated[Optional[Path], typer.Option(help=PATH_HELP_STR)] = Path("."),
+    depth: Annotated[Optional[int], typer.Option(min=0, help=DEPTH_HELP_STR)] = None,
+    renderer: Annotated[
+        Optional[Renderer],
+        typer.Option(help=RENDERER_HELP_STR),
+    ] = None,
+) -> None:
+    """Updates valid deck(s) in a local Anki collection in place.
+
+    Notes are matched by uid; only notes whose content or tags changed are
+    rewritten, so their review history is kept. A collection opened by Anki
+    2.1.28 or later must already have the decks and note types (import a
+    package from ankc build once).
+    """
+
+    source_names = list_source_decks(source_search_path=path, source_search_depth=depth)
+    if all_ is False and deck in source_names:
+        deck_names = [deck]
+    elif all_ is True:
+        deck_names = source_names
+    else:
+        typer.echo("Not a valid source selection.")
+        raise typer.Exit(1)
+
+    findings, sources = extract_decks(
+        deck_names=deck_names,
+        source_search_path=path,
+        source_search_depth=depth,
+        renderer=renderer.value if renderer is not None else None,
+    )
+    if findings:
+        typer.echo(format_findings(findings))
+    if any(f.level == "error" for f in findings):
+        raise typer.Exit(1)
+
+    try:
+        result = sync_sources(sources, collection=collection)
+    except ValueError as exc:
+        typer.echo(str(exc))
+        raise typer.Exit(1)
+    typer.echo(result.summary())
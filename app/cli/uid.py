@@ -1,11 +1,13 @@
 from pathlib import Path
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 
 import typer
 
-from app.cli import DEPTH_HELP_STR, PATH_HELP_STR
+from app.cli import CHANGED_SINCE_HELP_STR, DEPTH_HELP_STR, PATH_HELP_STR
 from app.logic.drivers import (
+    changed_source_files,
     dirty_source_files,
+    find_uid,
     fix_source_files,
     stamp_source_files,
 )
@@ -33,6 +35,18 @@ def stamp_uids(
             "well-formed blocks and stamp missing uids (rewrites structure)",
         ),
     ] = False,
+    changed_since: Annotated[
+        Optional[str],
+        typer.Option(help=CHANGED_SINCE_HELP_STR),
+    ] = None,
+    find: Annotated[
+        Optional[str],
+        typer.Option(
+            "--find",
+            metavar="UID",
+            help="Print where the card with this uid lives; change nothing",
+        ),
+    ] = None,
 ) -> None:
     """Inserts a [^uid] footnote into any card block that lacks one.
 
@@ -41,10 +55,33 @@ def stamp_uids(
     single '---' delimiter into well-formed card blocks.
     """
 
+    if find is not None:
+        locations = find_uid(find, source_search_path=path, source_search_depth=depth)
+        if not locations:
+            typer.echo(f"uid '{find}' not found")
+            raise typer.Exit(1)
+        for file_path, line in locations:
+            typer.echo(f"{file_path}:{line}")
+        return
+
+    file_paths = None
+    if changed_since is not None:
+        try:
+            file_paths = changed_source_files(
+                source_search_path=path,
+                source_search_depth=depth,
+                changed_since=changed_since,
+            )
+        except ValueError as exc:
+            typer.echo(str(exc))
+            raise typer.Exit(1)
+
     # Refuse to rewrite files with uncommitted changes so there's always a
     # clean git checkpoint to revert to. --check writes nothing; --force opts out.
     if not check and not force:
-        dirty = dirty_source_files(source_search_path=path, source_search_depth=depth)
+        dirty = dirty_source_files(
+            source_search_path=path, source_search_depth=depth, file_paths=file_paths
+        )
         if dirty:
             typer.echo("Refusing to modify files with uncommitted changes:")
             for dirty_path in dirty:
@@ -53,11 +90,14 @@ def stamp_uids(
             raise typer.Exit(1)
 
     if fix:
-        _run_fix(path=path, depth=depth, check=check)
+        _run_fix(path=path, depth=depth, check=check, file_paths=file_paths)
         return
 
     results = stamp_source_files(
-        source_search_path=path, source_search_depth=depth, dry_run=check
+        source_search_path=path,
+        source_search_depth=depth,
+        dry_run=check,
+        file_paths=file_paths,
     )
 
     total = 0
@@ -78,10 +118,18 @@ def stamp_uids(
         raise typer.Exit(1)
 
 
-def _run_fix(path: Optional[Path], depth: Optional[int], check: bool) -> None:
+def _run_fix(
+    path: Optional[Path],
+    depth: Optional[int],
+    check: bool,
+    file_paths: Optional[List[Path]],
+) -> None:
     """Handles `ankc uid --fix`: structural normalization of draft decks."""
     results = fix_source_files(
-        source_search_path=path, source_search_depth=depth, dry_run=check
+        source_search_path=path,
+        source_search_depth=depth,
+        dry_run=check,
+        file_paths=file_paths,
     )
 
     changed = 0
@@ -4,13 +4,20 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     """Project settings"""
 
-    VERSION: str = "0.3.0"
+    VERSION: str = "0.4.0"
     DECK_TITLE_KEY: str = "deck"
     GUID_KEY: str = "uid"
     TAG_KEY: str = "tag"
     TYPE_KEY: str = "type"
     META_TAG_KEY: str = "tags"
     MASTER_STYLESHEET: str = "_stylesheet.css"
+    CACHE_DIR: str = ".ankc-cache"
+    IGNORE_FILE: str = ".ankcignore"
+    GITIGNORE: bool = False  # also honour .gitignore files in source discovery
+    READ_CONCURRENCY: int = 8
+    READ_WINDOW: int = 64
+    MMAP_THRESHOLD: int = 16 * 1024 * 1024  # bytes
+    RENDERER: str = "markdown"  # see app.logic.render.Renderer
 
 
 settings = Settings()
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.logic.timing import BudgetExceeded, time_budget
+from app.logic.utils import connect_cache, generate_random_string, vault_key
+from app.logic.validation import FileReport, Finding, UidIndex, scan_uids
+
+_READ_BUFFER_SIZE = 1 << 20
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as handle:
+        while chunk := handle.read(_READ_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FindingsCache:
+    """Per-file validation reports, keyed by path relative to the vault and
+    valid only for the same content hash and ankc version.
+
+    A cached ``FileReport`` holds everything validation knows about a single
+    file, including its uid occurrences, so a warm check re-runs only the
+    deck-wide duplicate-uid merge for files that did not change.
+    """
+
+    FILE_NAME = "findings.sqlite"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS reports ("
+        " path TEXT PRIMARY KEY,"
+        " digest TEXT NOT NULL,"
+        " version TEXT NOT NULL,"
+        " findings TEXT NOT NULL,"
+        " uids TEXT NOT NULL)"
+    )
+
+    def __init__(self, conn: sqlite3.Connection, search_path: Path) -> None:
+        self._root = Path(search_path)
+        self._conn = conn
+
+    @classmethod
+    def open(cls, search_path: Path) -> "FindingsCache":
+        """Opens the cache for the vault at ``search_path`` (in memory when
+        the vault cannot hold it, see ``connect_cache``)."""
+        return cls(connect_cache(search_path, cls.FILE_NAME, cls.SCHEMA), search_path)
+
+    def close(self) -> None:
+        """Commits everything stored during this run and closes the cache."""
+        self._conn.commit()
+        self._conn.close()
+
+    def digest(self, path: Path) -> str:
+        return file_digest(path)
+
+    def has(self, path: Path, digest: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM reports WHERE path = ? AND digest = ? AND version = ?",
+            (vault_key(path, self._root), digest, settings.VERSION),
+        ).fetchone()
+        return row is not None
+
+    def get(self, path: Path, digest: str) -> Optional[FileReport]:
+        """The cached report for ``path``, or None if it is missing or stale."""
+        row = self._conn.execute(
+            "SELECT findings, uids FROM reports"
+            " WHERE path = ? AND digest = ? AND version = ?",
+            (vault_key(path, self._root), digest, settings.VERSION),
+        ).fetchone()
+        if row is None:
+            return None
+
+        findings, uids = json.loads(row[0]), json.loads(row[1])
+        return FileReport(
+            path=path,
+            findings=[
+                Finding(path, line, level, message) for line, level, message in findings
+            ],
+            uids=[(uid, line, position) for uid, line, position in uids],
+        )
+
+    def put(self, report: FileReport, digest: str) -> None:
+        """Stores ``report``, replacing any older entry for its path."""
+        findings = [[f.line, f.level, f.message] for f in report.findings]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?)",
+            (
+                vault_key(report.path, self._root),
+                digest,
+                settings.VERSION,
+                json.dumps(findings),
+                json.dumps(report.uids),
+            ),
+        )
+
+    def prune(self, paths: Iterable[Path]) -> None:
+        """Drops every report but those of ``paths``: on a run that validates
+        every deck file, what is left over belongs to files since deleted,
+        renamed or no longer part of a deck."""
+        keys = {vault_key(path, self._root) for path in paths}
+        gone = [
+            (key,)
+            for (key,) in self._conn.execute("SELECT path FROM reports")
+            if key not in keys
+        ]
+        self._conn.executemany("DELETE FROM reports WHERE path = ?", gone)
+
+
+class UidStore:
+    """A persistent index of where every uid in the vault lives.
+
+    Files are recorded by path relative to the vault with the size and mtime
+    they had when scanned, so keeping the index current costs a ``stat`` per
+    file and only re-reads files that changed. ``build``, ``check`` and
+    ``uid`` all sync the files they touch.
+    """
+
+    FILE_NAME = "uids.sqlite"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS files ("
+        " path TEXT PRIMARY KEY,"
+        " size INTEGER NOT NULL,"
+        " mtime_ns INTEGER NOT NULL);"
+        "CREATE TABLE IF NOT EXISTS uids ("
+        " uid TEXT NOT NULL,"
+        " path TEXT NOT NULL,"
+        " line INTEGER NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS uids_by_uid ON uids (uid);"
+        "CREATE INDEX IF NOT EXISTS uids_by_path ON uids (path);"
+    )
+
+    def __init__(self, conn: sqlite3.Connection, search_path: Path) -> None:
+        self._root = Path(search_path)
+        self._issued: Set[str] = set()
+        self._conn = conn
+
+    @classmethod
+    def open(cls, search_path: Path) -> "UidStore":
+        """Opens the uid index for the vault at ``search_path`` (in memory
+        when the vault cannot hold it, see ``connect_cache``)."""
+        return cls(connect_cache(search_path, cls.FILE_NAME, cls.SCHEMA), search_path)
+
+    def close(self) -> None:
+        """Commits and closes the index."""
+        self._conn.commit()
+        self._conn.close()
+
+    def sync(
+        self,
+        paths: Iterable[Path],
+        complete: bool = False,
+        budget: Optional[float] = None,
+    ) -> None:
+        """Re-scans each of ``paths`` that changed since it was last indexed.
+
+        With ``complete``, ``paths`` is every markdown file in the vault and
+        anything else in the index is dropped. A file whose scan takes longer
+        than ``budget`` seconds is left out of the index until it scans in
+        time (validation reports it).
+        """
+        paths = list(paths)
+        for path, stat in self.stale(paths).items():
+            try:
+                with time_budget(budget):
+                    uids = scan_uids(path)
+            except BudgetExceeded:
+                self._forget(self._key(path))
+                continue
+            self._record(self._key(path), stat, uids)
+
+        if complete:
+            keys = {self._key(path) for path in paths}
+            stale = [
+                key
+                for (key,) in self._conn.execute("SELECT path FROM files")
+                if key not in keys
+            ]
+            for key in stale:
+                self._forget(key)
+        self._conn.commit()
+
+    def stale(self, paths: Iterable[Path]) -> Dict[Path, os.stat_result]:
+        """Each of ``paths`` that changed since it was last indexed, with the
+        ``stat`` it has now. Files since deleted are dropped from the index.
+
+        Take it before reading the files: one edited in between is then
+        recorded under its older signature and re-scanned next time.
+        """
+        changed = {}
+        for path in paths:
+            key = self._key(path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._forget(key)
+                continue
+            if self._signature(key) != (stat.st_size, stat.st_mtime_ns):
+                changed[path] = stat
+        return changed
+
+    def record(self, report: FileReport, stat: os.stat_result) -> None:
+        """Indexes the uids validation found in ``report``'s file as of
+        ``stat`` (see ``stale``), so a run that validates a file need not
+        scan it as well. A file that timed out is left out, as in ``sync``."""
+        key = self._key(report.path)
+        if report.timed_out:
+            self._forget(key)
+        else:
+            self._record(key, stat, [(uid, line) for uid, line, _ in report.uids])
+
+    def find(self, uid: str) -> List[Tuple[Path, int]]:
+        """Every indexed ``(path, line)`` holding ``uid``, in path order."""
+        rows = self._conn.execute(
+            "SELECT path, line FROM uids WHERE uid = ? ORDER BY path, line", (uid,)
+        )
+        return [(self._root / key, line) for key, line in rows]
+
+    def __contains__(self, uid: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM uids WHERE uid = ? LIMIT 1", (uid,)
+        ).fetchone()
+        return row is not None
+
+    def new_uid(self) -> str:
+        """A random uid that is neither in the index nor already handed out
+        by this store."""
+        while True:
+            uid = generate_random_string(length=10)
+            if uid not in self._issued and uid not in self:
+                self._issued.add(uid)
+                return uid
+
+    def card_counts(self, paths: Iterable[Path]) -> Dict[Path, int]:
+        """How many uids each of ``paths`` held when it was last indexed.
+        Files not in the index are left out."""
+        counts: Dict[Path, int] = {}
+        for path in paths:
+            key = self._key(path)
+            if self._signature(key) is not None:
+                (counts[path],) = self._conn.execute(
+                    "SELECT COUNT(*) FROM uids WHERE path = ?", (key,)
+                ).fetchone()
+        return counts
+
+    def collisions(self, paths: Iterable[Path]) -> UidIndex:
+        """A ``UidIndex`` of the uids in ``paths`` that also appear in some
+        other indexed file, at those other locations.
+
+        Seeding a check of a few files with it catches collisions with the
+        rest of the vault without reading the rest of the vault. Other files
+        are as current as the last run that synced them; ones since deleted
+        are skipped.
+        """
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS scope (path TEXT)")
+        self._conn.execute("DELETE FROM scope")
+        self._conn.executemany(
+            "INSERT INTO scope VALUES (?)", ((self._key(path),) for path in paths)
+        )
+        rows = self._conn.execute(
+            "SELECT DISTINCT other.uid, other.path, other.line"
+            " FROM uids AS mine JOIN uids AS other ON other.uid = mine.uid"
+            " WHERE mine.path IN (SELECT path FROM scope)"
+            " AND other.path NOT IN (SELECT path FROM scope)"
+            " ORDER BY other.path, other.line"
+        ).fetchall()
+
+        index = UidIndex()
+        for uid, key, line in rows:
+            path = self._root / key
+            if path.is_file():
+                index.add(uid, path, line)
+        return index
+
+    def _key(self, path: Path) -> str:
+        return vault_key(path, self._root)
+
+    def _signature(self, key: str) -> Optional[Tuple[int, int]]:
+        row = self._conn.execute(
+            "SELECT size, mtime_ns FROM files WHERE path = ?", (key,)
+        ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def _record(
+        self, key: str, stat: os.stat_result, uids: List[Tuple[str, int]]
+    ) -> None:
+        self._conn.execute("DELETE FROM uids WHERE path = ?", (key,))
+        self._conn.executemany(
+            "INSERT INTO uids VALUES (?, ?, ?)",
+            ((uid, key, line) for uid, line in uids),
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+            (key, stat.st_size, stat.st_mtime_ns),
+        )
+
+    def _forget(self, key: str) -> None:
+        self._conn.execute("DELETE FROM uids WHERE path = ?", (key,))
+        self._conn.execute("DELETE FROM files WHERE path = ?", (key,))
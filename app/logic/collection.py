@@ -0,0 +1,344 @@
+import filecmp
+import hashlib
+import html
+import json
+import re
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.logic.store import FIELD_SEPARATOR, NoteStore
+
+_NOTE_INSERT = "INSERT INTO notes VALUES(?,?,?,?,?,?,?,?,?,?,?)"
+_NOTE_UPDATE = (
+    "UPDATE notes SET mid = ?, mod = ?, usn = -1, tags = ?, flds = ?, sfld = ?, "
+    "csum = ? WHERE id = ?"
+)
+_CARD_INSERT = "INSERT INTO cards VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+
+# Anki's stripHTMLMedia, which a field goes through before it is checksummed:
+# images become their file names, other markup is dropped.
+_MEDIA_RE = re.compile(r"(?i)<img[^>]+src=[\"']?([^\"'>]+)[\"']?[^>]*>")
+_MARKUP_RE = re.compile(
+    r"(?is)<!--.*?-->|<style.*?>.*?</style>|<script.*?>.*?</script>|<.*?>"
+)
+
+# How long to wait for Anki (or a sync) to release the collection.
+LOCK_TIMEOUT = 2.0  # seconds
+
+
+@dataclass
+class SyncResult:
+    """What ``sync_collection`` changed."""
+
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    cards_added: int = 0
+    media_copied: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.added} note(s) added, {self.updated} updated, "
+            f"{self.unchanged} unchanged; {self.cards_added} card(s) added, "
+            f"{self.media_copied} media file(s) copied"
+        )
+
+
+def media_dir(collection: Path) -> Path:
+    """The media folder Anki keeps beside a collection
+    (``collection.anki2`` -> ``collection.media``)."""
+    return Path(collection).with_suffix(".media")
+
+
+def sync_collection(
+    collection: Path,
+    stores: List[NoteStore],
+    media_files: List[Path],
+    timestamp: Optional[float] = None,
+) -> SyncResult:
+    """Upserts decks' notes into a local Anki collection by guid.
+
+    Only notes whose note type, fields or tags differ from the collection's
+    are rewritten, and their cards (with review history) are kept; a note
+    that gains a card, e.g. a new cloze number, gets just that card. Decks
+    and note types missing from the collection are added under their fixed
+    ids. Notes the sources no longer have are left alone. New notes are
+    queued after the collection's own (its ``nextPos``), as Anki adds them.
+
+    A collection opened by Anki 2.1.28 or later keeps decks and note types
+    in tables of its own; there, the decks and note types must already exist
+    (as they do once a package from ``ankc build`` was imported), and new
+    tags show in Anki's sidebar after Tools > Check Database.
+
+    New or changed media is copied into the collection's media folder first,
+    so a note never references a file that is not there. Every database
+    change is made in one transaction. Raises ValueError when ``collection``
+    is not an Anki collection this can write (see ``_check_schema``) or Anki
+    holds it locked.
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    collection = Path(collection)
+    if not collection.is_file():
+        raise ValueError(f"No Anki collection at {collection}")
+
+    result = SyncResult()
+    conn = sqlite3.connect(collection, timeout=LOCK_TIMEOUT, isolation_level=None)
+    try:
+        modern = _check_schema(conn, collection)
+        if modern:
+            _check_entries(conn, collection, stores)
+        result.media_copied = _copy_media(media_files, media_dir(collection))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as exc:
+            raise ValueError(
+                f"{collection} is in use ({exc}); close Anki and try again"
+            )
+        try:
+            _upsert(conn, stores, timestamp, result, modern)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return result
+
+
+def _check_schema(conn: sqlite3.Connection, collection: Path) -> bool:
+    """Returns whether ``collection`` has the modern schema.
+
+    The legacy schema (the one packages carry) keeps note types and decks as
+    JSON in ``col``. Anki 2.1.28+ migrates a collection it opens to a schema
+    that keeps them in tables of protobuf-encoded rows instead; notes and
+    cards are stored the same way in both.
+    """
+    try:
+        tables = {
+            name
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+    except sqlite3.DatabaseError as exc:
+        raise ValueError(f"{collection} is not an Anki collection: {exc}")
+    if not {"col", "notes", "cards"} <= tables:
+        raise ValueError(f"{collection} is not an Anki collection")
+    return "notetypes" in tables
+
+
+def _check_entries(
+    conn: sqlite3.Connection, collection: Path, stores: List[NoteStore]
+) -> None:
+    """Refuses a modern-schema collection missing a deck or note type the
+    stores need, or whose note type has a different number of fields. Their
+    rows are protobuf-encoded and indexed with a collation only Anki
+    defines, so ankc does not write them."""
+    decks = {deck_id for (deck_id,) in conn.execute("SELECT id FROM decks")}
+    field_counts = dict(
+        conn.execute("SELECT ntid, COUNT(*) FROM fields GROUP BY ntid").fetchall()
+    )
+    missing = []
+    for store in stores:
+        if int(store.deck_id) not in decks:
+            missing.append(f"deck '{store.name}'")
+        for model in store.models:
+            if field_counts.get(int(model.model_id)) != len(model.fields):
+                missing.append(f"note type '{model.name}'")
+    if missing:
+        raise ValueError(
+            f"{collection} uses the schema of Anki 2.1.28 or later, where ankc "
+            "sync can only update decks and note types that already exist; "
+            f"missing or different: {', '.join(dict.fromkeys(missing))}. "
+            "Import a package from ankc build once, then sync"
+        )
+
+
+def _copy_media(media_files: List[Path], target: Path) -> int:
+    """Copies media that is missing from ``target`` or differs from the copy
+    there, returning how many files were copied."""
+    copied = 0
+    for media in media_files:
+        destination = target / Path(media).name
+        if destination.is_file() and filecmp.cmp(media, destination, shallow=False):
+            continue
+        target.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(media, destination)
+        copied += 1
+    return copied
+
+
+def _upsert(
+    conn: sqlite3.Connection,
+    stores: List[NoteStore],
+    timestamp: float,
+    result: SyncResult,
+    modern: bool = False,
+) -> None:
+    mod = int(timestamp)
+    # Modern decks and note types were checked to exist (_check_entries).
+    entries = None if modern else _col_entries(conn, stores, timestamp)
+    start_pos = next_pos = _next_pos(conn, modern)
+
+    # guid -> (id, mid, tags, flds)
+    existing: Dict[str, Tuple[int, int, str, str]] = {
+        guid: (note_id, mid, tags, flds)
+        for note_id, guid, mid, tags, flds in conn.execute(
+            "SELECT id, guid, mid, tags, flds FROM notes"
+        )
+    }
+    (max_id,) = conn.execute(
+        "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM notes "
+        "UNION ALL SELECT MAX(id) FROM cards)"
+    ).fetchone()
+    # Ids are creation times in milliseconds; stay clear of every existing one.
+    next_id = max(int(timestamp * 1000), (max_id or 0) + 1)
+
+    for store in stores:
+        for row in range(len(store)):
+            guid = store.guids[row]
+            mid = int(store.models[store.model_index[row]].model_id)
+            tags = store.tag_sets[store.tag_set_index[row]]
+            flds = store.fields[row]
+            sfld = store.sort_field(row)
+            csum = _field_checksum(flds.split(FIELD_SEPARATOR, 1)[0])
+
+            current = existing.get(guid)
+            if current is None:
+                note_id, next_id = next_id, next_id + 1
+                conn.execute(
+                    _NOTE_INSERT,
+                    (note_id, guid, mid, mod, -1, tags, flds, sfld, csum, 0, ""),
+                )
+                result.added += 1
+                have_ords: Set[int] = set()
+                due = None
+            else:
+                note_id, old_mid, old_tags, old_flds = current
+                if (old_mid, old_tags, old_flds) == (mid, tags, flds):
+                    result.unchanged += 1
+                    continue
+                if old_mid != mid:
+                    # A new note type means new templates: the old cards no
+                    # longer correspond to anything.
+                    conn.execute("DELETE FROM cards WHERE nid = ?", (note_id,))
+                conn.execute(_NOTE_UPDATE, (mid, mod, tags, flds, sfld, csum, note_id))
+                result.updated += 1
+                have_ords = set()
+                due = None
+                for ord_, type_, card_due in conn.execute(
+                    "SELECT ord, type, due FROM cards WHERE nid = ?", (note_id,)
+                ):
+                    have_ords.add(ord_)
+                    if type_ == 0:
+                        due = card_due  # new siblings share a queue position
+
+            for ord_, suspended in store.cards(row):
+                if ord_ in have_ords:
+                    continue
+                if due is None:
+                    due, next_pos = next_pos, next_pos + 1
+                card_id, next_id = next_id, next_id + 1
+                conn.execute(
+                    _CARD_INSERT,
+                    (
+                        card_id,
+                        note_id,
+                        store.deck_id,
+                        ord_,
+                        mod,
+                        -1,  # usn
+                        0,  # type
+                        -1 if suspended else 0,  # queue
+                        due,
+                        0,  # ivl
+                        0,  # factor
+                        0,  # reps
+                        0,  # lapses
+                        0,  # left
+                        0,  # odue
+                        0,  # odid
+                        0,  # flags
+                        "",  # data
+                    ),
+                )
+                result.cards_added += 1
+
+    if next_pos != start_pos:
+        _set_next_pos(conn, modern, next_pos, timestamp)
+    if result.added or result.updated or (entries is not None and entries[2]):
+        if entries is None:
+            conn.execute("UPDATE col SET mod = ?", (int(timestamp * 1000),))
+        else:
+            conn.execute(
+                "UPDATE col SET mod = ?, decks = ?, models = ?",
+                (
+                    int(timestamp * 1000),
+                    json.dumps(entries[0]),
+                    json.dumps(entries[1]),
+                ),
+            )
+
+
+def _col_entries(
+    conn: sqlite3.Connection, stores: List[NoteStore], timestamp: float
+) -> Tuple[dict, dict, bool]:
+    """The legacy schema's deck and note type JSON from ``col`` with any the
+    stores need added, and whether any were."""
+    decks_json, models_json = conn.execute("SELECT decks, models FROM col").fetchone()
+    deck_entries = json.loads(decks_json)
+    model_entries = json.loads(models_json)
+    added_entries = False
+    for store in stores:
+        if str(store.deck_id) not in deck_entries:
+            deck_entries[str(store.deck_id)] = store.to_json()
+            added_entries = True
+        for model in store.models:
+            if str(model.model_id) not in model_entries:
+                model_entries[str(model.model_id)] = model.to_json(
+                    timestamp, store.deck_id
+                )
+                added_entries = True
+    return deck_entries, model_entries, added_entries
+
+
+def _next_pos(conn: sqlite3.Connection, modern: bool) -> int:
+    """The collection's ``nextPos``: the due position Anki gives the cards of
+    the next new note. The modern schema keeps it in the ``config`` table,
+    the legacy one in ``col.conf``; both hold it as JSON."""
+    if modern:
+        row = conn.execute("SELECT val FROM config WHERE KEY = 'nextPos'").fetchone()
+        return int(json.loads(row[0])) if row is not None else 1
+    (conf,) = conn.execute("SELECT conf FROM col").fetchone()
+    return int(json.loads(conf).get("nextPos", 1))
+
+
+def _set_next_pos(
+    conn: sqlite3.Connection, modern: bool, position: int, timestamp: float
+) -> None:
+    if modern:
+        conn.execute(
+            "INSERT OR REPLACE INTO config (KEY, usn, mtime_secs, val) "
+            "VALUES ('nextPos', -1, ?, ?)",
+            (int(timestamp), json.dumps(position).encode()),
+        )
+        return
+    (conf,) = conn.execute("SELECT conf FROM col").fetchone()
+    conf = json.loads(conf)
+    conf["nextPos"] = position
+    conn.execute("UPDATE col SET conf = ?", (json.dumps(conf),))
+
+
+def _field_checksum(field: str) -> int:
+    """A note's ``csum`` as Anki computes it from the note's first field:
+    the first 32 bits of the SHA-1 of its text, with markup stripped but
+    image file names kept. Anki's duplicate check looks notes up by it."""
+    text = _MARKUP_RE.sub("", _MEDIA_RE.sub(r" \1 ", field))
+    text = html.unescape(text.replace("&nbsp;", " "))
+    digest = hashlib.sha1(text.encode("utf-8"), usedforsecurity=False)
+    return int(digest.hexdigest()[:8], 16)
@@ -1,11 +1,38 @@
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from functools import partial
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from app.config import settings
-from app.logic.sources import Deck
+from app.logic.cache import FindingsCache, UidStore
+from app.logic.collection import SyncResult, sync_collection
+from app.logic.fingerprints import (
+    diff_fingerprints,
+    read_fingerprints,
+    store_fingerprints,
+    write_fingerprints,
+)
+from app.logic.manifest import source_decks
+from app.logic.packaging import Compression
+from app.logic.schedule import (
+    DeckCost,
+    assign_shards,
+    estimate_costs,
+    largest_first,
+    merge_manifests,
+    shard_manifest_name,
+    stat_cost,
+    write_shard_manifest,
+)
+from app.logic.sources import Chunk, Deck
+from app.logic.stats import VaultStats
+from app.logic.timing import FileTimings
 from app.logic.utils import (
+    export_git_revision,
     generate_random_string,
-    parse_markdown_file,
+    search_changed_markdown_files,
     search_markdown_files,
 )
 from app.logic.stamping import (
@@ -15,7 +42,7 @@ from app.logic.stamping import (
     fix_file,
     stamp_file,
 )
-from app.logic.validation import Finding, validate_files
+from app.logic.validation import Finding, iter_file_chunks, iter_findings
 
 
 def compile_deck(
@@ -23,6 +50,8 @@ def compile_deck(
     source_search_path: Path,
     source_search_depth: Optional[int],
     output_path: Path,
+    compression: Compression = Compression.DEFLATE,
+    incremental: bool = False,
 ) -> None:
     """Compiles a single deck."""
     source = Deck(
@@ -30,7 +59,9 @@ def compile_deck(
         source_search_path=source_search_path,
         source_search_depth=source_search_depth,
     )
-    source.compile(output_path=output_path)
+    source.compile(
+        output_path=output_path, compression=compression, incremental=incremental
+    )
 
 
 def compile_decks(
@@ -38,15 +69,370 @@ def compile_decks(
     source_search_path: Path,
     source_search_depth: Optional[int],
     output_path: Path,
+    compression: Compression = Compression.DEFLATE,
+    incremental: bool = False,
+    bundle: Optional[Path] = None,
 ) -> None:
-    """Compiles a list of source decks."""
-    for source_name in deck_names:
-        compile_deck(
-            deck_name=source_name,
+    """Compiles a list of source decks, one package each, or all into the
+    single package ``bundle`` when given."""
+    sources = [
+        Deck(
+            name=source_name,
             source_search_path=source_search_path,
             source_search_depth=source_search_depth,
+        )
+        for source_name in deck_names
+    ]
+    compile_sources(
+        sources,
+        output_path=output_path,
+        compression=compression,
+        incremental=incremental,
+        bundle=bundle,
+    )
+
+
+def compile_sources(
+    sources: List[Deck],
+    output_path: Path,
+    compression: Compression = Compression.DEFLATE,
+    incremental: bool = False,
+    bundle: Optional[Path] = None,
+    delta_from: Optional[Path] = None,
+    fingerprints: Optional[Path] = None,
+    jobs: int = 1,
+    shard: Optional[Tuple[int, int]] = None,
+) -> None:
+    """Compiles source decks, one package each, or all into the single
+    package ``bundle`` when given.
+
+    With ``delta_from`` (an earlier package or fingerprint file) packages
+    hold only notes that are new or changed since it. ``fingerprints`` names
+    a file to write every compiled note's fingerprint to, delta or not, to
+    serve as the next ``delta_from``.
+
+    Separate packages are compiled in ``jobs`` processes when more than
+    one, costliest deck first. ``shard`` (``(i, N)``, see
+    ``shard_decks``) also writes a manifest of the packages built into
+    ``output_path`` for ``merge_shard_manifests``.
+    """
+    baseline = read_fingerprints(delta_from) if delta_from is not None else None
+
+    if bundle is not None:
+        stores = Deck.compile_bundle(
+            sources,
+            write_path=bundle,
+            compression=compression,
+            incremental=incremental,
+            baseline=baseline,
+        )
+        pairs = [
+            (guid, fingerprint)
+            for store in stores
+            for _, guid, fingerprint in store_fingerprints(store)
+        ]
+    else:
+        compiled = _compile_largest_first(
+            sources,
+            jobs,
+            fingerprint=fingerprints is not None,
             output_path=output_path,
+            compression=compression,
+            incremental=incremental,
+            baseline=baseline,
+        )
+        pairs = [pair for deck in compiled for pair in deck.fingerprints]
+        if shard is not None:
+            write_shard_manifest(
+                Path(output_path) / shard_manifest_name(*shard),
+                *shard,
+                decks={
+                    deck.name: {
+                        "package": deck.package,
+                        "notes": deck.notes,
+                        "cards": deck.cards,
+                    }
+                    for deck in compiled
+                },
+            )
+
+    if fingerprints is not None:
+        write_fingerprints(fingerprints, pairs)
+
+
+@dataclass
+class _CompiledDeck:
+    name: str
+    package: str
+    notes: int
+    cards: int
+    fingerprints: List[Tuple[str, str]]
+    timings: Optional[FileTimings]
+
+
+def _compile_largest_first(
+    sources: List[Deck], jobs: int, **options
+) -> List[_CompiledDeck]:
+    """Compiles each deck to its own package, returning what was built in
+    the order of ``sources``. With more than one job, decks are handed to
+    the workers costliest first."""
+    if jobs <= 1 or len(sources) <= 1:
+        compiled = [_compile_source(source, **options) for source in sources]
+    else:
+        by_name = {source.name: source for source in sources}
+        costs = [_deck_cost(source) for source in sources]
+        ordered = [by_name[deck.name] for deck in largest_first(costs)]
+        # A worker records timings in its own copy, merged back here.
+        timings = ordered[0].timings
+        if timings is not None:
+            ordered = [replace(source, timings=FileTimings()) for source in ordered]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            compiled = list(pool.map(partial(_compile_source, **options), ordered))
+        if timings is not None:
+            for deck in compiled:
+                timings.merge(deck.timings)
+
+    by_name = {deck.name: deck for deck in compiled}
+    return [by_name[source.name] for source in sources]
+
+
+def _compile_source(
+    source: Deck, output_path: Path, fingerprint: bool, **options
+) -> _CompiledDeck:
+    store = source.compile(output_path=output_path, **options)
+    return _CompiledDeck(
+        name=source.name,
+        package=source.package_path(output_path).name,
+        notes=len(store),
+        cards=len(store.card_ords),
+        fingerprints=(
+            [(guid, fp) for _, guid, fp in store_fingerprints(store)]
+            if fingerprint
+            else []
+        ),
+        timings=source.timings,
+    )
+
+
+def _deck_cost(source: Deck) -> DeckCost:
+    """A deck's cost from the chunks it was already split into, so its files
+    are only stat'ed, not read again."""
+    if source.chunks is None:
+        (cost,) = estimate_costs({source.name: source.get_source_file_paths()})
+        return cost
+    paths = dict.fromkeys(chunk.file.path for chunk in source.chunks)
+    return stat_cost(source.name, paths, cards=len(source.chunks))
+
+
+def shard_decks(
+    deck_names: List[str],
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    shard: Tuple[int, int],
+) -> List[str]:
+    """The decks that shard ``i`` of ``N`` (``shard``) builds. Decks are
+    split by estimated cost (see ``schedule.assign_shards``), the same way on
+    every machine that sees the same vault.
+
+    Card counts come from the uid index, which the build that follows keeps
+    current anyway, so a warm shard only ``stat``s its files here.
+    """
+    deck_paths = _deck_file_paths(
+        deck_names,
+        source_search_path=source_search_path,
+        source_search_depth=source_search_depth,
+    )
+    file_paths = [path for paths in deck_paths.values() for path in paths]
+    store = UidStore.open(source_search_path)
+    try:
+        store.sync(file_paths)
+        card_counts = store.card_counts(file_paths)
+    finally:
+        store.close()
+    index, count = shard
+    return assign_shards(estimate_costs(deck_paths, card_counts), count)[index - 1]
+
+
+def merge_shard_manifests(paths: List[Path], output: Optional[Path] = None) -> dict:
+    """Combines shard manifests (see ``schedule.merge_manifests``), writing
+    the result to ``output`` when given."""
+    merged = merge_manifests(paths)
+    if output is not None:
+        Path(output).write_text(json.dumps(merged, indent=2))
+    return merged
+
+
+def sync_sources(sources: List[Deck], collection: Path) -> SyncResult:
+    """Upserts source decks into the local Anki collection ``collection``
+    (see ``collection.sync_collection``)."""
+    stores, media_files = Deck.bundle_contents(sources)
+    return sync_collection(collection, stores, media_files)
+
+
+def extract_decks(
+    deck_names: List[str],
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    file_timeout: Optional[float] = None,
+    timings: Optional[FileTimings] = None,
+    renderer: Optional[str] = None,
+) -> Tuple[List[Finding], List[Deck]]:
+    """Validates the given decks' source files and splits them into chunks
+    in the same pass, returning the findings and the decks ready to compile.
+
+    Findings are exactly those of ``validate_deck_files``; the caller should
+    not compile when any is an error. ``file_timeout`` bounds each file's
+    validation and, when the decks compile, its rendering; ``timings``
+    collects both. ``renderer`` picks the decks' markdown backend.
+    """
+    deck_paths = _deck_file_paths(
+        deck_names,
+        source_search_path=source_search_path,
+        source_search_depth=source_search_depth,
+    )
+    file_paths = [path for paths in deck_paths.values() for path in paths]
+    file_chunks: Dict[Path, List[Chunk]] = {}
+    findings: List[Finding] = []
+
+    store = UidStore.open(source_search_path)
+    try:
+        # Validation finds every uid a scan would, so changed files are
+        # indexed from their reports instead of being read twice.
+        stale = store.stale(file_paths)
+        for report, file_findings, chunks in iter_file_chunks(
+            file_paths, file_timeout=file_timeout, timings=timings
+        ):
+            findings.extend(file_findings)
+            file_chunks[report.path] = chunks
+            if report.path in stale:
+                store.record(report, stale[report.path])
+    finally:
+        store.close()
+
+    sources = [
+        Deck(
+            name=deck_name,
+            source_search_path=source_search_path,
+            source_search_depth=source_search_depth,
+            chunks=[chunk for path in paths for chunk in file_chunks[path]],
+            file_timeout=file_timeout,
+            timings=timings,
+            renderer=renderer,
+        )
+        for deck_name, paths in deck_paths.items()
+    ]
+    return findings, sources
+
+
+def diff_builds(
+    old: str,
+    new: str,
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    renderer: Optional[str] = None,
+) -> Iterator[Tuple[str, str]]:
+    """``(change, uid)`` for every note added, changed or removed from the
+    build ``old`` to the build ``new`` (see ``build_fingerprints``)."""
+    before = build_fingerprints(old, source_search_path, source_search_depth, renderer)
+    after = build_fingerprints(new, source_search_path, source_search_depth, renderer)
+    return diff_fingerprints(before, after)
+
+
+def build_fingerprints(
+    build: str,
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    renderer: Optional[str] = None,
+) -> Dict[str, str]:
+    """Note fingerprints by uid for ``build``: a package or fingerprint file,
+    a vault directory, or a git revision of the vault at
+    ``source_search_path``. Vaults are extracted and rendered as for a build
+    with ``renderer``, but nothing is packaged."""
+    path = Path(build)
+    if path.is_file():
+        return read_fingerprints(path)
+    if path.is_dir():
+        return _vault_fingerprints(path, source_search_depth, renderer, build)
+    with tempfile.TemporaryDirectory() as tmp:
+        export_git_revision(source_search_path, build, Path(tmp))
+        return _vault_fingerprints(
+            Path(tmp), source_search_depth, renderer, f"Revision {build}"
+        )
+
+
+def _vault_fingerprints(
+    search_path: Path,
+    search_depth: Optional[int],
+    renderer: Optional[str],
+    label: str,
+) -> Dict[str, str]:
+    deck_names = sorted(list_source_decks(search_path, search_depth))
+    findings, sources = extract_decks(
+        deck_names,
+        source_search_path=search_path,
+        source_search_depth=search_depth,
+        renderer=renderer,
+    )
+    errors = sum(finding.level == "error" for finding in findings)
+    if errors:
+        raise ValueError(f"{label} has {errors} error(s); run ankc check to see them")
+    fingerprints: Dict[str, str] = {}
+    for source in sources:
+        store, _ = source.package_contents()
+        for _, guid, fingerprint in store_fingerprints(store):
+            fingerprints[guid] = fingerprint
+    return fingerprints
+
+
+def deck_stats(
+    deck_names: Optional[List[str]],
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+) -> VaultStats:
+    """Counts the given decks' notes, cards and bytes by deck, note type, tag
+    and file, without rendering anything (see ``VaultStats``). ``None`` counts
+    every deck. Raises ValueError for a deck with no source files."""
+    deck_paths = _deck_file_paths(
+        deck_names,
+        source_search_path=source_search_path,
+        source_search_depth=source_search_depth,
+    )
+    for deck_name, paths in deck_paths.items():
+        if not paths:
+            raise ValueError(f"No source files for deck {deck_name}")
+    stats = VaultStats()
+    for deck_name, paths in deck_paths.items():
+        source = Deck(
+            name=deck_name,
+            source_search_path=source_search_path,
+            source_search_depth=source_search_depth,
         )
+        for file in source.get_source_files(paths):
+            stats.add_file(deck_name, file)
+    return stats
+
+
+def _deck_file_paths(
+    deck_names: Optional[List[str]],
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+) -> Dict[str, List[Path]]:
+    """Each deck's source files, as ``Deck.get_source_file_paths`` lists them,
+    from a single search of the vault. ``None`` lists every deck, by name."""
+    decks = source_decks(
+        search_markdown_files(
+            search_path=source_search_path, search_depth=source_search_depth
+        ),
+        search_path=source_search_path,
+        complete=source_search_depth is None,
+    )
+    if deck_names is None:
+        deck_names = sorted({name for name in decks.values() if name is not None})
+    deck_paths: Dict[str, List[Path]] = {deck_name: [] for deck_name in deck_names}
+    for path, deck_name in decks.items():
+        if deck_name in deck_paths:
+            deck_paths[deck_name].append(path)
+    return deck_paths
 
 
 def list_source_decks(
@@ -59,12 +445,14 @@ def list_source_decks(
         search_depth=source_search_depth,
     )
 
-    deck_set = set()
-    for file_path in markdown_file_paths:
-        meta = parse_markdown_file(file_path)[0]
-
-        deck_name = meta.get(settings.DECK_TITLE_KEY)
+    decks = source_decks(
+        markdown_file_paths,
+        search_path=source_search_path,
+        complete=source_search_depth is None,
+    )
 
+    deck_set = set()
+    for deck_name in decks.values():
         if deck_name is not None:
             deck_set.add(deck_name)
 
@@ -91,60 +479,268 @@ def validate_deck_files(
     deck_names: List[str],
     source_search_path: Path,
     source_search_depth: Optional[int],
+    jobs: int = 1,
 ) -> List[Finding]:
     """Validates all source files belonging to the given decks."""
-    file_paths: List[Path] = []
-    for deck_name in deck_names:
-        file_paths.extend(
-            list_source_files(
-                deck_name=deck_name,
+    return list(
+        iter_deck_findings(
+            deck_names=deck_names,
+            source_search_path=source_search_path,
+            source_search_depth=source_search_depth,
+            jobs=jobs,
+        )
+    )
+
+
+def iter_deck_findings(
+    deck_names: Optional[List[str]],
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    jobs: int = 1,
+    use_cache: bool = False,
+    changed_since: Optional[str] = None,
+    file_timeout: Optional[float] = None,
+    timings: Optional[FileTimings] = None,
+) -> Iterator[Finding]:
+    """Lazily validates the given decks' source files (``deck_names`` of None
+    selects every deck), yielding findings as they are produced. With
+    ``use_cache``, unchanged files reuse their results from the vault's
+    findings cache, which a run over every deck at unlimited depth also
+    prunes of files it no longer has.
+
+    Either way the vault's uid index is brought up to date for the files
+    validated. With ``changed_since`` only files changed since that git
+    revision are validated, and their uids are still checked against the
+    rest of the vault through that index. ``file_timeout`` and ``timings``
+    are as for ``iter_findings``.
+    """
+    if changed_since is not None:
+        changed = source_deck_names(
+            changed_source_files(
                 source_search_path=source_search_path,
                 source_search_depth=source_search_depth,
+                changed_since=changed_since,
+            ),
+            source_search_path=source_search_path,
+        )
+        file_paths = [
+            path
+            for path, name in changed.items()
+            if deck_names is None or name in deck_names
+        ]
+    else:
+        deck_paths = _deck_file_paths(
+            deck_names,
+            source_search_path=source_search_path,
+            source_search_depth=source_search_depth,
+        )
+        file_paths = [path for paths in deck_paths.values() for path in paths]
+
+    vault_files = None
+    if changed_since is not None:
+        vault_files = search_markdown_files(
+            search_path=source_search_path, search_depth=source_search_depth
+        )
+    return _iter_source_findings(
+        file_paths,
+        source_search_path=source_search_path,
+        jobs=jobs,
+        use_cache=use_cache,
+        vault_files=vault_files,
+        complete=source_search_depth is None,
+        every_deck=(
+            deck_names is None and changed_since is None and source_search_depth is None
+        ),
+        file_timeout=file_timeout,
+        timings=timings,
+    )
+
+
+def _iter_source_findings(
+    file_paths: List[Path],
+    source_search_path: Path,
+    jobs: int,
+    use_cache: bool,
+    vault_files: Optional[List[Path]] = None,
+    complete: bool = False,
+    every_deck: bool = False,
+    file_timeout: Optional[float] = None,
+    timings: Optional[FileTimings] = None,
+) -> Iterator[Finding]:
+    """Validates ``file_paths``, owning the caches for the run. When they are
+    ``every_deck``'s files, the findings cache forgets all other files.
+
+    With ``vault_files`` (every markdown file in the vault; ``complete`` when
+    the search was not depth-limited) the index is first brought up to date
+    for all of them, so their uids count as seen even on a fresh checkout
+    with no index yet. A warm index costs a ``stat`` per file.
+    """
+    store = UidStore.open(source_search_path)
+    cache = FindingsCache.open(source_search_path) if use_cache else None
+    try:
+        if cache is not None and every_deck:
+            cache.prune(file_paths)
+        if vault_files is not None:
+            store.sync(
+                list(dict.fromkeys([*vault_files, *file_paths])),
+                complete=complete,
+                budget=file_timeout,
             )
+        else:
+            store.sync(file_paths, budget=file_timeout)
+        seen_uids = store.collisions(file_paths) if vault_files is not None else None
+        yield from iter_findings(
+            file_paths,
+            jobs=jobs,
+            cache=cache,
+            seen_uids=seen_uids,
+            file_timeout=file_timeout,
+            timings=timings,
         )
+    finally:
+        store.close()
+        if cache is not None:
+            cache.close()
 
-    return validate_files(file_paths)
+
+def changed_source_files(
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    changed_since: str,
+) -> List[Path]:
+    """Returns markdown files changed since the git revision ``changed_since``."""
+    return search_changed_markdown_files(
+        search_path=source_search_path,
+        ref=changed_since,
+        search_depth=source_search_depth,
+    )
+
+
+def changed_source_decks(
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    changed_since: str,
+) -> List[str]:
+    """Returns the names of decks with a source file changed since the git
+    revision ``changed_since``."""
+    changed = changed_source_files(
+        source_search_path=source_search_path,
+        source_search_depth=source_search_depth,
+        changed_since=changed_since,
+    )
+    names = source_deck_names(changed, source_search_path=source_search_path)
+    return sorted(set(names.values()))
+
+
+def source_deck_names(
+    file_paths: List[Path], source_search_path: Path
+) -> Dict[Path, str]:
+    """Maps each deck source file to its deck name; files without a deck key
+    are left out."""
+    decks = source_decks(file_paths, search_path=source_search_path)
+    return {path: name for path, name in decks.items() if name is not None}
+
+
+def _source_markdown_files(
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+    file_paths: Optional[List[Path]],
+) -> List[Path]:
+    """``file_paths`` when given (e.g. only changed files), otherwise every
+    markdown file under the search path."""
+    if file_paths is not None:
+        return file_paths
+    return search_markdown_files(
+        search_path=source_search_path, search_depth=source_search_depth
+    )
 
 
 def stamp_source_files(
     source_search_path: Path,
     source_search_depth: Optional[int],
     dry_run: bool,
+    file_paths: Optional[List[Path]] = None,
 ) -> List[StampResult]:
-    """Stamps missing uids across all markdown files under the search path."""
-    files = search_markdown_files(
-        search_path=source_search_path, search_depth=source_search_depth
-    )
-    return [
-        stamp_file(path=path, search_root=source_search_path, dry_run=dry_run)
-        for path in files
-    ]
+    """Stamps missing uids across all markdown files under the search path
+    (or just ``file_paths``). New uids are checked against the vault's uid
+    index, which is updated with them."""
+    files = _source_markdown_files(source_search_path, source_search_depth, file_paths)
+    store = UidStore.open(source_search_path)
+    try:
+        store.sync(files, complete=file_paths is None and source_search_depth is None)
+        results = [
+            stamp_file(
+                path=path,
+                search_root=source_search_path,
+                dry_run=dry_run,
+                new_uid=store.new_uid,
+            )
+            for path in files
+        ]
+        store.sync(result.file for result in results if result.stamped_lines)
+    finally:
+        store.close()
+    return results
 
 
 def fix_source_files(
     source_search_path: Path,
     source_search_depth: Optional[int],
     dry_run: bool,
+    file_paths: Optional[List[Path]] = None,
 ) -> List[FixResult]:
     """Normalizes draft card blocks across all markdown files under the search
-    path, expanding single-``---``-separated cards and stamping missing uids."""
-    files = search_markdown_files(
-        search_path=source_search_path, search_depth=source_search_depth
-    )
-    return [
-        fix_file(path=path, search_root=source_search_path, dry_run=dry_run)
-        for path in files
-    ]
+    path, expanding single-``---``-separated cards and stamping missing uids
+    (checked against, and added to, the vault's uid index)."""
+    files = _source_markdown_files(source_search_path, source_search_depth, file_paths)
+    store = UidStore.open(source_search_path)
+    try:
+        store.sync(files, complete=file_paths is None and source_search_depth is None)
+        results = [
+            fix_file(
+                path=path,
+                search_root=source_search_path,
+                dry_run=dry_run,
+                new_uid=store.new_uid,
+            )
+            for path in files
+        ]
+        store.sync(result.file for result in results if result.changed)
+    finally:
+        store.close()
+    return results
+
+
+def find_uid(
+    uid: str,
+    source_search_path: Path,
+    source_search_depth: Optional[int],
+) -> List[Tuple[Path, int]]:
+    """Returns every ``(path, line)`` where the card with ``uid`` lives.
+
+    The vault's uid index is synced first, which costs a ``stat`` per file and
+    re-reads only files changed since they were last indexed.
+    """
+    store = UidStore.open(source_search_path)
+    try:
+        store.sync(
+            search_markdown_files(
+                search_path=source_search_path, search_depth=source_search_depth
+            ),
+            complete=source_search_depth is None,
+        )
+        return store.find(uid)
+    finally:
+        store.close()
 
 
 def dirty_source_files(
     source_search_path: Path,
     source_search_depth: Optional[int],
+    file_paths: Optional[List[Path]] = None,
 ) -> List[Path]:
     """Returns markdown source files with uncommitted git changes."""
-    files = search_markdown_files(
-        search_path=source_search_path, search_depth=source_search_depth
-    )
+    files = _source_markdown_files(source_search_path, source_search_depth, file_paths)
     return [path for path in files if file_is_dirty(path)]
 
 
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Tuple
+
+from app.logic.store import NoteStore
+
+# Collection entries in a package, newest first. A "collection.anki21b" is
+# zstd-compressed and written only by Anki's own exporter.
+_COLLECTION_NAMES = ("collection.anki21", "collection.anki2")
+
+FINGERPRINTS_VERSION = 1
+
+
+def note_fingerprint(guid: str, model_id: int, tags: str, fields: str) -> str:
+    """A digest of everything Anki replaces when it imports a note over one
+    with the same guid: its note type, tags (the collection's " a b " form,
+    spacing aside) and joined fields."""
+    key = "\0".join((guid, str(model_id), " ".join(tags.split()), fields))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def store_fingerprints(store: NoteStore) -> Iterator[Tuple[int, str, str]]:
+    """``(row, guid, fingerprint)`` for every note in ``store``."""
+    for row in range(len(store)):
+        guid = store.guids[row]
+        yield row, guid, note_fingerprint(
+            guid,
+            int(store.models[store.model_index[row]].model_id),
+            store.tag_sets[store.tag_set_index[row]],
+            store.fields[row],
+        )
+
+
+def changed_notes(store: NoteStore, baseline: Dict[str, str]) -> NoteStore:
+    """The notes of ``store`` that are new, or whose fingerprint differs from
+    the one ``baseline`` has for their guid."""
+    return store.select(
+        row
+        for row, guid, fingerprint in store_fingerprints(store)
+        if baseline.get(guid) != fingerprint
+    )
+
+
+def diff_fingerprints(
+    old: Dict[str, str], new: Dict[str, str]
+) -> Iterator[Tuple[str, str]]:
+    """``(change, guid)`` for every note added, changed or removed between two
+    builds' fingerprints: ``new``'s notes in order, then removed ones."""
+    for guid, fingerprint in new.items():
+        before = old.get(guid)
+        if before is None:
+            yield "added", guid
+        elif before != fingerprint:
+            yield "changed", guid
+    for guid in old:
+        if guid not in new:
+            yield "removed", guid
+
+
+def read_fingerprints(path: Path) -> Dict[str, str]:
+    """Note fingerprints by guid from an ``.apkg`` package or a fingerprint
+    file (see ``write_fingerprints``). Raises ValueError for anything else."""
+    path = Path(path)
+    if not path.is_file():
+        raise ValueError(f"No package or fingerprint file at {path}")
+    if zipfile.is_zipfile(path):
+        return _package_fingerprints(path)
+    try:
+        data = json.loads(path.read_text())
+        if data["version"] != FINGERPRINTS_VERSION:
+            raise ValueError(f"unsupported version {data['version']}")
+        return dict(data["notes"])
+    except (UnicodeDecodeError, KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"{path} is not a package or fingerprint file: {exc}")
+
+
+def write_fingerprints(path: Path, fingerprints: Iterable[Tuple[str, str]]) -> None:
+    """Writes ``(guid, fingerprint)`` pairs as a fingerprint file."""
+    notes = dict(fingerprints)
+    Path(path).write_text(
+        json.dumps({"version": FINGERPRINTS_VERSION, "notes": notes}, indent=0)
+    )
+
+
+def _package_fingerprints(path: Path) -> Dict[str, str]:
+    with zipfile.ZipFile(path) as package:
+        names = set(package.namelist())
+        name = next((name for name in _COLLECTION_NAMES if name in names), None)
+        if name is None:
+            raise ValueError(f"{path} has no collection this can read")
+        # sqlite3 opens files, not bytes; the collection is spooled to disk.
+        with tempfile.TemporaryDirectory() as tmp:
+            collection = Path(package.extract(name, tmp))
+            conn = sqlite3.connect(collection)
+            try:
+                return {
+                    guid: note_fingerprint(guid, mid, tags, flds)
+                    for guid, mid, tags, flds in conn.execute(
+                        "SELECT guid, mid, tags, flds FROM notes"
+                    )
+                }
+            except sqlite3.DatabaseError as exc:
+                raise ValueError(f"{path}: unreadable collection: {exc}")
+            finally:
+                conn.close()
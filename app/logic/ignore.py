@@ -0,0 +1,147 @@
+import logging
+import re
+from pathlib import Path
+from typing import List, Optional, Pattern, Sequence, Tuple
+
+from app.config import settings
+
+
+class IgnoreRules:
+    """The gitignore-style patterns in effect for one directory of a walk.
+
+    Each directory's ignore files add to its parent's rules, so a walk reads
+    every ignore file once and matches an entry against one flat list. As in
+    git, the last matching pattern decides, ``!`` re-includes, a trailing
+    ``/`` matches directories only, and a pattern with a ``/`` before its end
+    is anchored to the directory of the file that declares it. Nothing below
+    an ignored directory is looked at, so it cannot be re-included.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        rules: Tuple[Tuple[str, Pattern[str], bool, bool], ...] = (),
+    ) -> None:
+        self.names = tuple(names)
+        # (declaring directory relative to the walk root, pattern, negated,
+        # directories only), in file order
+        self.rules = rules
+
+    @classmethod
+    def for_walk(cls, gitignore: Optional[bool] = None) -> "IgnoreRules":
+        """Empty rules reading ``.ankcignore`` files, and ``.gitignore`` files
+        too when ``gitignore`` (default: the GITIGNORE setting) is set."""
+        if gitignore is None:
+            gitignore = settings.GITIGNORE
+        names = [".gitignore"] if gitignore else []
+        return cls(names + [settings.IGNORE_FILE])
+
+    def enter(self, directory: Path, relative: str) -> "IgnoreRules":
+        """The rules for ``directory``, ``relative`` to the walk root ("" for
+        the root): these plus any ignore files it holds."""
+        added = []
+        for name in self.names:
+            try:
+                text = (directory / name).read_text(encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            except (OSError, UnicodeDecodeError) as exc:
+                logging.warning("Could not read %s: %s", directory / name, exc)
+                continue
+            added.extend(
+                (relative, *rule)
+                for rule in map(_parse_line, text.splitlines())
+                if rule is not None
+            )
+        if not added:
+            return self
+        return IgnoreRules(self.names, self.rules + tuple(added))
+
+    def ignored(self, relative: str, is_dir: bool) -> bool:
+        """Whether the entry at ``relative`` (to the walk root, "/"-separated)
+        is ignored."""
+        for base, pattern, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not relative.startswith(base + "/"):
+                    continue
+                path = relative[len(base) + 1 :]
+            else:
+                path = relative
+            if pattern.match(path):
+                return not negated
+        return False
+
+    def ignored_path(self, root: Path, relative: Path) -> bool:
+        """Whether a file at ``relative`` to ``root``, or any directory above
+        it, is ignored, reading the ignore files along the way."""
+        rules = self.enter(root, "")
+        parts = relative.parts
+        for depth in range(1, len(parts)):
+            prefix = "/".join(parts[:depth])
+            if rules.ignored(prefix, is_dir=True):
+                return True
+            rules = rules.enter(root / prefix, prefix)
+        return rules.ignored("/".join(parts), is_dir=False)
+
+
+def _parse_line(line: str) -> Optional[Tuple[Pattern[str], bool, bool]]:
+    """A pattern line as ``(regex, negated, directories only)``, or None for
+    blank lines and comments."""
+    if not line.startswith("\\ "):
+        line = re.sub(r"(?<!\\) +$", "", line)
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated or line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    line = line.lstrip("/")
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(prefix + _translate(line) + r"\Z", re.DOTALL), negated, dir_only
+
+
+def _translate(pattern: str) -> str:
+    """A gitignore glob as a regex over "/"-separated paths."""
+    out: List[str] = []
+    i, n = 0, len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif (
+            pattern.startswith("**", i)
+            and i + 2 == n
+            and (i == 0 or pattern[i - 1] == "/")
+        ):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 2 if pattern.startswith("[!", i) else i + 1)
+            if end == -1:
+                out.append(re.escape("["))
+                i += 1
+                continue
+            body = pattern[i + 1 : end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append("[" + body.replace("[", "\\[") + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
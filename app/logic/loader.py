@@ -0,0 +1,54 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from app.config import settings
+
+T = TypeVar("T")
+
+
+def prefetch(
+    paths: Iterable[Path],
+    load: Callable[[Path], T],
+    concurrency: Optional[int] = None,
+    window: Optional[int] = None,
+) -> Iterator[Tuple[Path, T]]:
+    """Yields ``(path, load(path))`` for each path, in input order, while
+    loading the next paths ahead of the consumer on a thread pool.
+
+    On a filesystem where opening a file is slow (e.g. NFS) this overlaps
+    that latency with the consumer's work. At most ``window`` results are
+    loaded but not yet consumed, so memory stays bounded however many paths
+    there are. ``concurrency`` and ``window`` default to the
+    ``READ_CONCURRENCY`` and ``READ_WINDOW`` settings; a concurrency of 1
+    loads serially on the calling thread.
+
+    An exception raised by ``load`` surfaces when its path is reached.
+    """
+    if concurrency is None:
+        concurrency = settings.READ_CONCURRENCY
+    if window is None:
+        window = settings.READ_WINDOW
+
+    if concurrency <= 1:
+        for path in paths:
+            yield path, load(path)
+        return
+
+    window = max(window, concurrency)
+    pending: Deque[Tuple[Path, Future]] = deque()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for path in paths:
+            if len(pending) == window:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+            pending.append((path, pool.submit(load, path)))
+
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+    finally:
+        # A consumer that stops early leaves loads queued.
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.logic.loader import prefetch
+from app.logic.utils import connect_cache, read_markdown_meta, vault_key
+
+
+class ManifestEntry(NamedTuple):
+    """What deck discovery needs from a file's frontmatter."""
+
+    deck: Optional[Any]  # the 'deck' value; None when the file is not a deck
+
+
+class DeckManifest:
+    """Deck membership for every markdown file in the vault, keyed by path
+    and valid for the size and mtime the file had when it was read.
+
+    A warm lookup costs a ``stat`` per file and reads only files that changed,
+    instead of parsing the YAML frontmatter of every file.
+    """
+
+    FILE_NAME = "manifest.sqlite"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS files ("
+        " path TEXT PRIMARY KEY,"
+        " size INTEGER NOT NULL,"
+        " mtime_ns INTEGER NOT NULL,"
+        " entry TEXT NOT NULL)"
+    )
+
+    def __init__(self, conn: sqlite3.Connection, search_path: Path) -> None:
+        self._root = Path(search_path)
+        self._conn = conn
+
+    @classmethod
+    def open(cls, search_path: Path) -> "DeckManifest":
+        """Opens the manifest for the vault at ``search_path`` (in memory
+        when the vault cannot hold it, see ``connect_cache``)."""
+        return cls(connect_cache(search_path, cls.FILE_NAME, cls.SCHEMA), search_path)
+
+    def close(self) -> None:
+        """Commits and closes the manifest."""
+        self._conn.commit()
+        self._conn.close()
+
+    def entries(
+        self, paths: Iterable[Path], complete: bool = False
+    ) -> Dict[Path, ManifestEntry]:
+        """The manifest entry of each of ``paths``, reading the frontmatter of
+        only those that changed since they were recorded.
+
+        With ``complete``, ``paths`` is every markdown file in the vault and
+        anything else in the manifest is dropped. A file that can no longer be
+        ``stat``-ed (deleted since the search) is left out.
+        """
+        entries: Dict[Path, ManifestEntry] = {}
+        stale: List[Tuple[Path, str, os.stat_result]] = []
+        for path in paths:
+            key = vault_key(path, self._root)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            row = self._conn.execute(
+                "SELECT entry FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (key, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+            entry = _decode(row[0]) if row is not None else None
+            if entry is not None:
+                entries[path] = entry
+            else:
+                entries[path] = None
+                stale.append((path, key, stat))
+
+        for (path, key, stat), (_, meta) in zip(
+            stale, prefetch([path for path, _, _ in stale], read_markdown_meta)
+        ):
+            entry = ManifestEntry(meta.get(settings.DECK_TITLE_KEY))
+            entries[path] = entry
+            self._record(key, stat, entry)
+
+        if complete:
+            keys = {vault_key(path, self._root) for path in entries}
+            gone = [
+                (key,)
+                for (key,) in self._conn.execute("SELECT path FROM files")
+                if key not in keys
+            ]
+            self._conn.executemany("DELETE FROM files WHERE path = ?", gone)
+        self._conn.commit()
+        return entries
+
+    def _record(self, key: str, stat: os.stat_result, entry: ManifestEntry) -> None:
+        """Stores ``entry`` unless its frontmatter values do not survive JSON
+        unchanged (e.g. a YAML date), in which case the file is simply read
+        again next time."""
+        try:
+            encoded = json.dumps(entry)
+        except (TypeError, ValueError):
+            return
+        if _decode(encoded) != entry:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+            (key, stat.st_size, stat.st_mtime_ns, encoded),
+        )
+
+
+def _decode(encoded: str) -> Optional[ManifestEntry]:
+    """The entry stored as ``encoded``, or None when it was stored with
+    other fields (by an older ankc) and the file must be read again."""
+    try:
+        return ManifestEntry(*json.loads(encoded))
+    except TypeError:
+        return None
+
+
+def source_decks(
+    paths: List[Path], search_path: Path, complete: bool = False
+) -> Dict[Path, Optional[Any]]:
+    """Maps each of ``paths`` to its deck name (None for a non-deck file),
+    through the manifest of the vault at ``search_path``.
+
+    The manifest only saves reads: when it fails mid-run (a lock on a network
+    vault, say) every file's frontmatter is read instead.
+    """
+    manifest = DeckManifest.open(search_path)
+    try:
+        entries = manifest.entries(paths, complete=complete)
+    except sqlite3.OperationalError as exc:
+        logging.info("Deck manifest unavailable, reading every file: %s", exc)
+        entries = {
+            path: ManifestEntry(meta.get(settings.DECK_TITLE_KEY))
+            for path, meta in prefetch(paths, read_markdown_meta)
+        }
+    finally:
+        try:
+            manifest.close()
+        except sqlite3.Error:
+            pass  # nothing worth keeping was written
+    return {path: entry.deck for path, entry in entries.items()}
@@ -0,0 +1,451 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+import zipfile
+from enum import Enum
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from genanki.apkg_col import APKG_COL
+from genanki.apkg_schema import APKG_SCHEMA
+from genanki.deck import Deck as GenAnkiDeck
+
+from app.logic.store import NoteStore
+
+COLLECTION_NAME = "collection.anki2"
+MEDIA_MAP_NAME = "media"
+
+# Formats that are already compressed: deflating them again burns CPU for no
+# size gain, so they go into the package stored as-is.
+STORED_EXTENSIONS = frozenset(
+    {
+        ".png",
+        ".jpg",
+        ".jpeg",
+        ".gif",
+        ".webp",
+        ".mp3",
+        ".m4a",
+        ".ogg",
+        ".opus",
+        ".mp4",
+        ".webm",
+    }
+)
+
+
+class Compression(str, Enum):
+    """How package entries are compressed (``ankc build --compression``).
+
+    ``store`` writes every entry uncompressed. The deflate strategies keep the
+    per-extension defaults (already-compressed media stored, everything else
+    deflated) and differ only in deflate level.
+    """
+
+    STORE = "store"
+    DEFLATE = "deflate"
+    FAST = "fast"
+    BEST = "best"
+
+
+# zlib levels per strategy; None means zlib's own default (6).
+_DEFLATE_LEVELS = {
+    Compression.DEFLATE: None,
+    Compression.FAST: 1,
+    Compression.BEST: 9,
+}
+
+# Media is copied into the zip through a buffer of this size, so memory stays
+# flat no matter how large a single file is.
+COPY_BUFFER_SIZE = 1 << 20
+
+_NOTE_INSERT = "INSERT INTO notes VALUES(?,?,?,?,?,?,?,?,?,?,?)"
+_CARD_INSERT = "INSERT INTO cards VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+
+
+def write_package(
+    path: Path,
+    decks: List[Union[NoteStore, GenAnkiDeck]],
+    media_files: List[Path],
+    timestamp: Optional[float] = None,
+    compression: Compression = Compression.DEFLATE,
+    previous: Optional[Path] = None,
+) -> None:
+    """Writes decks (note stores, or genanki decks) and their media to an
+    ``.apkg`` file.
+
+    A drop-in for ``genanki.Package.write_to_file`` that produces the same
+    collection rows, but builds the collection in memory rather than a temp
+    file and streams media into the zip instead of reading it whole.
+
+    When ``previous`` names an earlier package (usually ``path`` itself),
+    media entries whose content and compression are unchanged are copied from
+    it raw, skipping decompression and recompression. The package is written to a
+    temp file and renamed into place, so ``previous`` may be ``path``.
+    """
+    if timestamp is None:
+        timestamp = time.time()
+
+    collection = build_collection(decks, timestamp)
+    compress_type, compress_level = compression_for(Path(COLLECTION_NAME), compression)
+
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".ankc-tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    old = _PreviousPackage.open(previous) if previous is not None else None
+    try:
+        with zipfile.ZipFile(tmp_path, "w") as package:
+            package.writestr(
+                COLLECTION_NAME,
+                collection,
+                compress_type=compress_type,
+                compresslevel=compress_level,
+            )
+
+            media_map = {
+                str(index): Path(media).name for index, media in enumerate(media_files)
+            }
+            package.writestr(MEDIA_MAP_NAME, json.dumps(media_map))
+
+            for index, media in enumerate(media_files):
+                media = Path(media)
+                entry = None
+                if old is not None and _can_append_raw(package):
+                    entry = old.reusable(media, compression)
+                if entry is not None:
+                    old.copy_raw(entry, package, str(index))
+                else:
+                    _stream_media(package, media, str(index), compression)
+
+        # mkstemp creates the file 0600; give the package the mode a plain
+        # open() would, or keep the one it already has.
+        os.chmod(tmp_path, _package_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if old is not None:
+            old.close()
+
+
+def _package_mode(path: Path) -> int:
+    """Returns the permission bits for writing ``path``: its current ones if
+    it exists, else the default for a new file under the process umask."""
+    try:
+        return path.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def build_collection(
+    decks: List[Union[NoteStore, GenAnkiDeck]], timestamp: float
+) -> bytes:
+    """Returns the serialized ``collection.anki2`` SQLite database for decks.
+
+    Ids are drawn from the same millisecond counter genanki uses (note id, then
+    its card ids, note by note), so a given timestamp yields identical rows.
+    Rows are generated straight from each deck's columns into ``executemany``
+    rather than collected first.
+    """
+    stores = [_as_store(deck) for deck in decks]
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.executescript(APKG_SCHEMA)
+        conn.executescript(APKG_COL)
+
+        decks_json, models_json = conn.execute(
+            "SELECT decks, models FROM col"
+        ).fetchone()
+        deck_entries = json.loads(decks_json)
+        model_entries = json.loads(models_json)
+
+        for store in stores:
+            deck_entries[str(store.deck_id)] = store.to_json()
+            for model in store.models:
+                model_entries[model.model_id] = model.to_json(timestamp, store.deck_id)
+
+        # One transaction for every row; the context manager commits.
+        with conn:
+            conn.execute(
+                "UPDATE col SET decks = ?, models = ?",
+                (json.dumps(deck_entries), json.dumps(model_entries)),
+            )
+            conn.executemany(_NOTE_INSERT, _note_rows(stores, timestamp))
+            conn.executemany(_CARD_INSERT, _card_rows(stores, timestamp))
+
+        return conn.serialize()
+    finally:
+        conn.close()
+
+
+def _as_store(deck: Union[NoteStore, GenAnkiDeck]) -> NoteStore:
+    if isinstance(deck, NoteStore):
+        return deck
+    return NoteStore.from_genanki(deck)
+
+
+def _note_ids(
+    stores: List[NoteStore], timestamp: float
+) -> Iterator[Tuple[NoteStore, int, int]]:
+    """``(store, row, note_id)`` for every note. A note takes the next id on
+    the counter and its cards the ones after it."""
+    next_id = int(timestamp * 1000)
+    for store in stores:
+        offsets = store.card_offsets
+        for row in range(len(store)):
+            yield store, row, next_id
+            next_id += 1 + offsets[row + 1] - offsets[row]
+
+
+def _note_rows(stores: List[NoteStore], timestamp: float) -> Iterator[tuple]:
+    """The ``notes`` table rows for decks."""
+    mod = int(timestamp)
+    for store, row, note_id in _note_ids(stores, timestamp):
+        yield (
+            note_id,
+            store.guids[row],
+            store.models[store.model_index[row]].model_id,
+            mod,
+            -1,  # usn
+            store.tag_sets[store.tag_set_index[row]],
+            store.fields[row],
+            store.sort_field(row),
+            0,  # csum
+            0,  # flags
+            "",  # data
+        )
+
+
+def _card_rows(stores: List[NoteStore], timestamp: float) -> Iterator[tuple]:
+    """The ``cards`` table rows for decks."""
+    mod = int(timestamp)
+    for store, row, note_id in _note_ids(stores, timestamp):
+        due = store.due[row]
+        for card_id, (ord_, suspended) in enumerate(store.cards(row), note_id + 1):
+            yield (
+                card_id,
+                note_id,
+                store.deck_id,
+                ord_,
+                mod,
+                -1,  # usn
+                0,  # type
+                -1 if suspended else 0,  # queue
+                due,
+                0,  # ivl
+                0,  # factor
+                0,  # reps
+                0,  # lapses
+                0,  # left
+                0,  # odue
+                0,  # odid
+                0,  # flags
+                "",  # data
+            )
+
+
+def compression_for(
+    path: Path, compression: Compression = Compression.DEFLATE
+) -> Tuple[int, Optional[int]]:
+    """Zip ``(compress_type, compresslevel)`` for a package entry, chosen by
+    strategy and extension."""
+    if compression is Compression.STORE or path.suffix.lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, _DEFLATE_LEVELS[compression]
+
+
+def _stream_media(
+    package: zipfile.ZipFile, media: Path, arcname: str, compression: Compression
+) -> None:
+    """Copies one media file into the package through a bounded buffer."""
+    info = zipfile.ZipInfo.from_file(media, arcname)
+    info.compress_type, level = compression_for(media, compression)
+    _set_compress_level(info, level)
+
+    digest = hashlib.sha256()
+    with media.open("rb") as source, package.open(info, "w") as target:
+        while chunk := source.read(COPY_BUFFER_SIZE):
+            digest.update(chunk)
+            target.write(chunk)
+    # Only the central directory, written on close(), holds the comment.
+    info.comment = _entry_comment(level, digest.hexdigest())
+
+
+def _set_compress_level(info: zipfile.ZipInfo, level: Optional[int]) -> None:
+    """Sets the deflate level ``ZipFile.open(info, "w")`` compresses with.
+
+    open() takes the level from the ZipInfo only: a public attribute from
+    Python 3.13, and a private one (kept there as an alias) before.
+    """
+    if sys.version_info >= (3, 13):
+        info.compress_level = level
+    else:
+        info._compresslevel = level
+
+
+def _entry_comment(level: Optional[int], digest: str) -> bytes:
+    """The entry comment recording a media entry's deflate level and the
+    SHA-256 of its content, neither of which the zip format keeps, so reuse
+    can tell a level change or an edit apart."""
+    level_name = "default" if level is None else level
+    return f"ankc:level={level_name};sha256={digest}".encode()
+
+
+def _zip_date_time(path: Path) -> Tuple[int, ...]:
+    """A file's mtime as a zip entry records it (DOS time, 2s resolution)."""
+    date_time = zipfile.ZipInfo.from_file(path).date_time
+    return (*date_time[:5], date_time[5] // 2 * 2)
+
+
+def _file_sha256(path: Path) -> str:
+    """SHA-256 of a file's content, read through a bounded buffer."""
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        while chunk := handle.read(COPY_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# zipfile has no public API for appending an already-compressed entry, so
+# _append_raw writes one through these internals. They are unchanged across
+# the Python versions CI runs; if one goes missing, media is recompressed
+# instead (reuse is only an optimization).
+_RAW_ZIPFILE_ATTRS = ("fp", "start_dir", "filelist", "NameToInfo", "_didModify")
+
+
+def _can_append_raw(package: zipfile.ZipFile) -> bool:
+    """Whether ``_append_raw`` can write to ``package`` on this Python."""
+    return (
+        all(hasattr(package, name) for name in _RAW_ZIPFILE_ATTRS)
+        and hasattr(zipfile.ZipInfo, "FileHeader")
+        and package.fp is not None
+    )
+
+
+def _append_raw(
+    package: zipfile.ZipFile, info: zipfile.ZipInfo, chunks: Iterator[bytes]
+) -> None:
+    """Appends an entry whose compressed bytes are ``chunks`` to ``package``.
+
+    ``info`` carries the entry's final CRC and sizes. This writes the local
+    header and data and registers the entry the way ``ZipFile.open(..., "w")``
+    does, leaving ``close()`` to write the central directory.
+    """
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+    package.fp.seek(package.start_dir)
+    info.header_offset = package.fp.tell()
+    package.fp.write(info.FileHeader(zip64))
+    for chunk in chunks:
+        package.fp.write(chunk)
+    package.start_dir = package.fp.tell()
+    package.filelist.append(info)
+    package.NameToInfo[info.filename] = info
+    # close() only writes the central directory of a modified archive. Mode
+    # "w" starts out modified, but an archive opened to append does not, and
+    # writestr/open() are what would otherwise mark it.
+    package._didModify = True
+
+
+class _PreviousPackage:
+    """An earlier ``.apkg`` whose media entries can be copied without
+    recompressing them."""
+
+    def __init__(self, archive: zipfile.ZipFile, raw: BinaryIO) -> None:
+        self._archive = archive
+        self._raw = raw
+        # basename -> zip entry, via the package's index -> basename media map
+        media_map = json.loads(archive.read(MEDIA_MAP_NAME))
+        self._entries: Dict[str, zipfile.ZipInfo] = {
+            name: archive.getinfo(index) for index, name in media_map.items()
+        }
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["_PreviousPackage"]:
+        """Opens ``path``, or returns None when there is no usable package
+        there (a first build, or a file that isn't an ankc package)."""
+        if not Path(path).is_file():
+            return None
+        try:
+            archive = zipfile.ZipFile(path)
+        except (OSError, zipfile.BadZipFile) as exc:
+            logging.warning("Could not reuse media from %s: %s", path, exc)
+            return None
+        raw = open(path, "rb")
+        try:
+            return cls(archive, raw)
+        except (KeyError, ValueError) as exc:
+            logging.warning("Could not reuse media from %s: %s", path, exc)
+            raw.close()
+            archive.close()
+            return None
+
+    def close(self) -> None:
+        self._raw.close()
+        self._archive.close()
+
+    def reusable(
+        self, media: Path, compression: Compression
+    ) -> Optional[zipfile.ZipInfo]:
+        """The previous entry for ``media`` if it can be copied as-is.
+
+        A candidate must match on name, size, mtime and compression type,
+        all of which the entry already records; only then is the file read
+        and its SHA-256 and deflate level compared with those in the entry's
+        comment, so an edit that keeps the size and mtime is still caught.
+        """
+        entry = self._entries.get(media.name)
+        if entry is None:
+            return None
+        compress_type, level = compression_for(media, compression)
+        stat = media.stat()
+        if (
+            entry.compress_type != compress_type
+            or entry.file_size != stat.st_size
+            or entry.date_time != _zip_date_time(media)
+        ):
+            return None
+        if entry.comment != _entry_comment(level, _file_sha256(media)):
+            return None
+        return entry
+
+    def copy_raw(
+        self, entry: zipfile.ZipInfo, package: zipfile.ZipFile, arcname: str
+    ) -> None:
+        """Appends ``entry``'s compressed bytes to ``package`` as ``arcname``."""
+        info = zipfile.ZipInfo(arcname, entry.date_time)
+        info.compress_type = entry.compress_type
+        info.external_attr = entry.external_attr
+        info.comment = entry.comment
+        info.CRC = entry.CRC
+        info.compress_size = entry.compress_size
+        info.file_size = entry.file_size
+
+        # Skip the old local header: fixed part, then name and extra field.
+        self._raw.seek(entry.header_offset)
+        header = struct.unpack(
+            zipfile.structFileHeader, self._raw.read(zipfile.sizeFileHeader)
+        )
+        if header[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad local header for {entry.filename}")
+        self._raw.seek(header[-2] + header[-1], os.SEEK_CUR)
+        _append_raw(package, info, self._read(entry))
+
+    def _read(self, entry: zipfile.ZipInfo) -> Iterator[bytes]:
+        """Yields the ``compress_size`` bytes at the current position."""
+        remaining = entry.compress_size
+        while remaining:
+            chunk = self._raw.read(min(remaining, COPY_BUFFER_SIZE))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated entry {entry.filename}")
+            yield chunk
+            remaining -= len(chunk)
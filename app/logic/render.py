@@ -0,0 +1,141 @@
+import html
+import re
+import threading
+from enum import Enum
+from typing import Callable, Dict, Optional
+
+from markdown import Markdown
+from markdown_it import MarkdownIt
+
+from app.config import settings
+
+
+class Renderer(str, Enum):
+    """Markdown backends for card fields (``ankc build --renderer``).
+
+    ``markdown`` is Python-Markdown, the reference. ``markdown-it`` is
+    markdown-it-py with the same table, fenced code and math syntax, checked
+    against the reference by the conformance tests (tests/test_render.py).
+    """
+
+    MARKDOWN = "markdown"
+    MARKDOWN_IT = "markdown-it"
+
+
+def render_markdown(text: str, renderer: Optional[str] = None) -> str:
+    """Renders one markdown field to HTML with ``renderer`` (by default
+    ``settings.RENDERER``)."""
+    return get_renderer(renderer)(text)
+
+
+def get_renderer(renderer: Optional[str] = None) -> Callable[[str], str]:
+    """The render function for a backend. Raises ValueError for an unknown
+    one.
+
+    Each thread builds a backend's parser once and reuses it: setting up a
+    Python-Markdown instance and its extensions costs far more than
+    rendering a short field with it.
+    """
+    if renderer is None:
+        renderer = settings.RENDERER
+    try:
+        renderer = Renderer(renderer)
+    except ValueError:
+        valid = ", ".join(r.value for r in Renderer)
+        raise ValueError(f"Unknown renderer '{renderer}'. Valid renderers: {valid}")
+
+    cache: Dict[Renderer, Callable[[str], str]] = _local.__dict__.setdefault(
+        "renderers", {}
+    )
+    render = cache.get(renderer)
+    if render is None:
+        render = cache[renderer] = _FACTORIES[renderer]()
+    return render
+
+
+_local = threading.local()
+
+
+def _python_markdown() -> Callable[[str], str]:
+    md = Markdown(
+        extensions=["fenced_code", "tables", "pymdownx.arithmatex"],
+        # generic mode emits \(...\) / \[...\] (data only, no inline
+        # script), which Anki's built-in MathJax renders.
+        extension_configs={"pymdownx.arithmatex": {"generic": True}},
+    )
+    return lambda text: md.reset().convert(text)
+
+
+# pymdownx.arithmatex's generic-mode math, restated for markdown-it. Inline:
+# "$...$" with no whitespace just inside either dollar (so "$5 and $10" is
+# not math), or "\(...\)". Escaped delimiters need no lookbehind here since
+# markdown-it's escape rule consumes them first.
+_INLINE_MATH_RE = re.compile(
+    r"\$(?!\s)((?:\\.|[^\\$])+?)(?<!\s)\$|\\\(((?:\\[^)]|[^\\])+?)\\\)"
+)
+# Block: a whole paragraph that is "$$...$$", "\[...\]" or a \begin{env}.
+_BLOCK_MATH_RE = re.compile(
+    r"(?s)^(?:\$\$((?:\\.|[^\\])+?)\$\$"
+    r"|\\\[((?:\\[^\]]|[^\\])+?)\\\]"
+    r"|(\\begin\{(?P<env>[a-z]+\*?)\}(?:\\.|[^\\])+?\\end\{(?P=env)\}))[ ]*$"
+)
+
+
+def _math_inline(state, silent: bool) -> bool:
+    if state.src[state.pos] not in "$\\":
+        return False
+    match = _INLINE_MATH_RE.match(state.src, state.pos)
+    if match is None:
+        return False
+    if not silent:
+        token = state.push("math_inline", "span", 0)
+        token.content = match.group(1) if match.group(1) is not None else match[2]
+    state.pos = match.end()
+    return True
+
+
+def _math_block(state, start_line: int, end_line: int, silent: bool) -> bool:
+    if state.is_code_block(start_line):
+        return False
+    next_line = start_line + 1
+    while next_line < end_line and not state.isEmpty(next_line):
+        next_line += 1
+    text = state.getLines(start_line, next_line, state.blkIndent, False).lstrip()
+    match = _BLOCK_MATH_RE.match(text)
+    if match is None:
+        return False
+    if not silent:
+        token = state.push("math_block", "div", 0)
+        token.content = next(group for group in match.groups()[:3] if group)
+        token.map = [start_line, next_line]
+    state.line = next_line
+    return True
+
+
+def _markdown_it() -> Callable[[str], str]:
+    md = MarkdownIt("commonmark").enable("table")
+    md.inline.ruler.before("escape", "math_inline", _math_inline)
+    md.block.ruler.before("paragraph", "math_block", _math_block)
+    md.add_render_rule(
+        "math_inline",
+        lambda self, tokens, idx, options, env: (
+            '<span class="arithmatex">\\('
+            + html.escape(tokens[idx].content, quote=False)
+            + "\\)</span>"
+        ),
+    )
+    md.add_render_rule(
+        "math_block",
+        lambda self, tokens, idx, options, env: (
+            '<div class="arithmatex">\\['
+            + html.escape(tokens[idx].content, quote=False)
+            + "\\]</div>\n"
+        ),
+    )
+    return lambda text: md.render(text).rstrip("\n")
+
+
+_FACTORIES: Dict[Renderer, Callable[[], Callable[[str], str]]] = {
+    Renderer.MARKDOWN: _python_markdown,
+    Renderer.MARKDOWN_IT: _markdown_it,
+}
@@ -0,0 +1,171 @@
+import heapq
+import json
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.logic.validation import scan_uids
+
+# Compiling a card costs about as much as rendering this many source bytes
+# (fitted on decks of many small cards against decks of few large ones).
+CARD_BYTES = 650
+
+SHARD_MANIFEST_VERSION = 1
+
+_SHARD_RE = re.compile(r"(\d+)/(\d+)")
+
+
+@dataclass(frozen=True)
+class DeckCost:
+    """A deck's estimated compile cost, from its source files alone."""
+
+    name: str
+    bytes: int
+    cards: int
+
+    @property
+    def cost(self) -> int:
+        return self.bytes + CARD_BYTES * self.cards
+
+
+def estimate_costs(
+    deck_paths: Dict[str, List[Path]], card_counts: Optional[Dict[Path, int]] = None
+) -> List[DeckCost]:
+    """Each deck's source bytes, from ``stat``, and card count (its uids).
+
+    Card counts come from ``card_counts`` (see ``UidStore.card_counts``)
+    where it has the file; only the files it lacks are read, and counted the
+    way the uid index counts them, so the estimate does not depend on how warm
+    the index is.
+    """
+    costs = []
+    for name, paths in deck_paths.items():
+        size = cards = 0
+        for path in paths:
+            try:
+                size += os.stat(path).st_size
+                if card_counts is not None and path in card_counts:
+                    cards += card_counts[path]
+                else:
+                    cards += len(scan_uids(path))
+            except OSError:
+                continue  # reported when the deck is read
+        costs.append(DeckCost(name=name, bytes=size, cards=cards))
+    return costs
+
+
+def stat_cost(name: str, paths: Iterable[Path], cards: int) -> DeckCost:
+    """A deck's cost when its cards are already counted (its chunks split),
+    taking file sizes from ``stat`` rather than reading the files again."""
+    size = 0
+    for path in paths:
+        try:
+            size += os.stat(path).st_size
+        except OSError:
+            continue  # reported when the deck is read
+    return DeckCost(name=name, bytes=size, cards=cards)
+
+
+def largest_first(costs: Iterable[DeckCost]) -> List[DeckCost]:
+    """Decks costliest first, so parallel workers do not end on one big deck
+    left to run alone. Ties go by name, so the order is deterministic."""
+    return sorted(costs, key=lambda deck: (-deck.cost, deck.name))
+
+
+def assign_shards(costs: Iterable[DeckCost], shards: int) -> List[List[str]]:
+    """Splits decks into ``shards`` groups of about equal cost: each deck,
+    costliest first, goes to the cheapest shard so far (the lowest numbered
+    on a tie). The same decks always split the same way."""
+    loads = [(0, index) for index in range(shards)]
+    groups: List[List[str]] = [[] for _ in range(shards)]
+    for deck in largest_first(costs):
+        load, index = heapq.heappop(loads)
+        groups[index].append(deck.name)
+        heapq.heappush(loads, (load + deck.cost, index))
+    return groups
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """``"i/N"`` as ``(i, N)``, numbered from 1. Raises ValueError otherwise."""
+    match = _SHARD_RE.fullmatch(text.strip())
+    if match is None or not 1 <= int(match[1]) <= int(match[2]):
+        raise ValueError(f"Not a shard: '{text}'. Use i/N, such as 1/4.")
+    return int(match[1]), int(match[2])
+
+
+def shard_manifest_name(shard: int, shards: int) -> str:
+    return f"shard-{shard}-of-{shards}.json"
+
+
+def write_shard_manifest(
+    path: Path, shard: int, shards: int, decks: Dict[str, dict]
+) -> None:
+    """Writes the manifest of the packages one shard built: each deck's
+    package file name, note and card counts."""
+    Path(path).write_text(
+        json.dumps(
+            {
+                "version": SHARD_MANIFEST_VERSION,
+                "shard": shard,
+                "shards": shards,
+                "decks": dict(sorted(decks.items())),
+            },
+            indent=2,
+        )
+    )
+
+
+def merge_manifests(paths: Iterable[Path]) -> dict:
+    """Combines the manifests of every shard of one build into one listing
+    of all its decks. Raises ValueError when a manifest is unreadable, the
+    manifests are of different builds, a shard is missing or repeated, or two
+    shards built the same deck."""
+    manifests = [_read_manifest(Path(path)) for path in paths]
+    if not manifests:
+        raise ValueError("No shard manifests given")
+
+    counts = {manifest["shards"] for manifest in manifests}
+    if len(counts) != 1:
+        raise ValueError(f"Manifests are from different shard counts: {sorted(counts)}")
+    (shards,) = counts
+
+    given = sorted(manifest["shard"] for manifest in manifests)
+    repeated = sorted({shard for shard in given if given.count(shard) > 1})
+    if repeated:
+        raise ValueError(f"Shard(s) given more than once: {repeated}")
+    missing = sorted(set(range(1, shards + 1)) - set(given))
+    if missing:
+        raise ValueError(f"Missing shard(s) {missing} of {shards}")
+
+    decks: Dict[str, dict] = {}
+    owners: Dict[str, int] = {}
+    for manifest in manifests:
+        for name, deck in manifest["decks"].items():
+            if name in owners:
+                raise ValueError(
+                    f"Deck {name} was built by shards {owners[name]} "
+                    f"and {manifest['shard']}"
+                )
+            owners[name] = manifest["shard"]
+            decks[name] = deck
+
+    return {
+        "version": SHARD_MANIFEST_VERSION,
+        "shards": shards,
+        "decks": dict(sorted(decks.items())),
+    }
+
+
+def _read_manifest(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text())
+        if data["version"] != SHARD_MANIFEST_VERSION:
+            raise ValueError(f"unsupported version {data['version']}")
+        shard, shards = int(data["shard"]), int(data["shards"])
+        if not 1 <= shard <= shards:
+            raise ValueError(f"shard {shard} of {shards}")
+        return {"shard": shard, "shards": shards, "decks": dict(data["decks"])}
+    except (OSError, UnicodeDecodeError, KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"{path} is not a shard manifest: {exc}")
@@ -1,15 +1,25 @@
+import html
 import re
-from dataclasses import dataclass
+import sys
+import time
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from itertools import chain, groupby
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import unquote
 
-from genanki.deck import Deck as GenAnkiDeck
 from genanki.model import Model as GenAnkiModel
-from genanki.note import Note as GenAnkiNote
-from genanki.package import Package as GenAnkiPackage
 
 from app.config import settings
+from app.logic.fingerprints import changed_notes
+from app.logic.loader import prefetch
+from app.logic.manifest import source_decks
+from app.logic.packaging import Compression, write_package
+from app.logic.store import NoteStore
+from app.logic.timing import BudgetExceeded, FileTimings, time_budget
 from app.logic.utils import (
+    MappedFile,
     clean_str_for_filename,
     convert_md_to_html,
     generate_integer_hash,
@@ -28,36 +38,142 @@ TYPE_FOOTNOTE = rf"(?:\[\^{settings.TYPE_KEY}\]: *.+?\n+)"
 NOTE_BODY = r"[\s\S]+?"
 
 
+_META_EXP = rf"((?:{GUID_FOOTNOTE}|{TAG_FOOTNOTE}|{TYPE_FOOTNOTE})*)"
+_NOTE_EXP = rf"(?:---\n\s*\n+({NOTE_BODY})\n\s*\n---\n+)"  # triple "-" delimited
+_CARD_BLOCK_EXP = rf"({_NOTE_EXP}{_META_EXP}?)"
+_CARD_BLOCK_RE = re.compile(_CARD_BLOCK_EXP)
+_CARD_BLOCK_BYTES_RE = re.compile(_CARD_BLOCK_EXP.encode())
+
+# Note-type syntax in a block body: a ":::" field separator or a "{{cN::"
+# cloze opening. Lookaheads find every occurrence of both in one scan,
+# including a separator overlapping an opening ("{{c1:::").
+_CARD_SYNTAX_TOKEN_RE = re.compile(r"(?=(:::)|(\{\{ *c\d+ *::))")
+
+
 @dataclass
 class Deck:
     name: str
     source_search_path: Path
     source_search_depth: Optional[int]
+    # The deck's chunks when already split (see validation.iter_file_chunks);
+    # its files are then not read again.
+    chunks: Optional[List["Chunk"]] = field(default=None, repr=False)
+    # Seconds each file may take to render, and where to record how long
+    # each did (see drivers.extract_decks).
+    file_timeout: Optional[float] = field(default=None, repr=False)
+    timings: Optional[FileTimings] = field(default=None, repr=False)
+    # Markdown backend for card fields; None means settings.RENDERER.
+    renderer: Optional[str] = field(default=None, repr=False)
+
+    def compile(
+        self,
+        output_path: Path,
+        compression: Compression = Compression.DEFLATE,
+        incremental: bool = False,
+        baseline: Optional[Dict[str, str]] = None,
+    ) -> NoteStore:
+        """Packages a deck, returning all of its notes. With ``incremental``,
+        unchanged media is copied from the package already at the output path
+        instead of recompressed. With ``baseline`` (note fingerprints by guid)
+        the package holds only notes that are new or changed since then, and
+        their media."""
+        store, media_files = self.package_contents()
+        deck = store
+        if baseline is not None:
+            deck = changed_notes(store, baseline)
+            media_files = self._dedupe_media(deck.media)
+
+        write_path = self.package_path(output_path)
+        write_package(
+            write_path,
+            decks=[deck],
+            media_files=media_files,
+            compression=compression,
+            previous=write_path if incremental else None,
+        )
+        return store
 
-    def compile(self, output_path: Path) -> None:
-        """Packages a deck."""
-        deck_id = generate_integer_hash(self.name)
-        deck = GenAnkiDeck(deck_id=deck_id, name=self.name)
-        package = GenAnkiPackage(deck)
-
-        chunks = self._get_chunks()
-        images = []
-        for chunk in chunks:
-            note = chunk.extract_note()
-
-            images.extend(note.images)
+    def package_path(self, output_path: Path) -> Path:
+        """Where ``compile`` writes the deck's package under ``output_path``."""
+        file_name = clean_str_for_filename(self.name)
+        return Path(f"{output_path}/{file_name}.apkg")
 
-            deck.add_note(
-                GenAnkiNote(
-                    model=note.model, fields=note.fields, tags=note.tags, guid=note.guid
-                )
+    @staticmethod
+    def compile_bundle(
+        sources: List["Deck"],
+        write_path: Path,
+        compression: Compression = Compression.DEFLATE,
+        incremental: bool = False,
+        baseline: Optional[Dict[str, str]] = None,
+    ) -> List[NoteStore]:
+        """Packages several decks into one ``.apkg``, returning all of their
+        notes. ``baseline`` is as for ``compile``.
+
+        Deck names keep their ``::`` hierarchy, so Anki recreates the subdeck
+        tree on import. Media shared between decks is stored once; the
+        basename-collision check spans every deck, since the package has a
+        single media namespace.
+        """
+        stores, media_files = Deck.bundle_contents(sources)
+        decks = stores
+        if baseline is not None:
+            decks = [changed_notes(store, baseline) for store in stores]
+            media_files = Deck._dedupe_media(
+                [media for deck in decks for media in deck.media]
             )
+        write_package(
+            write_path,
+            decks=decks,
+            media_files=media_files,
+            compression=compression,
+            previous=write_path if incremental else None,
+        )
+        return stores
 
-        package.media_files = self._dedupe_media(images)
+    @staticmethod
+    def bundle_contents(
+        sources: List["Deck"],
+    ) -> Tuple[List[NoteStore], List[Path]]:
+        """Extracts several decks' notes, in deck name order, with the media
+        they reference de-duplicated across all of them."""
+        decks = []
+        images: List[Path] = []
+        for source in sorted(sources, key=lambda source: source.name):
+            deck, media_files = source.package_contents()
+            decks.append(deck)
+            images.extend(media_files)
+        return decks, Deck._dedupe_media(images)
+
+    def package_contents(self) -> Tuple[NoteStore, List[Path]]:
+        """Extracts every note into a note store, returning it with the
+        de-duplicated media it references."""
+        deck_id = generate_integer_hash(self.name)
+        store = NoteStore(deck_id=deck_id, name=self.name)
+
+        for path, file_chunks in groupby(
+            self._get_chunks(), key=lambda chunk: chunk.file.path
+        ):
+            start = time.perf_counter()
+            try:
+                with time_budget(self.file_timeout):
+                    for chunk in file_chunks:
+                        note = chunk.extract_note(self.renderer)
+                        store.add(
+                            guid=note.guid,
+                            model=note.model,
+                            fields=note.fields,
+                            tags=note.tags,
+                            media=note.images,
+                        )
+            except BudgetExceeded:
+                raise ValueError(
+                    f"{path}: rendering took longer than the "
+                    f"{self.file_timeout:g}s per-file budget (--file-timeout)"
+                )
+            if self.timings is not None:
+                self.timings.add(path, "render", time.perf_counter() - start)
 
-        file_name = clean_str_for_filename(self.name)
-        write_path = Path(f"{output_path}/{file_name}.apkg")
-        package.write_to_file(write_path)
+        return store, self._dedupe_media(store.media)
 
     @staticmethod
     def _dedupe_media(images: List[Path]) -> List[Path]:
@@ -90,6 +206,9 @@ class Deck:
 
     def _get_chunks(self) -> List["Chunk"]:
         """Returns list of all chunks within scope."""
+        if self.chunks is not None:
+            return self.chunks
+
         source_files = self.get_source_files()
 
         chunks = []
@@ -98,16 +217,16 @@ class Deck:
 
         return chunks
 
-    def get_source_files(self) -> List["File"]:
-        """Returns list of all source files within scope."""
-        file_paths = self.get_source_file_paths()
-
-        source_files = []
-        for file_path in file_paths:
-            source_file = self._extract_source_file(file_path)
-            source_files.append(source_file)
+    def get_source_files(self, file_paths: Optional[List[Path]] = None) -> List["File"]:
+        """Returns list of all source files within scope, or of just
+        ``file_paths`` when the deck's files are already known."""
+        if file_paths is None:
+            file_paths = self.get_source_file_paths()
 
-        return source_files
+        return [
+            source_file
+            for _, source_file in prefetch(file_paths, self._extract_source_file)
+        ]
 
     def get_source_file_paths(self) -> List[Path]:
         """Returns list of all source file paths."""
@@ -115,40 +234,63 @@ class Deck:
             search_path=self.source_search_path, search_depth=self.source_search_depth
         )
 
-        deck_paths = []
-        for file_path in markdown_files:
-            meta = parse_markdown_file(file_path=file_path)[0]
-
-            deck_name = meta.get(settings.DECK_TITLE_KEY)
+        decks = source_decks(
+            markdown_files,
+            search_path=self.source_search_path,
+            complete=self.source_search_depth is None,
+        )
 
+        deck_paths = []
+        for file_path, deck_name in decks.items():
             if deck_name == self.name:
                 deck_paths.append(file_path)
 
         return deck_paths
 
     def _extract_source_file(self, file_path: Path) -> "File":
-        """Creates source file from a markdown file."""
+        """Creates source file from a markdown file.
 
-        meta, body = parse_markdown_file(file_path=file_path)
+        A large file is mapped rather than read, and its body is just its card
+        blocks, decoded and joined; the block grammar finds the same blocks in
+        that text as in the whole file.
+        """
+        mapped = MappedFile.open(file_path)
+        if mapped is not None:
+            with mapped:
+                meta = mapped.meta()
+                body = "".join(
+                    mapped.decode(match.start(), match.end())
+                    for match in _CARD_BLOCK_BYTES_RE.finditer(
+                        mapped.buffer, mapped.body_start
+                    )
+                )
+        else:
+            meta, body = parse_markdown_file(file_path=file_path)
         file = File(path=file_path, meta=meta, body=body)
 
         return file
 
 
+def intern_tags(tags: Iterable[str]) -> Tuple[str, ...]:
+    """De-duplicates tags (first occurrence wins) and interns each one, so
+    every note carrying a tag shares a single string."""
+    return tuple(dict.fromkeys(map(sys.intern, tags)))
+
+
 @dataclass
 class File:
     path: Path
     body: str
     meta: Optional[dict]
+    # note-level tags -> merged note + file tags, shared by notes that match
+    _merged_tags: Dict[Tuple[str, ...], Tuple[str, ...]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     def extract_chunks(self) -> List["Chunk"]:
         """Splits markdown file into list of its note chunks."""
 
-        meta_exp = rf"((?:{GUID_FOOTNOTE}|{TAG_FOOTNOTE}|{TYPE_FOOTNOTE})*)"
-        note_exp = rf"(?:---\n\s*\n+({NOTE_BODY})\n\s*\n---\n+)"  # triple "-" delimited
-        combined_exp = rf"({note_exp}{meta_exp}?)"
-
-        card_matches = re.findall(combined_exp, self.body)
+        card_matches = _CARD_BLOCK_RE.findall(self.body)
 
         note_chunks = []
         for match in card_matches:
@@ -159,6 +301,11 @@ class File:
 
     def get_tags(self) -> List[str]:
         """Returns tags in frontmatter"""
+        return list(self.tags)
+
+    @cached_property
+    def tags(self) -> Tuple[str, ...]:
+        """Frontmatter tags, normalized once per file."""
         fm_tags_extract = self.meta.get(settings.META_TAG_KEY)
 
         if fm_tags_extract is not None and isinstance(fm_tags_extract, list):
@@ -170,7 +317,19 @@ class File:
         else:
             meta_tags = []
 
-        return meta_tags
+        return intern_tags(meta_tags)
+
+    def merge_tags(self, note_tags: Sequence[str]) -> Tuple[str, ...]:
+        """A note's tags: its own first, then the file's, without duplicates.
+
+        Notes in a file mostly share the same few note-level tag sets, so each
+        distinct set is merged once.
+        """
+        key = tuple(note_tags)
+        merged = self._merged_tags.get(key)
+        if merged is None:
+            merged = self._merged_tags[key] = intern_tags(chain(key, self.tags))
+        return merged
 
     def get_name(self) -> str:
         """Return title of the file"""
@@ -183,8 +342,9 @@ class Chunk:
     body: str
     file: "File"
 
-    def extract_note(self) -> "Note":
-        """Extracts a note from a note chunk."""
+    def extract_note(self, renderer: Optional[str] = None) -> "Note":
+        """Extracts a note from a note chunk, rendering its fields with
+        ``renderer`` (see ``convert_md_to_html``)."""
 
         meta_dict = self._extract_meta()
 
@@ -195,13 +355,10 @@ class Chunk:
             raise ValueError("No guid found in note meta chunk")
 
         note_type = self._resolve_type(meta_dict)
-        html_fields = self._extract_html_fields(note_type)
+        html_fields = self._extract_html_fields(note_type, renderer)
         fields = [*html_fields, self.file.get_name()]
 
-        meta_tags = self.file.get_tags()
-
-        tags.extend(meta_tags)
-        tags = list(dict.fromkeys(tags))
+        tags = list(self.file.merge_tags(tags))
 
         images = self._extract_images(html_fields)
 
@@ -300,8 +457,7 @@ class Chunk:
         for type_ in types:
             if not type_.auto_detect:
                 continue
-            match = re.compile(type_.regex, re.DOTALL).findall(self.body)
-            if len(match) > 0:
+            if self._syntax.fields(self.body, type_.syntax) is not None:
                 matches.append(type_)
 
         if len(matches) == 0:
@@ -312,40 +468,49 @@ class Chunk:
 
         return matches[0]
 
-    def _extract_html_fields(self, note_type: "NoteType") -> List[str]:
+    def _extract_html_fields(
+        self, note_type: "NoteType", renderer: Optional[str] = None
+    ) -> List[str]:
         """Extracts HTML fields from note chunk."""
         md_fields = self._extract_md_fields(note_type)
-        html_fields = convert_md_to_html(md_fields)
+        html_fields = convert_md_to_html(md_fields, renderer)
 
         return html_fields
 
     def _extract_md_fields(self, note_type: "NoteType") -> List[str]:
         """Extracts markdown fields from note chunk."""
-        matches = re.compile(note_type.regex, re.DOTALL).findall(self.body)
+        md_fields = self._syntax.fields(self.body, note_type.syntax)
 
-        if len(matches) != 1:
+        if md_fields is None:
             raise ValueError(
                 f"Could not extract {note_type.name} fields from chunk; "
                 f"body does not match the expected syntax"
             )
 
-        if isinstance(matches[0], tuple):  # need to unpack (['…', '…'])
-            md_fields = list(matches[0])
-
-        elif isinstance(matches, list):  # already in correct format ['…']
-            md_fields = matches
-
         return md_fields
 
+    @cached_property
+    def _syntax(self) -> "CardSyntax":
+        """The body's note-type syntax, scanned once for type resolution and
+        field extraction alike."""
+        return CardSyntax.scan(self.body)
+
     def _extract_images(self, html_fields: List[str]) -> List[Path]:
-        """Extracts image paths from already-rendered HTML fields."""
+        """Extracts image paths from already-rendered HTML fields.
+
+        A ``src`` is an HTML-escaped URL, which markdown-it also
+        percent-encodes (``résumé.png`` -> ``r%C3%A9sum%C3%A9.png``); both
+        are decoded to the file name a browser (Anki) would load.
+        """
         # Relies on convert_md_to_html emitting double-quoted, single-line
         # <img> tags; revisit this pattern if the renderer changes.
         regex = r'<img[^>]*src="([^"]*)"'
 
         relative_image_paths = []
-        for field in html_fields:
-            relative_image_paths.extend(re.findall(regex, field))
+        for html_field in html_fields:
+            relative_image_paths.extend(
+                unquote(html.unescape(src)) for src in re.findall(regex, html_field)
+            )
 
         full_image_paths = [
             Path(self.file.path).parent / x for x in relative_image_paths
@@ -353,6 +518,42 @@ class Chunk:
         return full_image_paths
 
 
+class CardSyntax(NamedTuple):
+    """Where a block body's note-type syntax is, from a single scan.
+
+    Equivalent to matching the body against each type's ``regex`` (with
+    DOTALL): QA's ``(.+):::(.+)`` splits at the last separator with text on
+    both sides of it, and Cloze's pattern matches the whole body when an
+    opening is followed, at least one character later, by ``}}``.
+    """
+
+    separator: Optional[int]  # start of the ":::" QA fields split at
+    cloze: bool
+
+    @classmethod
+    def scan(cls, body: str) -> "CardSyntax":
+        separator = None
+        cloze_end = None
+        last_separator = len(body) - 4  # leaves a character after it
+        for match in _CARD_SYNTAX_TOKEN_RE.finditer(body):
+            if match.group(1) is not None:
+                if 1 <= match.start() <= last_separator:
+                    separator = match.start()
+            elif cloze_end is None:
+                cloze_end = match.end(2)
+        cloze = cloze_end is not None and body.find("}}", cloze_end + 1) != -1
+        return cls(separator, cloze)
+
+    def fields(self, body: str, syntax: str) -> Optional[List[str]]:
+        """The markdown fields of ``body`` under a type's ``syntax``, or None
+        when the body does not have that syntax."""
+        if syntax == "cloze":
+            return [body] if self.cloze else None
+        if self.separator is None:
+            return None
+        return [body[: self.separator], body[self.separator + 3 :]]
+
+
 @dataclass
 class Note:
     guid: str
@@ -369,17 +570,27 @@ class NoteType:
     key: str  # value used in a [^type] footnote to select this type
     regex: str
     model: GenAnkiModel
+    syntax: str  # "qa" (fields split at ":::") or "cloze"; see CardSyntax
     auto_detect: bool = True  # whether the body can be matched without [^type]
 
     @staticmethod
     def get_types() -> List["NoteType"]:
         """Provides the master list of 'block' (note) types"""
+        return list(NoteType._types(settings.MASTER_STYLESHEET))
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _types(stylesheet: str) -> Tuple["NoteType", ...]:
+        """The note types, built once per stylesheet. Every note then shares
+        its type's genanki model, and with it the model's template analysis
+        (``Model._req``), rather than building and analysing it again."""
         qa_regex = r"(.+):::(.+)"
-        return [
+        return (
             NoteType(
                 name="QA",
                 key="qa",
                 regex=qa_regex,
+                syntax="qa",
                 model=GenAnkiModel(
                     model_id="1764365620",
                     name="AnkCompiler-Question_Answer",
@@ -395,7 +606,7 @@ class NoteType:
                             "afmt": "{{Question}}" + "<hr id=answer>" + "{{Answer}}",
                         },
                     ],
-                    css=f'@import url("{settings.MASTER_STYLESHEET}");',
+                    css=f'@import url("{stylesheet}");',
                     model_type=GenAnkiModel.FRONT_BACK,
                 ),
             ),
@@ -403,6 +614,7 @@ class NoteType:
                 name="Cloze",
                 key="cloze",
                 regex=r"(.*(?:\{{ *c\d+ *:: *[\s\S]+? *\}})+.*)",
+                syntax="cloze",
                 model=GenAnkiModel(
                     model_id="1783507665",
                     name="AnkCompiler-Cloze",
@@ -414,7 +626,7 @@ class NoteType:
                             "afmt": "{{cloze:Text}}",
                         },
                     ],
-                    css=f'@import url("{settings.MASTER_STYLESHEET}");',
+                    css=f'@import url("{stylesheet}");',
                     model_type=GenAnkiModel.CLOZE,
                 ),
             ),
@@ -424,6 +636,7 @@ class NoteType:
                 name="Basic-Reversed",
                 key="reversed",
                 regex=qa_regex,
+                syntax="qa",
                 auto_detect=False,
                 model=GenAnkiModel(
                     model_id="1764365630",
@@ -445,7 +658,7 @@ class NoteType:
                             "afmt": "{{Back}}<hr id=answer>{{Front}}",
                         },
                     ],
-                    css=f'@import url("{settings.MASTER_STYLESHEET}");',
+                    css=f'@import url("{stylesheet}");',
                     model_type=GenAnkiModel.FRONT_BACK,
                 ),
             ),
@@ -453,6 +666,7 @@ class NoteType:
                 name="Type-In",
                 key="type-in",
                 regex=qa_regex,
+                syntax="qa",
                 auto_detect=False,
                 model=GenAnkiModel(
                     model_id="1764365640",
@@ -469,8 +683,8 @@ class NoteType:
                             "afmt": "{{Question}}<hr id=answer>{{Answer}}",
                         },
                     ],
-                    css=f'@import url("{settings.MASTER_STYLESHEET}");',
+                    css=f'@import url("{stylesheet}");',
                     model_type=GenAnkiModel.FRONT_BACK,
                 ),
             ),
-        ]
+        )
@@ -5,7 +5,7 @@ import subprocess
 import tempfile
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 from app.config import settings
 from app.logic.sources import NOTE_BODY
@@ -38,6 +38,11 @@ _FOOTNOTE_LINE_RE = re.compile(r"^\[\^\w+\]: *.+$")
 _CARD_SYNTAX_RE = re.compile(r":::|\{\{ *c\d+ *::")
 
 
+def random_uid() -> str:
+    """A fresh uid, unchecked for collisions (see ``UidStore.new_uid``)."""
+    return generate_random_string(length=10)
+
+
 @dataclass
 class StampResult:
     file: Path
@@ -55,8 +60,11 @@ class FixResult:
     error: str = ""
 
 
-def stamp_text(raw: str) -> Tuple[str, List[int]]:
-    """Inserts a ``[^uid]`` footnote after every card block that lacks one.
+def stamp_text(
+    raw: str, new_uid: Callable[[], str] = random_uid
+) -> Tuple[str, List[int]]:
+    """Inserts a ``[^uid]`` footnote after every card block that lacks one,
+    drawing each uid from ``new_uid``.
 
     Returns the new text and the 1-based line numbers of the inserted
     footnotes. Pure and idempotent: blocks that already have a uid are left
@@ -79,7 +87,7 @@ def stamp_text(raw: str) -> Tuple[str, List[int]]:
         footnotes = following.group(0) if following else ""
 
         if not _UID_RE.search(footnotes):
-            uid = generate_random_string(length=10)
+            uid = new_uid()
             result += f"[^{settings.GUID_KEY}]: {uid}\n"
             stamped_lines.append(line_at(work, cursor))  # the inserted footnote
 
@@ -145,8 +153,9 @@ def _has_unfenced_cards(work: str, body_start: int) -> bool:
     return bool(_CARD_SYNTAX_RE.search(work[cursor:]))
 
 
-def fix_text(raw: str) -> Tuple[str, int, int]:
+def fix_text(raw: str, new_uid: Callable[[], str] = random_uid) -> Tuple[str, int, int]:
     """Repairs a draft deck, returning ``(new_text, card_count, uids_added)``.
+    New uids are drawn from ``new_uid``.
 
     When the deck is already well-formed (no card text sits outside a block),
     this delegates to ``stamp_text``: missing uids are appended and prose is
@@ -176,7 +185,7 @@ def fix_text(raw: str) -> Tuple[str, int, int]:
         re.search(rf"(?m)^{re.escape(settings.DECK_TITLE_KEY)}:", frontmatter)
     )
     if not is_deck or not _has_unfenced_cards(work, body_start):
-        new_text, lines = stamp_text(raw)
+        new_text, lines = stamp_text(raw, new_uid)
         card_count = sum(1 for _ in _BLOCK_RE.finditer(work, body_start))
         return new_text, card_count, len(lines)
 
@@ -230,7 +239,7 @@ def fix_text(raw: str) -> Tuple[str, int, int]:
             if not (_UID_RE.search(ln) and not _VALID_UID_RE.match(ln))
         ]
         if not any(_VALID_UID_RE.match(ln) for ln in footnotes):
-            uid = generate_random_string(length=10)
+            uid = new_uid()
             footnotes.insert(0, f"[^{settings.GUID_KEY}]: {uid}")
             uids_added += 1
         footblock = "".join(f"{ln}\n" for ln in footnotes)
@@ -245,7 +254,12 @@ def fix_text(raw: str) -> Tuple[str, int, int]:
     return new_text, len(units), uids_added
 
 
-def stamp_file(path: Path, search_root: Path, dry_run: bool) -> StampResult:
+def stamp_file(
+    path: Path,
+    search_root: Path,
+    dry_run: bool,
+    new_uid: Callable[[], str] = random_uid,
+) -> StampResult:
     """Stamps a single file, writing atomically. Skips symlinks and any path
     that resolves outside ``search_root``."""
     if path.is_symlink():
@@ -261,7 +275,7 @@ def stamp_file(path: Path, search_root: Path, dry_run: bool) -> StampResult:
         return StampResult(path, skipped_reason="CRLF line endings not supported")
 
     raw = read_file(path)
-    new_text, stamped_lines = stamp_text(raw)
+    new_text, stamped_lines = stamp_text(raw, new_uid)
 
     if not stamped_lines:
         return StampResult(path)
@@ -277,7 +291,12 @@ def stamp_file(path: Path, search_root: Path, dry_run: bool) -> StampResult:
     return StampResult(path, stamped_lines=stamped_lines)
 
 
-def fix_file(path: Path, search_root: Path, dry_run: bool) -> FixResult:
+def fix_file(
+    path: Path,
+    search_root: Path,
+    dry_run: bool,
+    new_uid: Callable[[], str] = random_uid,
+) -> FixResult:
     """Normalizes a single file (see ``fix_text``), writing atomically. Shares
     ``stamp_file``'s guards: skips symlinks, paths outside ``search_root``, and
     CRLF files. A draft that cannot be repaired is reported, not written."""
@@ -293,7 +312,7 @@ def fix_file(path: Path, search_root: Path, dry_run: bool) -> FixResult:
 
     raw = read_file(path)
     try:
-        new_text, card_count, uids_added = fix_text(raw)
+        new_text, card_count, uids_added = fix_text(raw, new_uid)
     except _FixError as exc:
         return FixResult(path, error=str(exc))
 
@@ -0,0 +1,145 @@
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.logic.sources import Chunk, File, NoteType
+
+# genanki's pattern for the cloze numbers that each become a card.
+_CLOZE_NUMBER_RE = re.compile(r"{{c(\d+)::.+?}}", re.DOTALL)
+
+UNKNOWN_TYPE = "(unknown)"
+
+GROUPS = ("deck", "type", "tag", "file")
+
+
+@dataclass
+class Tally:
+    """Notes, the cards they make, and the UTF-8 size of their card blocks."""
+
+    notes: int = 0
+    cards: int = 0
+    bytes: int = 0
+
+
+class VaultStats:
+    """Note, card and byte counts by deck, note type, tag and file, found
+    with the block grammar and type classifier alone: nothing is rendered and
+    no media is read.
+
+    Card counts follow genanki: one card per distinct cloze number, and one
+    per template whose required fields are not blank. A block whose type
+    cannot be resolved counts as a note of type ``(unknown)`` with no cards.
+    """
+
+    def __init__(self) -> None:
+        # (deck, type, file, tags) -> [notes, cards, bytes]; a file's notes
+        # mostly share a few keys, so each note costs one lookup.
+        self._counts: Dict[Tuple[str, str, str, Tuple[str, ...]], List[int]] = {}
+        # model id -> (card ord, "any" | "all", required field ords) per template
+        self._requirements: Dict[str, List[Tuple[int, str, List[int]]]] = {}
+
+    def add_file(self, deck: str, file: File) -> None:
+        """Counts every card block of a deck's source file."""
+        path = str(file.path)
+        for chunk in file.extract_chunks():
+            self.add_chunk(deck, path, chunk)
+
+    def add_chunk(self, deck: str, path: str, chunk: Chunk) -> None:
+        meta = chunk._extract_meta()
+        note_type: Optional[NoteType]
+        try:
+            note_type = chunk._resolve_type(meta)
+            cards = self._cards(note_type, chunk._extract_md_fields(note_type))
+        except ValueError:
+            note_type, cards = None, 0
+
+        key = (
+            deck,
+            note_type.name if note_type is not None else UNKNOWN_TYPE,
+            path,
+            chunk.file.merge_tags(meta[settings.TAG_KEY]),
+        )
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0, 0, 0]
+        counts[0] += 1
+        counts[1] += cards
+        counts[2] += len(chunk.meta.encode()) + len(chunk.body.encode())
+
+    def _cards(self, note_type: NoteType, md_fields: List[str]) -> int:
+        if note_type.syntax == "cloze":
+            numbers = set(map(int, _CLOZE_NUMBER_RE.findall(md_fields[0])))
+            return len(numbers - {0})
+        # Markdown renders a field to nothing only when it is blank, and the
+        # source field is never blank.
+        filled = [bool(text.strip()) for text in md_fields] + [True]
+        model = note_type.model
+        requirements = self._requirements.get(model.model_id)
+        if requirements is None:
+            requirements = self._requirements[model.model_id] = model._req
+        return sum(
+            1
+            for _, any_or_all, required in requirements
+            if (any if any_or_all == "any" else all)(filled[i] for i in required)
+        )
+
+    @property
+    def total(self) -> Tally:
+        tally = Tally()
+        for notes, cards, size in self._counts.values():
+            tally.notes += notes
+            tally.cards += cards
+            tally.bytes += size
+        return tally
+
+    def group(self, group: str) -> Dict[str, Tally]:
+        """Tallies by ``group``, one of ``GROUPS``. A note counts toward each
+        of its tags."""
+        tallies: Dict[str, Tally] = {}
+        for (deck, type_name, path, tags), (notes, cards, size) in self._counts.items():
+            names = {
+                "deck": (deck,),
+                "type": (type_name,),
+                "tag": tags,
+                "file": (path,),
+            }[group]
+            for name in names:
+                tally = tallies.get(name)
+                if tally is None:
+                    tally = tallies[name] = Tally()
+                tally.notes += notes
+                tally.cards += cards
+                tally.bytes += size
+        return tallies
+
+    def to_dict(self) -> dict:
+        """The counts as plain data, for JSON output."""
+        return {
+            "total": asdict(self.total),
+            **{
+                f"{group}s": {
+                    name: asdict(tally) for name, tally in self.group(group).items()
+                }
+                for group in GROUPS
+            },
+        }
+
+    def format(self) -> str:
+        """The counts as text tables, largest first within each group."""
+        lines = [f"{'notes':>8} {'cards':>8} {'bytes':>12}"]
+        for group in GROUPS:
+            tallies = self.group(group)
+            if not tallies:
+                continue
+            lines.append(f"{group}:")
+            for name, tally in sorted(
+                tallies.items(), key=lambda item: (-item[1].notes, item[0])
+            ):
+                lines.append(_row(tally, name))
+        lines.append(_row(self.total, "total"))
+        return "\n".join(lines)
+
+
+def _row(tally: Tally, name: str) -> str:
+    return f"{tally.notes:>8} {tally.cards:>8} {tally.bytes:>12}  {name}"
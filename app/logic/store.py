@@ -0,0 +1,187 @@
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from genanki.deck import Deck as GenAnkiDeck
+from genanki.model import Model as GenAnkiModel
+from genanki.note import Note as GenAnkiNote
+
+FIELD_SEPARATOR = "\x1f"
+
+
+class NoteStore:
+    """One deck's notes, kept column by column for the package writer.
+
+    A genanki ``Note`` per card holds a model reference, a list of fields, a
+    tag list and a list of cards. Here each note is a row index into parallel
+    columns: its guid, its fields joined into the blob the collection stores,
+    and small ints pointing at the deck's distinct models, tag sets and media.
+    Card ordinals are computed once when the note is added and kept in flat
+    arrays, sliced per note by offset.
+    """
+
+    def __init__(self, deck_id: int, name: str, description: str = "") -> None:
+        if not isinstance(deck_id, int):
+            raise TypeError(f"Deck id must be an integer, not {deck_id}")
+        self.deck_id = deck_id
+        self.name = name
+        self.description = description
+
+        self.models: List[GenAnkiModel] = []
+        self.tag_sets: List[str] = []  # in the collection's " a b " form
+        self.media: List[Path] = []
+        self._model_ids: Dict[int, int] = {}
+        self._tag_set_ids: Dict[Tuple[str, ...], int] = {}
+        self._media_ids: Dict[Path, int] = {}
+
+        self.guids: List[str] = []
+        self.fields: List[str] = []
+        self.model_index = array("I")
+        self.tag_set_index = array("I")
+        self.due = array("q")
+        # notes whose sort field is not their model's sort field, by row
+        self.sort_fields: Dict[int, str] = {}
+        self.card_offsets = array("I", [0])
+        self.card_ords = array("I")
+        self.card_suspended = bytearray()
+        self.media_offsets = array("I", [0])
+        self.media_index = array("I")
+
+    def __len__(self) -> int:
+        return len(self.guids)
+
+    def add_model(self, model: GenAnkiModel) -> int:
+        """Registers ``model`` with the deck, returning its index."""
+        index = self._model_ids.get(model.model_id)
+        if index is None:
+            index = self._model_ids[model.model_id] = len(self.models)
+            self.models.append(model)
+        return index
+
+    def add(
+        self,
+        guid: str,
+        model: GenAnkiModel,
+        fields: Sequence[str],
+        tags: Sequence[str] = (),
+        media: Iterable[Path] = (),
+        due: int = 0,
+        sort_field: Optional[str] = None,
+    ) -> None:
+        """Appends a note. Raises ValueError when its field count does not
+        match its model or a tag contains a space, as genanki does."""
+        if len(model.fields) != len(fields):
+            raise ValueError(
+                f"Note {guid} has {len(fields)} fields but its "
+                f"model {model.name} has {len(model.fields)}"
+            )
+
+        tag_set = self._tag_set(tags)
+        probe = GenAnkiNote(model=model, fields=list(fields), guid=guid)
+        for card in probe.cards:
+            self.card_ords.append(card.ord)
+            self.card_suspended.append(card.suspend)
+        self.card_offsets.append(len(self.card_ords))
+
+        for path in media:
+            self.media_index.append(self._media_id(path))
+        self.media_offsets.append(len(self.media_index))
+
+        row = len(self.guids)
+        if sort_field and sort_field != fields[model.sort_field_index]:
+            self.sort_fields[row] = sort_field
+        self.guids.append(guid)
+        self.fields.append(FIELD_SEPARATOR.join(fields))
+        self.model_index.append(self.add_model(model))
+        self.tag_set_index.append(tag_set)
+        self.due.append(due)
+
+    def _tag_set(self, tags: Sequence[str]) -> int:
+        key = tuple(tags)
+        index = self._tag_set_ids.get(key)
+        if index is None:
+            for tag in key:
+                if " " in tag:
+                    raise ValueError(
+                        f'Tag "{tag}" contains a space; this is not allowed!'
+                    )
+            index = self._tag_set_ids[key] = len(self.tag_sets)
+            self.tag_sets.append(" " + " ".join(key) + " ")
+        return index
+
+    def _media_id(self, path: Path) -> int:
+        media_id = self._media_ids.get(path)
+        if media_id is None:
+            media_id = self._media_ids[path] = len(self.media)
+            self.media.append(path)
+        return media_id
+
+    def cards(self, row: int) -> Iterator[Tuple[int, bool]]:
+        """``(ord, suspended)`` for each card of the note at ``row``."""
+        for position in range(self.card_offsets[row], self.card_offsets[row + 1]):
+            yield self.card_ords[position], bool(self.card_suspended[position])
+
+    def sort_field(self, row: int) -> str:
+        """The note's sort field, as genanki's ``Note.sort_field``."""
+        custom = self.sort_fields.get(row)
+        if custom is not None:
+            return custom
+        model = self.models[self.model_index[row]]
+        return self.fields[row].split(FIELD_SEPARATOR)[model.sort_field_index]
+
+    def note_media(self, row: int) -> List[Path]:
+        """The media referenced by the note at ``row``."""
+        return [
+            self.media[self.media_index[position]]
+            for position in range(self.media_offsets[row], self.media_offsets[row + 1])
+        ]
+
+    def select(self, rows: Iterable[int]) -> "NoteStore":
+        """A store of the same deck holding only the notes at ``rows``, with
+        just the models, tag sets and media they use."""
+        subset = NoteStore(self.deck_id, self.name, self.description)
+        for row in rows:
+            for position in range(self.card_offsets[row], self.card_offsets[row + 1]):
+                subset.card_ords.append(self.card_ords[position])
+                subset.card_suspended.append(self.card_suspended[position])
+            subset.card_offsets.append(len(subset.card_ords))
+
+            for path in self.note_media(row):
+                subset.media_index.append(subset._media_id(path))
+            subset.media_offsets.append(len(subset.media_index))
+
+            if row in self.sort_fields:
+                subset.sort_fields[len(subset)] = self.sort_fields[row]
+            subset.guids.append(self.guids[row])
+            subset.fields.append(self.fields[row])
+            subset.model_index.append(
+                subset.add_model(self.models[self.model_index[row]])
+            )
+            subset.tag_set_index.append(
+                subset._tag_set(self.tag_sets[self.tag_set_index[row]].split())
+            )
+            subset.due.append(self.due[row])
+        return subset
+
+    def to_json(self) -> dict:
+        """The deck's entry in the collection's ``decks`` column."""
+        return GenAnkiDeck(
+            deck_id=self.deck_id, name=self.name, description=self.description
+        ).to_json()
+
+    @classmethod
+    def from_genanki(cls, deck: GenAnkiDeck) -> "NoteStore":
+        """Copies a genanki deck's models and notes into a store."""
+        store = cls(deck.deck_id, deck.name, deck.description)
+        for model in deck.models.values():
+            store.add_model(model)
+        for note in deck.notes:
+            store.add(
+                guid=note.guid,
+                model=note.model,
+                fields=note.fields,
+                tags=note.tags,
+                due=note.due,
+                sort_field=note.sort_field,
+            )
+        return store
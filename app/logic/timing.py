@@ -0,0 +1,84 @@
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class BudgetExceeded(Exception):
+    """Raised from a ``time_budget`` block once its time is up."""
+
+
+@contextmanager
+def time_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Raises BudgetExceeded from the block once ``seconds`` have passed
+    (never when ``seconds`` is None).
+
+    Regex matching checks for signals as it runs, so on the main thread a
+    SIGALRM timer stops even a pattern that would backtrack for minutes.
+    Elsewhere (a worker thread, or a platform without SIGALRM) the block
+    cannot be interrupted: it runs to the end and raises if it overran.
+    """
+    if seconds is None:
+        yield
+        return
+    if seconds <= 0:
+        raise BudgetExceeded()
+
+    if hasattr(signal, "setitimer") and threading.current_thread() is (
+        threading.main_thread()
+    ):
+
+        def expire(signum, frame):
+            raise BudgetExceeded()
+
+        previous = signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        return
+
+    start = time.perf_counter()
+    yield
+    if time.perf_counter() - start > seconds:
+        raise BudgetExceeded()
+
+
+class FileTimings:
+    """Seconds spent on each source file, by stage (``validate`` covers
+    splitting a file into blocks and checking them, ``render`` turning its
+    cards into notes)."""
+
+    def __init__(self) -> None:
+        self._stages: Dict[Path, Dict[str, float]] = {}
+
+    def add(self, path: Path, stage: str, seconds: float) -> None:
+        stages = self._stages.setdefault(path, {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def merge(self, other: "FileTimings") -> None:
+        """Adds the seconds ``other`` recorded, as from a worker process."""
+        for path, stages in other._stages.items():
+            for stage, seconds in stages.items():
+                self.add(path, stage, seconds)
+
+    def slowest(self, count: int) -> List[Tuple[Path, Dict[str, float]]]:
+        """The ``count`` files that took longest overall, slowest first."""
+        ranked = sorted(
+            self._stages.items(), key=lambda item: sum(item[1].values()), reverse=True
+        )
+        return ranked[:count]
+
+    def format_slowest(self, count: int) -> str:
+        """A report of the ``count`` slowest files, one per line."""
+        lines = [f"slowest {count} file(s):"]
+        for path, stages in self.slowest(count):
+            breakdown = ", ".join(
+                f"{stage} {seconds:.3f}s" for stage, seconds in stages.items()
+            )
+            lines.append(f"  {sum(stages.values()):8.3f}s  {path}  ({breakdown})")
+        return "\n".join(lines)
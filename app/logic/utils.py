@@ -1,18 +1,43 @@
 import hashlib
 import logging
+import mmap
+import os
 import re
 import secrets
+import sqlite3
 import string
+import subprocess
+import tarfile
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterable, List, Optional, Tuple
 
 import frontmatter
-from markdown import markdown
+import yaml
 from yaml.constructor import ConstructorError
 
+from app.config import settings
+from app.logic.ignore import IgnoreRules
+from app.logic.render import get_renderer
+
+_FRONTMATTER_RE = re.compile(r"---\n.*?\n---\n", re.DOTALL)
+_FRONTMATTER_BYTES_RE = re.compile(_FRONTMATTER_RE.pattern.encode(), re.DOTALL)
+# UTF-8 of the characters ``\s`` matches in a str pattern but not in a bytes
+# one (ASCII separators and Unicode spaces). A mapped file holding one could
+# split into blocks differently than its text does.
+_STR_ONLY_SPACE_BYTES_RE = re.compile(
+    rb"[\x1c-\x1f]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]"
+    rb"|\xe2\x81\x9f|\xe3\x80\x80"
+)
+# Newlines are counted in slices of this size, so counting never copies more
+# than this much of a mapped file at once.
+_COUNT_WINDOW = 1 << 20
+
 
 def search_files(
-    extension: str, search_dir: Path, search_depth: Optional[int] = None
+    extension: str,
+    search_dir: Path,
+    search_depth: Optional[int] = None,
+    ignore: Optional[IgnoreRules] = None,
 ) -> List[Path]:
     """
     Looks for files with the given extension in the given directory and its
@@ -22,33 +47,102 @@ def search_files(
 
     Hidden directories (names starting with ".") and symlinked directories are
     skipped, the latter to avoid symlink-cycle infinite recursion. Directories
-    that cannot be read are logged and skipped.
+    that cannot be read are logged and skipped. Files and directories matched
+    by ``ignore`` (default: ``.ankcignore`` files, see ``IgnoreRules``) are
+    skipped too, and an ignored directory is never listed.
     """
+    if ignore is None:
+        ignore = IgnoreRules.for_walk()
 
-    def search(current_dir: Path, current_depth: int) -> List[Path]:
+    def search(
+        current_dir: Path, relative: str, current_depth: int, rules: IgnoreRules
+    ) -> List[Path]:
         if search_depth is not None and current_depth > search_depth:
             return []
 
+        # scandir reports entry types from the directory listing itself, so
+        # the walk costs no stat per entry.
         try:
-            items = list(current_dir.iterdir())
+            with os.scandir(current_dir) as entries:
+                items = list(entries)
         except OSError as exc:
             logging.warning("Could not read directory %s: %s", current_dir, exc)
             return []
 
+        rules = rules.enter(current_dir, relative)
+        prefix = relative + "/" if relative else ""
         result = []
         for item in items:
-            if item.is_file() and item.suffix == f"{extension}":
-                result.append(item)
+            if item.is_file() and Path(item.name).suffix == f"{extension}":
+                if not rules.rules or not rules.ignored(prefix + item.name, False):
+                    result.append(current_dir / item.name)
             elif (
                 item.is_dir()
                 and not item.is_symlink()
                 and not item.name.startswith(".")
+                and not (rules.rules and rules.ignored(prefix + item.name, True))
             ):
-                result.extend(search(item, current_depth + 1))
+                result.extend(
+                    search(
+                        current_dir / item.name,
+                        prefix + item.name,
+                        current_depth + 1,
+                        rules,
+                    )
+                )
 
         return result
 
-    return search(search_dir, 0)
+    return search(search_dir, "", 0, ignore)
+
+
+def cache_dir(search_path: Path) -> Path:
+    """Returns the cache directory for the vault at ``search_path``, creating
+    it on first use.
+
+    It is a hidden directory, so source discovery never descends into it, and
+    it carries its own ``.gitignore`` so it is never committed.
+    """
+    directory = Path(search_path) / settings.CACHE_DIR
+    if not directory.is_dir():
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / ".gitignore").write_text("# Created by ankc\n*\n")
+    return directory
+
+
+def connect_cache(search_path: Path, file_name: str, schema: str) -> sqlite3.Connection:
+    """Opens the cache database ``file_name`` of the vault at ``search_path``
+    with ``schema`` (idempotent DDL) applied.
+
+    Caches only save work, so a vault where the cache cannot be created or
+    written, such as a read-only checkout, gets an empty in-memory database
+    instead: the command runs uncached rather than failing.
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(cache_dir(search_path) / file_name)
+        conn.executescript(schema)
+        # Opening an existing file read-only succeeds; writing tells.
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+        return conn
+    except (OSError, sqlite3.Error) as exc:
+        logging.info("Not caching in %s: %s", search_path, exc)
+        if conn is not None:
+            conn.close()
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(schema)
+    return conn
+
+
+def vault_key(path: Path, search_path: Path) -> str:
+    """How caches under ``search_path`` name ``path``: relative to the vault
+    when it is spelled under it, so the same file has one key however the
+    vault was reached."""
+    try:
+        return Path(path).relative_to(search_path).as_posix()
+    except ValueError:  # joins back onto the vault unchanged
+        return Path(path).resolve().as_posix()
 
 
 def search_markdown_files(
@@ -60,6 +154,112 @@ def search_markdown_files(
     return search_files(".md", search_path, search_depth)
 
 
+def search_changed_markdown_files(
+    search_path: Path, ref: str, search_depth: Optional[int] = None
+) -> List[Path]:
+    """Get markdown files under the given directory that differ from the git
+    revision ``ref`` (committed, staged or not; deleted files excluded), and
+    untracked ones git does not ignore.
+
+    Git is asked twice (a diff and a listing of untracked files), so the
+    cost scales with the change rather than the tree. The depth limit,
+    hidden-directory rule and ignore files match ``search_files``.
+    Raises ``ValueError`` when git is unavailable or ``ref`` is unknown.
+    """
+    if ref.startswith("-"):
+        raise ValueError(f"Not a git revision: '{ref}'")
+
+    changed = _run_git(
+        search_path,
+        ["diff", "-z", "--name-only", "--relative", "--diff-filter=d", ref],
+        f"git could not diff against '{ref}'",
+    )
+    untracked = _run_git(
+        search_path,
+        ["ls-files", "-z", "--others", "--exclude-standard"],
+        "git could not list untracked files",
+    )
+
+    ignore = IgnoreRules.for_walk()
+    result = []
+    for name in dict.fromkeys(changed + untracked):
+        relative = Path(name)
+        if search_depth is not None and len(relative.parts) - 1 > search_depth:
+            continue
+        if any(part.startswith(".") for part in relative.parts[:-1]):
+            continue
+        if ignore.ignored_path(search_path, relative):
+            continue
+        result.append(search_path / relative)
+
+    return result
+
+
+def _run_git(search_path: Path, args: List[str], failure: str) -> List[str]:
+    """The markdown paths a ``-z`` git command lists, run in ``search_path``."""
+    try:
+        proc = subprocess.run(
+            ["git", *args, "--", "*.md"],
+            capture_output=True,
+            text=True,
+            cwd=search_path,
+        )
+    except OSError as exc:
+        raise ValueError(f"Could not run git: {exc}") from exc
+
+    if proc.returncode != 0:
+        raise ValueError(f"{failure}: {proc.stderr.strip()}")
+    return [name for name in proc.stdout.split("\0") if name]
+
+
+def export_git_revision(search_path: Path, ref: str, target: Path) -> None:
+    """Writes the files under ``search_path`` as of the git revision ``ref``
+    into the directory ``target``, streaming them out of ``git archive``.
+
+    Members are extracted with tarfile's "data" filter, so none can land
+    outside ``target``. Raises ``ValueError`` when git is unavailable, ``ref``
+    is unknown, a member is unsafe, or Python predates the filter (3.11.4).
+    """
+    if ref.startswith("-"):
+        raise ValueError(f"Not a git revision: '{ref}'")
+    if not hasattr(tarfile, "data_filter"):
+        raise ValueError("Reading a git revision needs Python 3.11.4 or later")
+
+    try:
+        where = subprocess.run(
+            ["git", "rev-parse", "--show-toplevel", "--show-prefix"],
+            capture_output=True,
+            text=True,
+            cwd=search_path,
+        )
+        if where.returncode != 0:
+            raise ValueError(f"Not in a git repository: {where.stderr.strip()}")
+        toplevel, prefix = (where.stdout.split("\n") + [""])[:2]
+        # The vault's subtree of the revision, archived from the top level
+        # since "<ref>:<path>" is relative to it.
+        proc = subprocess.Popen(
+            ["git", "archive", "--format=tar", f"{ref}:{prefix}"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=toplevel,
+        )
+    except OSError as exc:
+        raise ValueError(f"Could not run git: {exc}") from exc
+
+    with proc:
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|") as archive:
+                archive.extractall(target, filter="data")
+        except tarfile.FilterError as exc:
+            proc.kill()
+            raise ValueError(f"Unsafe file in revision '{ref}': {exc}") from exc
+        except tarfile.ReadError:
+            pass  # git failed before writing; reported below
+        stderr = proc.stderr.read().decode(errors="replace")
+    if proc.returncode != 0:
+        raise ValueError(f"git could not export '{ref}': {stderr.strip()}")
+
+
 def read_file(file: Path) -> str:
     """Get text from a file."""
     with file.open("r", encoding="utf-8") as f:
@@ -76,8 +276,13 @@ def parse_markdown_file(file_path: Path) -> Tuple[dict, str]:
     ending on a card block with no trailing newline would otherwise drop its
     last card (issue #25).
     """
+    return parse_markdown_text(read_file(file_path), file_path)
+
+
+def parse_markdown_text(text: str, file_path: Path) -> Tuple[dict, str]:
+    """``parse_markdown_file`` for text already read from ``file_path``."""
     try:
-        split = frontmatter.parse(read_file(file_path))
+        split = frontmatter.parse(text)
     except ConstructorError:
         logging.warning("Could not parse file: %s", file_path)
         split = ({}, "")
@@ -91,10 +296,115 @@ def parse_markdown_file(file_path: Path) -> Tuple[dict, str]:
     return meta, body
 
 
+def read_markdown_meta(file_path: Path) -> dict:
+    """The frontmatter of a markdown file; a large file is mapped and only
+    its frontmatter decoded."""
+    mapped = MappedFile.open(file_path)
+    if mapped is None:
+        return parse_markdown_file(file_path)[0]
+    with mapped:
+        return mapped.meta()
+
+
+def is_large_file(file_path: Path) -> bool:
+    """True when ``file_path`` is big enough to be scanned through
+    ``MappedFile`` (the ``MMAP_THRESHOLD`` setting)."""
+    return Path(file_path).stat().st_size >= settings.MMAP_THRESHOLD
+
+
+class MappedFile:
+    """A large markdown file mapped read-only, for scanning as bytes.
+
+    Block regexes compiled from ``bytes`` patterns run directly on
+    ``buffer``, so only the regions they match need decoding; the file is
+    never held in memory as one ``str``. Offsets are byte offsets, and line
+    numbers count newline bytes, so both agree with the text path.
+    """
+
+    def __init__(
+        self, path: Path, handle, buffer: mmap.mmap, body_start: int, meta: dict
+    ):
+        self.path = path
+        self.buffer = buffer
+        self.body_start = body_start
+        self._meta = meta
+        self._handle = handle
+        self._line_offset = 0
+        self._line = 1
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["MappedFile"]:
+        """Maps ``path`` if it is large, or returns None when it should be
+        read as text instead: a small file, or one the byte patterns cannot
+        see as ``read_file`` would (CRLF endings, no trailing newline,
+        frontmatter that only the YAML parser accepts, whitespace that only
+        a str ``\\s`` matches), or whose frontmatter does not parse, which
+        the text path reports or treats as an empty file."""
+        path = Path(path)
+        if not is_large_file(path):
+            return None
+
+        handle = path.open("rb")
+        try:
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            handle.close()
+            return None
+
+        body_start = 0
+        if buffer[:3] == b"---":
+            match = _FRONTMATTER_BYTES_RE.match(buffer)
+            body_start = match.end() if match else -1
+        meta = None
+        if (
+            body_start >= 0
+            and buffer[-1:] == b"\n"
+            and buffer.find(b"\r") == -1
+            and _STR_ONLY_SPACE_BYTES_RE.search(buffer) is None
+        ):
+            try:
+                meta = frontmatter.parse(buffer[:body_start].decode("utf-8"))[0]
+            except (UnicodeDecodeError, yaml.YAMLError):
+                pass
+        if meta is None:
+            buffer.close()
+            handle.close()
+            return None
+        return cls(path, handle, buffer, body_start, meta)
+
+    def close(self) -> None:
+        self.buffer.close()
+        self._handle.close()
+
+    def __enter__(self) -> "MappedFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def meta(self) -> dict:
+        """The file's frontmatter, decoding only the frontmatter."""
+        return self._meta
+
+    def decode(self, start: int, end: int) -> str:
+        return self.buffer[start:end].decode("utf-8")
+
+    def line_at(self, offset: int) -> int:
+        """1-based line number of byte ``offset``. Cheapest when called with
+        increasing offsets, as a scan does."""
+        if offset < self._line_offset:
+            self._line_offset, self._line = 0, 1
+        for start in range(self._line_offset, offset, _COUNT_WINDOW):
+            end = min(start + _COUNT_WINDOW, offset)
+            self._line += self.buffer[start:end].count(b"\n")
+        self._line_offset = offset
+        return self._line
+
+
 def frontmatter_end_offset(raw: str) -> int:
     """Offset in ``raw`` where the post-frontmatter body begins (0 if none)."""
     if raw.startswith("---"):
-        match = re.match(r"---\n.*?\n---\n", raw, re.DOTALL)
+        match = _FRONTMATTER_RE.match(raw)
         if match:
             return match.end()
     return 0
@@ -105,19 +415,36 @@ def line_at(raw: str, offset: int) -> int:
     return raw.count("\n", 0, offset) + 1
 
 
+def _spread_low_nibble(byte: int) -> int:
+    """Bit ``j`` of the byte's low nibble, moved to the low bit of byte
+    ``3 - j`` of a 32-bit word."""
+    return sum(1 << ((3 - bit) * 8) for bit in range(4) if byte >> bit & 1)
+
+
+# Per digest byte, its contribution to the hash. At most 20 bytes add to each
+# 8-bit lane, so lanes never carry into each other and a plain sum is exact.
+_HASH_CONTRIBUTION = tuple(_spread_low_nibble(byte) for byte in range(256))
+
+
 def generate_integer_hash(text: str) -> int:
-    """Generate an integer hash value for the given input string."""
-    sha256_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    """Generate an integer hash value for the given input string.
 
-    hash_value = 0
-    for i in range(0, 40, 2):
-        byte = int(sha256_hash[i : i + 2], 16)
-        for _ in range(4):
-            if (byte & 1) == 1:
-                hash_value += 1 << ((3 - _) * 8)
-            byte >>= 1
+    Stable across releases (deck ids depend on it): byte ``3 - j`` of the
+    result counts how many of the first 20 SHA-256 digest bytes have bit ``j``
+    set.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return sum(map(_HASH_CONTRIBUTION.__getitem__, digest[:20]))
 
-    return hash_value
+
+def generate_integer_hashes(texts: Iterable[str]) -> List[int]:
+    """``generate_integer_hash`` for many strings at once."""
+    contribution = _HASH_CONTRIBUTION.__getitem__
+    sha256 = hashlib.sha256
+    return [
+        sum(map(contribution, sha256(text.encode("utf-8")).digest()[:20]))
+        for text in texts
+    ]
 
 
 def generate_random_string(length: int = 10) -> str:
@@ -141,19 +468,12 @@ def clean_str_for_filename(text: str) -> str:
     return re.sub("[^a-zA-Z0-9]", "-", text).lower()
 
 
-def convert_md_to_html(md_fields: List[str]) -> List[str]:
+def convert_md_to_html(
+    md_fields: List[str], renderer: Optional[str] = None
+) -> List[str]:
     """
-    Converts markdown text fields to HTML fields.
+    Converts markdown text fields to HTML fields, with ``renderer`` (a
+    ``Renderer`` name; by default ``settings.RENDERER``).
     """
-    html_fields = []
-    for field in md_fields:
-        md_field = markdown(
-            field,
-            extensions=["fenced_code", "tables", "pymdownx.arithmatex"],
-            # generic mode emits \(...\) / \[...\] (data only, no inline
-            # script), which Anki's built-in MathJax renders.
-            extension_configs={"pymdownx.arithmatex": {"generic": True}},
-        )
-        html_fields.append(md_field)
-
-    return html_fields
+    render = get_renderer(renderer)
+    return [render(field) for field in md_fields]
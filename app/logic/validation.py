@@ -1,9 +1,26 @@
 import re
-from dataclasses import dataclass
+import time
+from array import array
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from app.config import settings
+from app.logic.loader import prefetch
 from app.logic.sources import (
     GUID_FOOTNOTE,
     NOTE_BODY,
@@ -12,18 +29,27 @@ from app.logic.sources import (
     Chunk,
     File,
 )
+from app.logic.timing import BudgetExceeded, FileTimings, time_budget
 from app.logic.utils import (
+    MappedFile,
     frontmatter_end_offset,
+    is_large_file,
     line_at,
-    parse_markdown_file,
+    parse_markdown_text,
     read_file,
 )
 
+if TYPE_CHECKING:  # cache builds on this module's report types
+    from app.logic.cache import FindingsCache
+
 # Same block grammar as File.extract_chunks (shared sub-patterns), but with
 # named groups and finditer so we can report line numbers.
 _NOTE = rf"(?:---\n\s*\n+(?P<body>{NOTE_BODY})\n\s*\n---\n+)"
 _META = rf"(?P<meta>(?:{GUID_FOOTNOTE}|{TAG_FOOTNOTE}|{TYPE_FOOTNOTE})*)"
 _BLOCK_RE = re.compile(_NOTE + _META)
+# The same grammar for scanning a large file's mapped bytes. Bytes patterns
+# treat only ASCII whitespace as \s, which is all the delimiters use.
+_BLOCK_BYTES_RE = re.compile((_NOTE + _META).encode())
 
 # A footnote line ("[^uid]: ...") is benign outside a matched block.
 _FOOTNOTE_LINE_RE = re.compile(r"^\[\^\w+\]:")
@@ -31,6 +57,10 @@ _FOOTNOTE_LINE_RE = re.compile(r"^\[\^\w+\]:")
 # a matched block means a card was meant there but won't compile. Prose without
 # it is intentionally ignored (see examples/example.md), so it is not flagged.
 _CARD_SYNTAX_RE = re.compile(r":::|\{\{ *c\d+ *::")
+_CARD_SYNTAX_BYTES_RE = re.compile(_CARD_SYNTAX_RE.pattern.encode())
+
+# Files a pool worker validates per task, to amortize the round trip.
+_POOL_BATCH = 8
 
 
 @dataclass
@@ -45,22 +75,291 @@ class Finding:
         return f"{loc}: {self.level}: {self.message}"
 
 
-def validate_files(file_paths: List[Path]) -> List[Finding]:
+class UidIndex:
+    """Where each uid was first seen, stored compactly.
+
+    A vault-wide check tracks every uid, so rather than a ``(Path, int)`` tuple
+    per uid this keeps one small int per uid, pointing into parallel arrays of
+    interned path indices and line numbers.
+    """
+
+    def __init__(self) -> None:
+        self._slots: Dict[str, int] = {}
+        self._paths: List[Path] = []
+        self._path_ids: Dict[Path, int] = {}
+        self._files = array("I")
+        self._lines = array("I")
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._slots
+
+    def first_seen(self, uid: str) -> Optional[Tuple[Path, int]]:
+        """The ``(path, line)`` where ``uid`` was first recorded, if any."""
+        slot = self._slots.get(uid)
+        if slot is None:
+            return None
+        return self._paths[self._files[slot]], self._lines[slot]
+
+    def add(self, uid: str, path: Path, line: int) -> None:
+        """Records ``uid`` at ``path:line``; a uid already seen is kept at its
+        first location."""
+        if uid in self._slots:
+            return
+        path_id = self._path_ids.get(path)
+        if path_id is None:
+            path_id = self._path_ids[path] = len(self._paths)
+            self._paths.append(path)
+        self._slots[uid] = len(self._files)
+        self._files.append(path_id)
+        self._lines.append(line)
+
+
+@dataclass
+class FileReport:
+    """One file's validation result, computed without deck-wide state so
+    files can be validated independently (and in parallel).
+
+    ``uids`` lists each card's uid occurrence as ``(uid, line, position)``,
+    where ``position`` is the index in ``findings`` at which a duplicate-uid
+    finding for that card belongs. ``seconds`` is how long validating the
+    file took (zero for a cached report); ``timed_out`` marks a file that
+    overran its budget, whose report is just that error.
+    """
+
+    path: Path
+    findings: List[Finding]
+    uids: List[Tuple[str, int, int]]
+    seconds: float = 0.0
+    timed_out: bool = False
+
+
+def validate_files(file_paths: List[Path], jobs: int = 1) -> List[Finding]:
     """Validates the given source files, returning all findings (deck-wide:
     duplicate uids are detected across the whole set)."""
+    return list(iter_findings(file_paths, jobs=jobs))
+
+
+def iter_findings(
+    file_paths: Iterable[Path],
+    jobs: int = 1,
+    cache: Optional["FindingsCache"] = None,
+    seen_uids: Optional[UidIndex] = None,
+    file_timeout: Optional[float] = None,
+    timings: Optional[FileTimings] = None,
+) -> Iterator[Finding]:
+    """Lazily validates the given source files, yielding findings file by file
+    as they are produced. Only the uid index is kept across files.
+
+    With ``jobs`` > 1 the per-file work runs in a process pool. With a
+    ``cache``, files whose content is unchanged reuse their stored report and
+    only the duplicate-uid merge is redone. Reports are merged in input order
+    either way, so duplicate uids are reported exactly as in a serial run:
+    the first occurrence in file order is "first seen". A pre-filled
+    ``seen_uids`` makes uids from outside ``file_paths`` count as seen first.
+
+    A file that takes longer than ``file_timeout`` seconds to validate is
+    reported as an error instead of holding up the run. ``timings``, when
+    given, collects how long each file took.
+    """
+    if seen_uids is None:
+        seen_uids = UidIndex()
+
+    for report in _iter_reports(file_paths, jobs, cache, file_timeout):
+        if timings is not None:
+            timings.add(report.path, "validate", report.seconds)
+        yield from merge_report(report, seen_uids)
+
+
+def _iter_reports(
+    file_paths: Iterable[Path],
+    jobs: int,
+    cache: Optional["FindingsCache"],
+    file_timeout: Optional[float] = None,
+) -> Iterator[FileReport]:
+    """Map step: yields each file's report in input order."""
+    if cache is None and jobs <= 1:
+        yield from _validate_prefetched(file_paths, file_timeout)
+        return
+
+    # Settle cache hits up front so only misses are validated (and sent to the
+    # pool); hit reports are loaded one at a time as they are merged.
+    paths = list(file_paths)
+    if cache is not None:
+        digests = [digest for _, digest in prefetch(paths, cache.digest)]
+    else:
+        digests = [""] * len(paths)
+    hits = [
+        cache is not None and cache.has(path, digest)
+        for path, digest in zip(paths, digests)
+    ]
+    misses = [path for path, hit in zip(paths, hits) if not hit]
+
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and misses else None
+    try:
+        if pool is not None:
+            fresh = _pool_reports(pool, misses, jobs, file_timeout)
+        else:
+            fresh = _validate_prefetched(misses, file_timeout)
+
+        for path, digest, hit in zip(paths, digests, hits):
+            report = cache.get(path, digest) if hit else None
+            if report is None:
+                report = next(fresh)
+                if cache is not None and not report.timed_out:
+                    cache.put(report, digest)
+            yield report
+    finally:
+        # A consumer that stops early (--max-findings) leaves files queued.
+        fresh.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _pool_reports(
+    pool: Executor,
+    file_paths: Iterable[Path],
+    jobs: int,
+    file_timeout: Optional[float] = None,
+) -> Iterator[FileReport]:
+    """Validates files on ``pool`` in batches of ``_POOL_BATCH``, yielding
+    reports in input order. Like ``loader.prefetch``, it keeps at most
+    ``READ_WINDOW`` files (and at least a batch per worker) in flight ahead
+    of the consumer rather than submitting the whole run up front."""
+    window = max(settings.READ_WINDOW // _POOL_BATCH, jobs)
+    validate = partial(_validate_batch, budget=file_timeout)
+    pending: Deque[Future] = deque()
+    paths = iter(file_paths)
+    while batch := list(islice(paths, _POOL_BATCH)):
+        if len(pending) == window:
+            yield from pending.popleft().result()
+        pending.append(pool.submit(validate, batch))
+
+    while pending:
+        yield from pending.popleft().result()
+
+
+def _validate_batch(
+    file_paths: List[Path], budget: Optional[float] = None
+) -> List[FileReport]:
+    return [validate_file_within(path, budget=budget) for path in file_paths]
+
+
+def _validate_prefetched(
+    file_paths: Iterable[Path], file_timeout: Optional[float] = None
+) -> Iterator[FileReport]:
+    """Validates files in order on this thread, reading ahead of it. Large
+    files are left for ``validate_file`` to map."""
+    for path, raw in prefetch(file_paths, _read_unless_large):
+        yield validate_file_within(path, raw, budget=file_timeout)
+
+
+def iter_file_chunks(
+    file_paths: Iterable[Path],
+    seen_uids: Optional[UidIndex] = None,
+    file_timeout: Optional[float] = None,
+    timings: Optional[FileTimings] = None,
+) -> Iterator[Tuple[FileReport, List[Finding], List[Chunk]]]:
+    """``iter_findings`` that also yields each file's card chunks, so a build
+    validates and extracts its notes from one read and parse of each file.
+    Yields ``(report, findings, chunks)`` in input order, ``findings`` being
+    the report's merged with the duplicate-uid check."""
+    if seen_uids is None:
+        seen_uids = UidIndex()
+
+    for path, raw in prefetch(file_paths, _read_unless_large):
+        chunks: List[Chunk] = []
+        report = validate_file_within(path, raw, chunks, budget=file_timeout)
+        if timings is not None:
+            timings.add(path, "validate", report.seconds)
+        yield report, merge_report(report, seen_uids), chunks
+
+
+def _read_unless_large(path: Path) -> Optional[str]:
+    return None if is_large_file(path) else read_file(path)
+
+
+def merge_report(report: FileReport, seen_uids: UidIndex) -> List[Finding]:
+    """Reduce step: folds a file's uids into the deck-wide index, returning
+    its findings with any duplicate-uid errors slotted into place."""
     findings: List[Finding] = []
-    seen_uids: Dict[str, Tuple[Path, int]] = {}
+    cursor = 0
+    for uid, line, position in report.uids:
+        findings.extend(report.findings[cursor:position])
+        cursor = position
+
+        first_seen = seen_uids.first_seen(uid)
+        if first_seen is not None:
+            prev_file, prev_line = first_seen
+            findings.append(
+                Finding(
+                    report.path,
+                    line,
+                    "error",
+                    f"duplicate uid '{uid}' (first seen at {prev_file}:{prev_line})",
+                )
+            )
+        else:
+            seen_uids.add(uid, report.path, line)
 
-    for path in file_paths:
-        findings.extend(_validate_file(path, seen_uids))
+    findings.extend(report.findings[cursor:])
 
     return findings
 
 
-def _validate_file(path: Path, seen_uids: Dict[str, Tuple[Path, int]]) -> List[Finding]:
+def validate_file_within(
+    path: Path,
+    raw: Optional[str] = None,
+    chunks: Optional[List[Chunk]] = None,
+    budget: Optional[float] = None,
+) -> FileReport:
+    """``validate_file``, timed and stopped once it has taken ``budget``
+    seconds. A file that overruns reports a single error naming the budget
+    and contributes no uids or chunks."""
+    start = time.perf_counter()
+    try:
+        with time_budget(budget):
+            report = validate_file(path, raw, chunks)
+    except BudgetExceeded:
+        if chunks is not None:
+            chunks.clear()
+        finding = Finding(
+            path,
+            None,
+            "error",
+            f"validation took longer than the {budget:g}s per-file budget "
+            "(--file-timeout); look for a malformed block or unbalanced "
+            "cloze braces",
+        )
+        report = FileReport(path=path, findings=[finding], uids=[], timed_out=True)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def validate_file(
+    path: Path, raw: Optional[str] = None, chunks: Optional[List[Chunk]] = None
+) -> FileReport:
+    """Map step: validates one file in isolation (frontmatter, block grammar,
+    chunk validity, dropped content), collecting its uids for the deck-wide
+    duplicate check in ``merge_report``. ``raw`` is the file's text when the
+    caller has already read it. A large file is scanned through a memory
+    map instead (see ``MappedFile``).
+
+    Given a ``chunks`` list, each block is also appended to it as the chunk
+    ``File.extract_chunks`` would split it, so notes can be extracted from
+    the same pass."""
+    if raw is None:
+        mapped = MappedFile.open(path)
+        if mapped is not None:
+            with mapped:
+                return _validate_mapped(path, mapped, chunks)
+        raw = read_file(path)
+
     findings: List[Finding] = []
-    raw = read_file(path)
-    meta, _ = parse_markdown_file(path)
+    uids: List[Tuple[str, int, int]] = []
+    meta, _ = parse_markdown_text(raw, path)
 
     if meta.get(settings.DECK_TITLE_KEY) is None:
         findings.append(
@@ -80,39 +379,110 @@ def _validate_file(path: Path, seen_uids: Dict[str, Tuple[Path, int]]) -> List[F
         matched_spans.append((match.start(), match.end()))
         line = line_at(raw, body_start + match.start())
         chunk = Chunk(body=match.group("body"), meta=match.group("meta"), file=file_obj)
-        findings.extend(_validate_chunk(chunk, path, line, seen_uids))
+        if chunks is not None:
+            # extract_chunks passes the whole block as the chunk's meta
+            chunks.append(Chunk(body=chunk.body, meta=match.group(0), file=file_obj))
+
+        # Chunk-level validity (missing uid, note type) comes from the chunk
+        # itself; the deck-level duplicate check happens in merge_report.
+        for message in chunk.validate():
+            findings.append(Finding(path, line, "error", message))
+
+        uid = chunk.uid
+        if uid is not None:
+            uids.append((uid, line, len(findings)))
 
     findings.extend(_check_dropped_content(body, body_start, raw, matched_spans, path))
 
-    return findings
+    return FileReport(path=path, findings=findings, uids=uids)
 
 
-def _validate_chunk(
-    chunk: Chunk, path: Path, line: int, seen_uids: Dict[str, Tuple[Path, int]]
-) -> List[Finding]:
+def _validate_mapped(
+    path: Path, mapped: MappedFile, chunks: Optional[List[Chunk]] = None
+) -> FileReport:
+    """``validate_file`` for a large file: the block grammar runs over the
+    mapped bytes and only matched blocks (and card-like gaps) are decoded."""
     findings: List[Finding] = []
+    uids: List[Tuple[str, int, int]] = []
+    meta = mapped.meta()
 
-    # Chunk-level validity (missing uid, note type) comes from the chunk
-    # itself; this function adds location and the deck-level duplicate check.
-    for message in chunk.validate():
-        findings.append(Finding(path, line, "error", message))
+    if meta.get(settings.DECK_TITLE_KEY) is None:
+        findings.append(
+            Finding(path, 1, "error", "frontmatter is missing a 'deck' key")
+        )
 
-    uid = chunk.uid
-    if uid is not None:
-        if uid in seen_uids:
-            prev_file, prev_line = seen_uids[uid]
-            findings.append(
-                Finding(
-                    path,
-                    line,
-                    "error",
-                    f"duplicate uid '{uid}' (first seen at {prev_file}:{prev_line})",
+    file_obj = File(path=path, meta=meta, body="")
+    buffer = mapped.buffer
+
+    matched_spans: List[Tuple[int, int]] = []
+    for match in _BLOCK_BYTES_RE.finditer(buffer, mapped.body_start):
+        matched_spans.append((match.start(), match.end()))
+        line = mapped.line_at(match.start())
+        chunk = Chunk(
+            body=match.group("body").decode("utf-8"),
+            meta=match.group("meta").decode("utf-8"),
+            file=file_obj,
+        )
+        if chunks is not None:
+            chunks.append(
+                Chunk(
+                    body=chunk.body,
+                    meta=match.group(0).decode("utf-8"),
+                    file=file_obj,
                 )
             )
-        else:
-            seen_uids[uid] = (path, line)
 
-    return findings
+        for message in chunk.validate():
+            findings.append(Finding(path, line, "error", message))
+
+        uid = chunk.uid
+        if uid is not None:
+            uids.append((uid, line, len(findings)))
+
+    for gap_start, gap_end in _gaps(matched_spans, mapped.body_start, len(buffer)):
+        if not _CARD_SYNTAX_BYTES_RE.search(buffer, gap_start, gap_end):
+            continue
+
+        offset = gap_start
+        while offset < gap_end:
+            end = buffer.find(b"\n", offset, gap_end)
+            end = gap_end if end == -1 else end + 1
+            if _is_content_line(mapped.decode(offset, end)):
+                findings.append(_dropped_finding(path, mapped.line_at(offset)))
+                break
+            offset = end
+
+    return FileReport(path=path, findings=findings, uids=uids)
+
+
+def scan_uids(path: Path) -> List[Tuple[str, int]]:
+    """Returns each card's ``(uid, line)`` in a file, located exactly as
+    ``validate_file`` locates them but without validating anything."""
+    mapped = MappedFile.open(path)
+    if mapped is not None:
+        with mapped:
+            return [
+                (uid, mapped.line_at(match.start()))
+                for match in _BLOCK_BYTES_RE.finditer(mapped.buffer, mapped.body_start)
+                if (uid := _meta_uid(match.group("meta").decode("utf-8")))
+            ]
+
+    raw = read_file(path)
+    body_start = frontmatter_end_offset(raw)
+    body = raw[body_start:]
+    if body and not body.endswith("\n"):
+        body += "\n"
+
+    uids: List[Tuple[str, int]] = []
+    for match in _BLOCK_RE.finditer(body):
+        uid = _meta_uid(match.group("meta"))
+        if uid is not None:
+            uids.append((uid, line_at(raw, body_start + match.start())))
+    return uids
+
+
+def _meta_uid(meta: str) -> Optional[str]:
+    return Chunk(body="", meta=meta, file=None).uid
 
 
 def _check_dropped_content(
@@ -133,18 +503,7 @@ def _check_dropped_content(
     build aborts. Run `ankc uid --fix` to repair a draft.
     """
     findings: List[Finding] = []
-
-    # Compute the gaps in the body not covered by any matched block span.
-    gaps: List[Tuple[int, int]] = []
-    cursor = 0
-    for start, end in sorted(matched_spans):
-        if start > cursor:
-            gaps.append((cursor, start))
-        cursor = max(cursor, end)
-    if cursor < len(body):
-        gaps.append((cursor, len(body)))
-
-    for gap_start, gap_end in gaps:
+    for gap_start, gap_end in _gaps(matched_spans, 0, len(body)):
         segment = body[gap_start:gap_end]
         if not _CARD_SYNTAX_RE.search(segment):
             continue  # blanks, delimiters, footnotes, or ignored prose
@@ -152,47 +511,102 @@ def _check_dropped_content(
         # Point at the first non-structural line in the gap.
         offset = gap_start
         for line in segment.splitlines(keepends=True):
-            stripped = line.strip()
-            if stripped and stripped != "---" and not _FOOTNOTE_LINE_RE.match(stripped):
+            if _is_content_line(line):
                 findings.append(
-                    Finding(
-                        path,
-                        line_at(raw, body_start + offset),
-                        "error",
-                        "malformed or unterminated card block — this content is "
-                        "not inside a well-formed card and would be silently "
-                        "dropped (run `ankc uid --fix` to repair a draft)",
-                    )
+                    _dropped_finding(path, line_at(raw, body_start + offset))
                 )
                 break  # one finding per gap is enough to flag the defect
             offset += len(line)
     return findings
 
 
+def _gaps(
+    matched_spans: List[Tuple[int, int]], start: int, end: int
+) -> List[Tuple[int, int]]:
+    """The ranges in ``[start, end)`` not covered by any matched block span."""
+    gaps: List[Tuple[int, int]] = []
+    cursor = start
+    for span_start, span_end in sorted(matched_spans):
+        if span_start > cursor:
+            gaps.append((cursor, span_start))
+        cursor = max(cursor, span_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _is_content_line(line: str) -> bool:
+    """True for a line that is not blank, a delimiter, or a footnote."""
+    stripped = line.strip()
+    return (
+        bool(stripped) and stripped != "---" and not _FOOTNOTE_LINE_RE.match(stripped)
+    )
+
+
+def _dropped_finding(path: Path, line: int) -> Finding:
+    return Finding(
+        path,
+        line,
+        "error",
+        "malformed or unterminated card block — this content is "
+        "not inside a well-formed card and would be silently "
+        "dropped (run `ankc uid --fix` to repair a draft)",
+    )
+
+
+@dataclass
+class FindingCounts:
+    """Running totals for the summary footer, so findings can be rendered as
+    they stream past instead of being collected first."""
+
+    errors: int = 0
+    warnings: int = 0
+    files: Set[Path] = field(default_factory=set)
+    truncated: bool = False  # stopped early by a findings cap
+
+    @property
+    def total(self) -> int:
+        return self.errors + self.warnings
+
+    def add(self, finding: Finding) -> None:
+        if finding.level == "error":
+            self.errors += 1
+        elif finding.level == "warning":
+            self.warnings += 1
+        self.files.add(finding.file)
+
+    def summary(self) -> str:
+        if self.total == 0:
+            return "no problems found"
+        return (
+            f"{self.errors} error(s), {self.warnings} warning(s) "
+            f"across {len(self.files)} file(s)"
+        )
+
+
 def format_findings(findings: List[Finding]) -> str:
     """Renders findings as compiler-style lines plus a summary footer."""
-    lines = [f.format() for f in findings]
-    errors = sum(1 for f in findings if f.level == "error")
-    warnings = sum(1 for f in findings if f.level == "warning")
-    files = len({f.file for f in findings})
+    counts = FindingCounts()
+    lines = []
+    for finding in findings:
+        counts.add(finding)
+        lines.append(finding.format())
 
-    if not findings:
-        lines.append("no problems found")
-    else:
-        summary = f"{errors} error(s), {warnings} warning(s) across {files} file(s)"
-        lines.append(summary)
+    lines.append(counts.summary())
 
     return "\n".join(lines)
 
 
+def finding_to_dict(finding: Finding) -> dict:
+    """Machine-readable form of one finding (for --format json/jsonl)."""
+    return {
+        "file": str(finding.file),
+        "line": finding.line,
+        "level": finding.level,
+        "message": finding.message,
+    }
+
+
 def findings_to_dicts(findings: List[Finding]) -> List[dict]:
     """Machine-readable form of findings (for --format json)."""
-    return [
-        {
-            "file": str(f.file),
-            "line": f.line,
-            "level": f.level,
-            "message": f.message,
-        }
-        for f in findings
-    ]
+    return [finding_to_dict(f) for f in findings]
@@ -0,0 +1,62 @@
+"""Package write time vs. size for each ``ankc build --compression`` strategy.
+
+Run with ``python -m benchmarks.compression``.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from app.logic.packaging import Compression, write_package
+from app.logic.sources import Deck
+from benchmarks.vault import make_vault
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--decks", type=int, default=4)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--cards", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3, help="report the best run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = make_vault(
+            Path(tmp) / "vault",
+            decks=args.decks,
+            files_per_deck=args.files,
+            cards_per_file=args.cards,
+        )
+        # Extraction is identical for every strategy, so do it once and time
+        # only the package write.
+        contents = [
+            Deck(
+                name=f"Bench::Deck{i}",
+                source_search_path=vault,
+                source_search_depth=None,
+            ).package_contents()
+            for i in range(args.decks)
+        ]
+
+        print(f"{'strategy':<10}{'seconds':>10}{'bytes':>14}")
+        for compression in Compression:
+            out = Path(tmp) / compression.value
+            out.mkdir()
+            elapsed = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                for index, (deck, media_files) in enumerate(contents):
+                    write_package(
+                        out / f"deck{index}.apkg",
+                        decks=[deck],
+                        media_files=media_files,
+                        compression=compression,
+                    )
+                elapsed = min(elapsed, time.perf_counter() - start)
+            size = sum(p.stat().st_size for p in out.glob("*.apkg"))
+            print(f"{compression.value:<10}{elapsed:>10.3f}{size:>14,}")
+
+
+if __name__ == "__main__":
+    main()
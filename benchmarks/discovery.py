@@ -0,0 +1,44 @@
+"""Time to find a vault's markdown files next to a large folder with no decks,
+with and without an ``.ankcignore`` naming it.
+
+Run with ``python -m benchmarks.discovery``. The folder is a tree of
+``--dirs`` directories holding ``--files`` files each, as an attachment or
+``node_modules`` folder might be.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from app.logic.utils import search_markdown_files
+from benchmarks.vault import make_vault
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dirs", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = make_vault(Path(tmp) / "vault")
+        for i in range(args.dirs):
+            folder = vault / "attachments" / f"{i % 50}" / f"{i}"
+            folder.mkdir(parents=True)
+            for j in range(args.files):
+                (folder / f"{j}.md").write_text("")
+
+        seconds = {}
+        for name in ("not ignored", "ignored"):
+            if name == "ignored":
+                (vault / ".ankcignore").write_text("/attachments/\n")
+            start = time.perf_counter()
+            found = search_markdown_files(vault)
+            seconds[name] = time.perf_counter() - start
+            print(f"{name:<16}{seconds[name]:>8.3f}s  {len(found)} files")
+        print(f"{'speedup':<16}{seconds['not ignored'] / seconds['ignored']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Memory held by a large deck's notes once extracted, ready to package.
+
+Run with ``python -m benchmarks.notes``. The default is one 100k-note deck;
+it takes a few minutes, almost all of it rendering markdown.
+"""
+
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from app.logic.sources import Deck
+from benchmarks.vault import make_vault
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--cards", type=int, default=2000)
+    parser.add_argument("--tags", type=int, default=10, help="frontmatter tags")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = make_vault(
+            Path(tmp) / "vault",
+            decks=1,
+            files_per_deck=args.files,
+            cards_per_file=args.cards,
+            images_per_file=0,
+            file_tags=args.tags,
+        )
+        source = Deck(
+            name="Bench::Deck0", source_search_path=vault, source_search_depth=None
+        )
+
+        tracemalloc.start()
+        deck, _ = source.package_contents()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        notes = len(deck)
+        print(f"{'notes':<16}{notes:>12,}")
+        print(f"{'retained MiB':<16}{current / 2**20:>12.1f}")
+        print(f"{'peak MiB':<16}{peak / 2**20:>12.1f}")
+        print(f"{'bytes/note':<16}{current / notes:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Time to render a deck's markdown fields with each renderer.
+
+Run with ``python -m benchmarks.render``. Fields come from a generated vault;
+"markdown (per call)" is how fields were rendered before renderers were
+reused, building a fresh Python-Markdown instance for every field.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from markdown import markdown
+
+from app.logic.render import Renderer, get_renderer
+from app.logic.sources import Deck
+from benchmarks.vault import make_vault
+
+
+def _per_call(text: str) -> str:
+    return markdown(
+        text,
+        extensions=["fenced_code", "tables", "pymdownx.arithmatex"],
+        extension_configs={"pymdownx.arithmatex": {"generic": True}},
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--cards", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = make_vault(
+            Path(tmp) / "vault",
+            decks=1,
+            files_per_deck=args.files,
+            cards_per_file=args.cards,
+            images_per_file=0,
+        )
+        source = Deck(
+            name="Bench::Deck0", source_search_path=vault, source_search_depth=None
+        )
+        fields = []
+        for chunk in source._get_chunks():
+            note_type = chunk._resolve_type(chunk._extract_meta())
+            fields.extend(chunk._extract_md_fields(note_type))
+
+    renderers = {
+        "markdown (per call)": _per_call,
+        **{renderer.value: get_renderer(renderer) for renderer in Renderer},
+    }
+    print(f"{len(fields):,} fields")
+    for name, render in renderers.items():
+        start = time.perf_counter()
+        for field in fields:
+            render(field)
+        seconds = time.perf_counter() - start
+        print(f"{name:<20}{seconds:>8.2f}s{len(fields) / seconds:>12,.0f} fields/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compiling decks of uneven size in parallel, in name order and largest
+first, and how evenly ``--shard`` splits them.
+
+Run with ``python -m benchmarks.schedule``. The vault has ``--decks`` small
+decks and, last by name, one ``--big`` times their size. "name order" hands
+decks to the same process pool alphabetically, as a build did before decks
+were scheduled by cost, so the big deck starts last and runs alone. Every
+deck is compiled once first, as a warm-up.
+"""
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from app.logic.drivers import compile_sources, extract_decks, shard_decks
+from app.logic.sources import Deck
+from benchmarks.vault import make_vault
+
+
+def _compile(output: Path, source: Deck) -> None:
+    source.compile(output_path=output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--decks", type=int, default=7)
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--big", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--shards", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = make_vault(
+            Path(tmp) / "vault",
+            deck_files=[args.files] * args.decks + [args.files * args.big],
+        )
+        output = Path(tmp) / "out"
+        output.mkdir()
+        names = sorted(f"Bench::Deck{i}" for i in range(args.decks + 1))
+        _, sources = extract_decks(names, vault, None)
+        compile_sources(sources, output_path=output)  # warm-up
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            list(pool.map(partial(_compile, output), sources))
+        naive = time.perf_counter() - start
+        print(f"{'name order':<16}{naive:>8.3f}s")
+
+        start = time.perf_counter()
+        compile_sources(sources, output_path=output, jobs=args.jobs)
+        ordered = time.perf_counter() - start
+        print(f"{'largest first':<16}{ordered:>8.3f}s")
+        print(f"{'speedup':<16}{naive / ordered:>8.1f}x")
+
+        for shard in range(1, args.shards + 1):
+            shard_names = shard_decks(names, vault, None, (shard, args.shards))
+            _, shard_sources = extract_decks(shard_names, vault, None)
+            start = time.perf_counter()
+            compile_sources(shard_sources, output_path=output)
+            seconds = time.perf_counter() - start
+            print(
+                f"shard {shard}/{args.shards:<8}{seconds:>8.3f}s  {len(shard_names)} deck(s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""``ankc stats --all`` against ``ankc build --all`` on the same vault.
+
+Run with ``python -m benchmarks.stats``. Both run through the CLI, after one
+warm-up run each, so the vault's caches are as a second run would find them;
+each reports its best of ``--repeat`` runs.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from typer.testing import CliRunner
+
+from app.cli.entry import app
+from benchmarks.vault import make_vault
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--decks", type=int, default=4)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--cards", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = make_vault(
+            Path(tmp) / "vault",
+            decks=args.decks,
+            files_per_deck=args.files,
+            cards_per_file=args.cards,
+        )
+        output = Path(tmp) / "out"
+        output.mkdir()
+        commands = {
+            "stats --all": ["stats", "--all", "--path", str(vault)],
+            "build --all": [
+                "build",
+                "--all",
+                "--path",
+                str(vault),
+                "--output",
+                str(output),
+            ],
+        }
+        seconds = {}
+        for name, command in commands.items():
+            runner.invoke(app, command)
+            runs = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = runner.invoke(app, command)
+                runs.append(time.perf_counter() - start)
+                assert result.exit_code == 0, result.stdout
+            seconds[name] = min(runs)
+            print(f"{name:<16}{seconds[name]:>8.3f}s")
+        print(
+            f"{'speedup':<16}{seconds['build --all'] / seconds['stats --all']:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
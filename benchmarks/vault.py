@@ -0,0 +1,87 @@
+"""Synthetic vault shared by the benchmarks.
+
+Deterministic for a given seed so runs are comparable across commits.
+"""
+
+import random
+import string
+from pathlib import Path
+from typing import Optional, Sequence
+
+
+def _uid(rng: random.Random) -> str:
+    alphabet = string.ascii_letters + string.digits
+    return "".join(rng.choice(alphabet) for _ in range(10))
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+        for _ in range(count)
+    )
+
+
+def make_vault(
+    root: Path,
+    decks: int = 4,
+    files_per_deck: int = 10,
+    cards_per_file: int = 50,
+    images_per_file: int = 2,
+    image_bytes: int = 64 * 1024,
+    file_tags: int = 1,
+    seed: int = 0,
+    deck_files: Optional[Sequence[int]] = None,
+) -> Path:
+    """Writes a vault of markdown decks (with images) under ``root``.
+
+    Every card is valid, so the vault builds cleanly. Images are random bytes
+    with a ``.png`` name (incompressible, like real PNGs); each file also gets
+    an ``.svg`` figure, which compresses well. ``deck_files`` gives each
+    deck's file count, in place of ``decks`` decks of ``files_per_deck``.
+    """
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+
+    if deck_files is None:
+        deck_files = [files_per_deck] * decks
+    for deck_index, file_count in enumerate(deck_files):
+        deck_dir = root / f"deck{deck_index}"
+        deck_dir.mkdir(exist_ok=True)
+
+        for file_index in range(file_count):
+            stem = f"d{deck_index}f{file_index}"
+            media = []
+            for image_index in range(images_per_file):
+                image = deck_dir / f"{stem}i{image_index}.png"
+                image.write_bytes(rng.randbytes(image_bytes))
+                media.append(image.name)
+            figure = deck_dir / f"{stem}.svg"
+            figure.write_text(
+                "<svg>"
+                + "".join(f"<rect x='{i}' y='{i}'/>" for i in range(2000))
+                + "</svg>"
+            )
+            media.append(figure.name)
+
+            blocks = []
+            for card_index in range(cards_per_file):
+                if card_index % 3 == 2:
+                    body = f"{_words(rng, 6)} {{{{c1:: {_words(rng, 2)}}}}}"
+                else:
+                    body = f"{_words(rng, 8)}? ::: {_words(rng, 5)}"
+                if card_index < len(media):
+                    body += f" ![fig]({media[card_index]})"
+                footnotes = f"[^uid]: {_uid(rng)}\n"
+                if card_index % 4 == 0:
+                    footnotes += f"[^tag]: t{card_index % 7}\n"
+                blocks.append(f"---\n\n{body}\n\n---\n{footnotes}")
+
+            tags = ["bench", *(f"topic{i}" for i in range(1, file_tags))]
+            (deck_dir / f"{stem}.md").write_text(
+                f"---\ndeck: Bench::Deck{deck_index}\ntags:\n"
+                + "".join(f"  - {tag}\n" for tag in tags)
+                + "---\n"
+                + "\n".join(blocks)
+            )
+
+    return root
@@ -0,0 +1,231 @@
+import sqlite3
+
+from app.config import settings
+from app.logic import validation
+from app.logic import cache as cache_module
+from app.logic import drivers
+from app.logic.cache import FindingsCache, UidStore
+from app.logic import utils
+from app.logic.utils import cache_dir
+from app.logic.validation import iter_findings
+
+CARD = "---\n\nq ::: a\n\n---\n[^uid]: {uid}\n\n"
+
+
+def write_deck(tmp_path, name, *uids, extra=""):
+    path = tmp_path / name
+    path.write_text(
+        "---\ndeck: foo\n---\n" + "".join(CARD.format(uid=u) for u in uids) + extra
+    )
+    return path
+
+
+def check(paths, tmp_path, jobs=1):
+    cache = FindingsCache.open(tmp_path)
+    try:
+        return list(iter_findings(paths, jobs=jobs, cache=cache))
+    finally:
+        cache.close()
+
+
+def count_validations(monkeypatch):
+    validated = []
+    original = validation.validate_file
+
+    def record(path, *args):
+        validated.append(path.name)
+        return original(path, *args)
+
+    monkeypatch.setattr(validation, "validate_file", record)
+    return validated
+
+
+class TestCacheDir:
+    @staticmethod
+    def test_created_hidden_and_ignored(tmp_path):
+        directory = cache_dir(tmp_path)
+        assert directory == tmp_path / settings.CACHE_DIR
+        assert directory.name.startswith(".")
+        assert (directory / ".gitignore").read_text().splitlines()[-1] == "*"
+
+
+class TestFindingsCache:
+    def test_warm_run_revalidates_only_changed_files(self, tmp_path, monkeypatch):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+        b = write_deck(tmp_path, "b.md", "bbbbbbbbbb", extra="no uid ::: here\n")
+        cold = check([a, b], tmp_path)
+
+        validated = count_validations(monkeypatch)
+        assert check([a, b], tmp_path) == cold
+        assert validated == []
+
+        write_deck(tmp_path, "a.md", "aaaaaaaaaa", "cccccccccc")
+        check([a, b], tmp_path)
+        assert validated == ["a.md"]
+
+    def test_duplicates_recomputed_across_cached_files(self, tmp_path):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+        b = write_deck(tmp_path, "b.md", "bbbbbbbbbb")
+        assert check([a, b], tmp_path) == []
+
+        # b is unchanged (cached) but now collides with an edit to a
+        write_deck(tmp_path, "a.md", "bbbbbbbbbb")
+        findings = check([a, b], tmp_path)
+        assert len(findings) == 1
+        assert findings[0].file == b
+        assert f"first seen at {a}:4" in findings[0].message
+
+    def test_cached_matches_uncached(self, tmp_path):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa", "aaaaaaaaaa")
+        b = write_deck(tmp_path, "b.md", "aaaaaaaaaa", extra="---\n\nx ::: y\n")
+        uncached = list(iter_findings([a, b]))
+        assert check([a, b], tmp_path) == uncached  # cold
+        assert check([a, b], tmp_path) == uncached  # warm
+        assert check([a, b], tmp_path, jobs=2) == uncached
+
+    def test_same_vault_by_another_path_hits(self, tmp_path, monkeypatch):
+        vault = tmp_path / "vault"
+        vault.mkdir()
+        check([write_deck(vault, "a.md", "aaaaaaaaaa")], vault)
+        link = tmp_path / "link"
+        link.symlink_to(vault)
+
+        validated = count_validations(monkeypatch)
+        check([link / "a.md"], link)
+        assert validated == []
+
+    @staticmethod
+    def test_prune_drops_other_files(tmp_path):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+        b = write_deck(tmp_path, "b.md", "bbbbbbbbbb")
+        check([a, b], tmp_path)
+        cache = FindingsCache.open(tmp_path)
+        try:
+            cache.prune([a])
+            digest = cache.digest(b)
+            assert cache.get(b, digest) is None
+            assert cache.get(a, cache.digest(a)) is not None
+        finally:
+            cache.close()
+
+    def test_version_change_invalidates(self, tmp_path, monkeypatch):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+        check([a], tmp_path)
+
+        validated = count_validations(monkeypatch)
+        monkeypatch.setattr(settings, "VERSION", "99.0.0")
+        check([a], tmp_path)
+        assert validated == ["a.md"]
+
+
+class TestUidStore:
+    @staticmethod
+    def test_sync_and_find(tmp_path):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa", "bbbbbbbbbb")
+        store = UidStore.open(tmp_path)
+        store.sync([a])
+        assert store.find("bbbbbbbbbb") == [(a, 11)]
+        assert "aaaaaaaaaa" in store
+        assert "cccccccccc" not in store
+        store.close()
+
+        # persisted across runs
+        store = UidStore.open(tmp_path)
+        assert store.find("aaaaaaaaaa") == [(a, 4)]
+        store.close()
+
+    @staticmethod
+    def test_sync_rescans_only_changed_files(tmp_path, monkeypatch):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+        b = write_deck(tmp_path, "b.md", "bbbbbbbbbb")
+        store = UidStore.open(tmp_path)
+        store.sync([a, b])
+
+        scanned = []
+        original = cache_module.scan_uids
+
+        def record(path):
+            scanned.append(path.name)
+            return original(path)
+
+        monkeypatch.setattr(cache_module, "scan_uids", record)
+        store.sync([a, b])
+        assert scanned == []
+
+        write_deck(tmp_path, "a.md", "cccccccccc", "aaaaaaaaaa")
+        store.sync([a, b])
+        assert scanned == ["a.md"]
+        assert store.find("aaaaaaaaaa") == [(a, 11)]
+        store.close()
+
+    @staticmethod
+    def test_complete_sync_forgets_other_files(tmp_path):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+        b = write_deck(tmp_path, "b.md", "bbbbbbbbbb")
+        store = UidStore.open(tmp_path)
+        store.sync([a, b])
+        b.unlink()
+        store.sync([a])
+        assert store.find("bbbbbbbbbb") == [(b, 4)]  # a partial sync keeps it
+        store.sync([a], complete=True)
+        assert store.find("bbbbbbbbbb") == []
+        store.close()
+
+    @staticmethod
+    def test_extract_indexes_from_validation(tmp_path, monkeypatch):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa", "bbbbbbbbbb")
+        monkeypatch.setattr(cache_module, "scan_uids", None)  # never called
+        findings, _ = drivers.extract_decks(["foo"], tmp_path, None)
+        assert findings == []
+
+        store = UidStore.open(tmp_path)
+        assert store.stale([a]) == {}
+        assert store.find("bbbbbbbbbb") == [(a, 11)]
+        store.close()
+
+    @staticmethod
+    def test_collisions_outside_scope(tmp_path):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa", "bbbbbbbbbb")
+        b = write_deck(tmp_path, "b.md", "bbbbbbbbbb")
+        c = write_deck(tmp_path, "c.md", "cccccccccc")
+        store = UidStore.open(tmp_path)
+        store.sync([a, b, c])
+        index = store.collisions([a])
+        assert len(index) == 1
+        assert index.first_seen("bbbbbbbbbb") == (b, 4)
+        store.close()
+
+    @staticmethod
+    def test_new_uid_avoids_indexed_and_issued(tmp_path, monkeypatch):
+        a = write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+        store = UidStore.open(tmp_path)
+        store.sync([a])
+        drawn = iter(["aaaaaaaaaa", "bbbbbbbbbb", "bbbbbbbbbb", "cccccccccc"])
+        monkeypatch.setattr(
+            cache_module, "generate_random_string", lambda length: next(drawn)
+        )
+        assert store.new_uid() == "bbbbbbbbbb"
+        assert store.new_uid() == "cccccccccc"
+        store.close()
+
+
+def test_read_only_index_falls_back_to_memory(tmp_path, monkeypatch):
+    """An index file that exists but cannot be written (a read-only
+    checkout) is left alone; the run uses an in-memory index."""
+    write_deck(tmp_path, "a.md", "aaaaaaaaaa")
+    store = UidStore.open(tmp_path)
+    store.close()
+    connect = sqlite3.connect
+
+    def read_only(database, *args, **kwargs):
+        if database == ":memory:":
+            return connect(database, *args, **kwargs)
+        return connect(f"file:{database}?mode=ro", *args, uri=True, **kwargs)
+
+    monkeypatch.setattr(utils.sqlite3, "connect", read_only)
+    store = UidStore.open(tmp_path)
+    try:
+        store.sync([tmp_path / "a.md"])
+        assert store.find("aaaaaaaaaa") == [(tmp_path / "a.md", 4)]
+    finally:
+        store.close()
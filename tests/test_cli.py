@@ -1,11 +1,37 @@
+import errno
+import json
 import re
+import shutil
+import sqlite3
+import subprocess
+import zipfile
+from pathlib import Path
 
+import pytest
+from genanki.apkg_col import APKG_COL
+from genanki.apkg_schema import APKG_SCHEMA
 from typer.testing import CliRunner
 
 from app.cli.entry import app
+from app.logic import drivers, utils
+from app.logic.sources import Deck
+from app.logic.validation import findings_to_dicts, format_findings, validate_files
 
 runner = CliRunner()
 
+REPO = Path(__file__).parent.parent
+
+
+@pytest.fixture(autouse=True)
+def scratch_checkout(tmp_path_factory, monkeypatch):
+    """Runs every command from a scratch copy of the sample decks, so the
+    packages and caches it writes land there instead of in the repo."""
+    root = tmp_path_factory.mktemp("checkout")
+    shutil.copytree(REPO / "tests" / "decks", root / "tests" / "decks")
+    shutil.copytree(REPO / "examples", root / "examples")
+    monkeypatch.chdir(root)
+    return root
+
 
 class TestEntry:
     @staticmethod
@@ -92,6 +118,60 @@ class TestCheck:
         assert result.exit_code == 1
         assert "Not a valid source selection." in result.stdout
 
+    @staticmethod
+    def _broken_deck(tmp_path):
+        body = "".join(f"---\n\nq{i} ::: a{i}\n\n---\n\n" for i in range(3))
+        (tmp_path / "d.md").write_text("---\ndeck: broken\n---\n" + body)
+        return ["check", "--deck", "broken", "--path", str(tmp_path)]
+
+    def test_check_json_matches_findings(self, tmp_path):
+        args = self._broken_deck(tmp_path)
+        result = runner.invoke(app, [*args, "--format", "json"])
+        assert result.exit_code == 1
+        findings = validate_files([tmp_path / "d.md"])
+        assert result.stdout == json.dumps(findings_to_dicts(findings), indent=2) + "\n"
+
+    def test_check_slowest_report(self, tmp_path):
+        args = self._broken_deck(tmp_path)
+        result = runner.invoke(app, [*args, "--slowest", "3"])
+        assert result.exit_code == 1
+        report = result.stdout.split("slowest 3 file(s):\n")[1].splitlines()
+        assert len(report) == 1 and "d.md  (validate " in report[0]
+
+    def test_check_jsonl_one_object_per_line(self, tmp_path):
+        args = self._broken_deck(tmp_path)
+        result = runner.invoke(app, [*args, "--format", "jsonl"])
+        assert result.exit_code == 1
+        lines = result.stdout.splitlines()
+        assert len(lines) == 3
+        assert all(json.loads(line)["level"] == "error" for line in lines)
+
+    def test_check_rejects_unknown_format(self, tmp_path):
+        args = self._broken_deck(tmp_path)
+        result = runner.invoke(app, [*args, "--format", "yaml"])
+        assert result.exit_code == 2
+        assert "Invalid value for '--format'" in result.output
+
+    def test_check_max_findings(self, tmp_path):
+        args = self._broken_deck(tmp_path)
+        result = runner.invoke(app, [*args, "--max-findings", "2"])
+        assert result.exit_code == 1
+        assert result.stdout.count("missing uid") == 2
+        assert "stopped after 2 finding(s)" in result.stdout
+        assert "2 error(s)" in result.stdout
+
+    def test_check_parallel_jobs(self, tmp_path):
+        args = self._broken_deck(tmp_path)
+        serial = runner.invoke(app, args)
+        parallel = runner.invoke(app, [*args, "--jobs", "2"])
+        assert parallel.exit_code == 1
+        assert parallel.stdout == serial.stdout
+
+    def test_check_max_findings_not_reached(self, tmp_path):
+        args = self._broken_deck(tmp_path)
+        result = runner.invoke(app, [*args, "--max-findings", "3"])
+        assert "stopped after" not in result.stdout
+
 
 DRAFT_DECK = "---\ndeck: drafty\n---\n" "\nq1 ::: a1\n\n---\n\nq2 ::: a2\n\n---\n"
 
@@ -204,3 +284,556 @@ class TestBuild:
         )
         assert result.exit_code == 1
         assert "silently dropped" in result.stdout
+
+    @staticmethod
+    def test_build_errors_match_check(tmp_path):
+        deck_dir = tmp_path / "drafty"
+        deck_dir.mkdir()
+        (deck_dir / "d.md").write_text(DRAFT_DECK)
+        result = runner.invoke(
+            app, ["build", "--deck", "drafty", "--path", str(tmp_path)]
+        )
+        expected = format_findings(validate_files([deck_dir / "d.md"]))
+        assert result.exit_code == 1
+        assert result.stdout == expected + "\n"
+
+    @staticmethod
+    def test_build_compiles_from_the_validation_pass(tmp_path, monkeypatch):
+        def reread(self):
+            raise AssertionError(f"{self.name} was parsed again to compile")
+
+        monkeypatch.setattr(Deck, "get_source_files", reread)
+        result = runner.invoke(
+            app,
+            ["build", "--deck", "foo", "--path", "tests", "--output", str(tmp_path)],
+        )
+        assert result.exit_code == 0
+        assert (tmp_path / "foo.apkg").is_file()
+
+    @staticmethod
+    def test_build_file_timeout_names_the_file(tmp_path):
+        (tmp_path / "slow.md").write_text(
+            "---\ndeck: slow\n---\n" + "---\n\nx {{c1::y\n" * 8000
+        )
+        result = runner.invoke(
+            app,
+            [
+                "build",
+                "--deck",
+                "slow",
+                "--path",
+                str(tmp_path),
+                "--file-timeout",
+                "0.2",
+                "--slowest",
+                "1",
+            ],
+        )
+        assert result.exit_code == 1
+        assert "slow.md: error: validation took longer" in result.stdout
+        assert "slowest 1 file(s):" in result.stdout
+
+    @staticmethod
+    def test_build_incremental_rebuild(tmp_path):
+        out = tmp_path / "dist"
+        out.mkdir()
+        args = ["build", "--deck", "foo", "--path", "tests", "--output", str(out)]
+        assert runner.invoke(app, args).exit_code == 0
+        result = runner.invoke(app, [*args, "--incremental"])
+        assert result.exit_code == 0
+        assert [p.name for p in out.iterdir()] == ["foo.apkg"]  # no temp left
+
+    @staticmethod
+    def test_build_bundle_stores_shared_media_once(tmp_path):
+        vault = tmp_path / "vault"
+        vault.mkdir()
+        (vault / "shared.png").write_bytes(b"png")
+        for name in ("a", "b"):
+            (vault / f"{name}.md").write_text(
+                f"---\ndeck: Parent::{name}\n---\n"
+                f"---\n\n{name}? ::: ![img](shared.png)\n\n---\n"
+                f"[^uid]: {name * 10}\n"
+            )
+        bundle = tmp_path / "all.apkg"
+        result = runner.invoke(
+            app, ["build", "--all", "--path", str(vault), "--bundle", str(bundle)]
+        )
+        assert result.exit_code == 0
+        with zipfile.ZipFile(bundle) as package:
+            assert json.loads(package.read("media")) == {"0": "shared.png"}
+            (tmp_path / "col.anki2").write_bytes(package.read("collection.anki2"))
+        conn = sqlite3.connect(tmp_path / "col.anki2")
+        try:
+            (decks,) = conn.execute("SELECT decks FROM col").fetchone()
+            names = {deck["name"] for deck in json.loads(decks).values()}
+            assert {"Parent::a", "Parent::b"} <= names
+            assert conn.execute("SELECT COUNT(*) FROM notes").fetchone() == (2,)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def test_build_delta_from(tmp_path):
+        vault = tmp_path / "vault"
+        vault.mkdir()
+        (vault / "a.png").write_bytes(b"a")
+        (vault / "b.png").write_bytes(b"b")
+        deck = vault / "d.md"
+        deck.write_text(
+            "---\ndeck: d\n---\n"
+            "---\n\none ::: ![a](a.png)\n\n---\n[^uid]: aaaaaaaaaa\n"
+            "---\n\ntwo ::: ![b](b.png)\n\n---\n[^uid]: bbbbbbbbbb\n"
+        )
+        v1, v2 = tmp_path / "v1", tmp_path / "v2"
+        v1.mkdir()
+        v2.mkdir()
+        args = ["build", "--deck", "d", "--path", str(vault)]
+        fingerprints = tmp_path / "v1.json"
+        result = runner.invoke(
+            app, [*args, "--output", str(v1), "--fingerprints", str(fingerprints)]
+        )
+        assert result.exit_code == 0
+
+        deck.write_text(deck.read_text().replace("two :::", "two, edited :::"))
+        for baseline in (v1 / "d.apkg", fingerprints):
+            result = runner.invoke(
+                app, [*args, "--output", str(v2), "--delta-from", str(baseline)]
+            )
+            assert result.exit_code == 0
+            with zipfile.ZipFile(v2 / "d.apkg") as package:
+                assert json.loads(package.read("media")) == {"0": "b.png"}
+                (tmp_path / "col.anki2").write_bytes(package.read("collection.anki2"))
+            conn = sqlite3.connect(tmp_path / "col.anki2")
+            try:
+                guids = conn.execute("SELECT guid FROM notes").fetchall()
+            finally:
+                conn.close()
+            assert guids == [("bbbbbbbbbb",)]
+
+        result = runner.invoke(app, [*args, "--delta-from", str(tmp_path / "none")])
+        assert result.exit_code == 1
+        assert "No package or fingerprint file" in result.stdout
+
+    @staticmethod
+    def _decks(vault, count):
+        vault.mkdir()
+        for i in range(count):
+            blocks = "".join(
+                f"---\n\nq{j} ::: a\n\n---\n[^uid]: d{i}c{j:07d}\n"
+                for j in range(i + 1)
+            )
+            (vault / f"d{i}.md").write_text(f"---\ndeck: d{i}\n---\n{blocks}")
+
+    def test_build_jobs_matches_serial(self, tmp_path, monkeypatch):
+        vault = tmp_path / "vault"
+        self._decks(vault, 4)
+        # Decks are costed from their chunks, not by reading their files again.
+        monkeypatch.setattr(drivers, "estimate_costs", None)
+        args = ["build", "--all", "--path", str(vault), "--output", str(tmp_path)]
+        serial, parallel = tmp_path / "serial.json", tmp_path / "parallel.json"
+        result = runner.invoke(app, [*args, "--fingerprints", str(serial)])
+        assert result.exit_code == 0
+        result = runner.invoke(
+            app,
+            [*args, "--jobs", "2", "--fingerprints", str(parallel), "--slowest", "1"],
+        )
+        assert result.exit_code == 0
+        assert "slowest 1 file(s):" in result.stdout
+        assert json.loads(parallel.read_text()) == json.loads(serial.read_text())
+
+    def test_build_shards_then_merge(self, tmp_path):
+        vault = tmp_path / "vault"
+        self._decks(vault, 5)
+        for shard in ("1/2", "2/2"):
+            result = runner.invoke(
+                app,
+                ["build", "--all", "--path", str(vault), "--output", str(tmp_path)]
+                + ["--shard", shard],
+            )
+            assert result.exit_code == 0
+        assert sorted(p.name for p in tmp_path.glob("*.apkg")) == [
+            f"d{i}.apkg" for i in range(5)
+        ]
+        shards = [json.loads(p.read_text()) for p in sorted(tmp_path.glob("shard-*"))]
+        assert [sorted(shard["decks"]) for shard in shards] == [
+            ["d0", "d1", "d4"],
+            ["d2", "d3"],
+        ]
+
+        merged = tmp_path / "manifest.json"
+        result = runner.invoke(
+            app,
+            ["merge-manifests", *map(str, sorted(tmp_path.glob("shard-*")))]
+            + ["--output", str(merged)],
+        )
+        assert result.exit_code == 0
+        assert "5 deck(s), 15 note(s)" in result.stdout
+        assert json.loads(merged.read_text())["decks"]["d4"] == {
+            "package": "d4.apkg",
+            "notes": 5,
+            "cards": 5,
+        }
+
+        result = runner.invoke(
+            app, ["merge-manifests", str(tmp_path / "shard-1-of-2.json")]
+        )
+        assert result.exit_code == 1
+        assert "Missing shard(s) [2] of 2" in result.stdout
+
+    @staticmethod
+    def test_build_shard_misuse():
+        result = runner.invoke(app, ["build", "--all", "--shard", "3/2"])
+        assert result.exit_code == 1
+        assert "Not a shard" in result.stdout
+        result = runner.invoke(app, ["build", "--deck", "foo", "--shard", "1/2"])
+        assert result.exit_code == 1
+        assert "cannot be used with --deck" in result.stdout
+
+    @staticmethod
+    def test_build_renderer(tmp_path):
+        (tmp_path / "r.md").write_text(
+            "---\ndeck: r\n---\n---\n\n**Q**? ::: $x^2$\n\n---\n[^uid]: rrrrrrrrrr\n"
+        )
+        args = ["build", "--deck", "r", "--path", str(tmp_path)]
+        result = runner.invoke(
+            app, [*args, "--output", str(tmp_path), "--renderer", "markdown-it"]
+        )
+        assert result.exit_code == 0
+        with zipfile.ZipFile(tmp_path / "r.apkg") as package:
+            (tmp_path / "col.anki2").write_bytes(package.read("collection.anki2"))
+        conn = sqlite3.connect(tmp_path / "col.anki2")
+        try:
+            (flds,) = conn.execute("SELECT flds FROM notes").fetchone()
+        finally:
+            conn.close()
+        assert flds.split("\x1f")[:2] == [
+            "<p><strong>Q</strong>?</p>",
+            '<p><span class="arithmatex">\\(x^2\\)</span></p>',
+        ]
+
+        result = runner.invoke(app, [*args, "--renderer", "mistune"])
+        assert result.exit_code == 2
+
+    @staticmethod
+    def test_build_renderer_image_names(tmp_path):
+        # markdown-it percent-encodes the src; the media is still found.
+        (tmp_path / "résumé.png").write_bytes(b"one")
+        (tmp_path / "my pic.png").write_bytes(b"two")
+        (tmp_path / "i.md").write_text(
+            "---\ndeck: i\n---\n---\n\n![a](résumé.png) ::: ![b](<my pic.png>)"
+            "\n\n---\n[^uid]: iiiiiiiiii\n"
+        )
+        for renderer in ("markdown", "markdown-it"):
+            result = runner.invoke(
+                app,
+                ["build", "--deck", "i", "--path", str(tmp_path)]
+                + ["--output", str(tmp_path), "--renderer", renderer],
+            )
+            assert result.exit_code == 0, result.output
+            with zipfile.ZipFile(tmp_path / "i.apkg") as package:
+                media = json.loads(package.read("media"))
+            assert sorted(media.values()) == ["my pic.png", "résumé.png"]
+
+
+class TestStats:
+    @staticmethod
+    def test_stats_json():
+        result = runner.invoke(
+            app, ["stats", "--deck", "foo", "--path", "tests", "--format", "json"]
+        )
+        assert result.exit_code == 0
+        data = json.loads(result.stdout)
+        assert list(data["decks"]) == ["foo"]
+        assert data["total"]["notes"] > 0
+
+    @staticmethod
+    def test_stats_invalid_selection():
+        result = runner.invoke(app, ["stats", "--deck", "nope", "--path", "tests"])
+        assert result.exit_code == 1
+        assert "No source files for deck nope" in result.stdout
+
+    @staticmethod
+    def test_stats_reports_the_real_error(tmp_path):
+        (tmp_path / "bad.md").write_bytes(b"---\ndeck: bad\n---\n\xff\n")
+        result = runner.invoke(app, ["stats", "--all", "--path", str(tmp_path)])
+        assert result.exit_code == 1
+        assert "can't decode byte 0xff" in result.stdout
+
+
+class TestCheckCache:
+    @staticmethod
+    def test_check_with_cache_twice(tmp_path):
+        (tmp_path / "d.md").write_text(
+            "---\ndeck: foo\n---\n---\n\nq ::: a\n\n---\n[^uid]: abc1234567\n"
+        )
+        args = ["check", "--deck", "foo", "--path", str(tmp_path), "--cache"]
+        first = runner.invoke(app, args)
+        second = runner.invoke(app, args)
+        assert first.exit_code == second.exit_code == 0
+        assert second.stdout == first.stdout
+        assert (tmp_path / ".ankc-cache" / "findings.sqlite").is_file()
+
+    @staticmethod
+    def test_check_all_prunes_removed_files(tmp_path):
+        for name in ("a", "b"):
+            (tmp_path / f"{name}.md").write_text(
+                f"---\ndeck: {name}\n---\n---\n\nq ::: a\n\n---\n"
+                f"[^uid]: {name * 10}\n"
+            )
+        args = ["check", "--path", str(tmp_path), "--cache"]
+        assert runner.invoke(app, [*args, "--all"]).exit_code == 0
+        (tmp_path / "b.md").unlink()
+        assert runner.invoke(app, [*args, "--deck", "a"]).exit_code == 0
+
+        def keys():
+            conn = sqlite3.connect(tmp_path / ".ankc-cache" / "findings.sqlite")
+            try:
+                return sorted(
+                    key for (key,) in conn.execute("SELECT path FROM reports")
+                )
+            finally:
+                conn.close()
+
+        assert keys() == ["a.md", "b.md"]  # one deck tells nothing of the rest
+        assert runner.invoke(app, [*args, "--all"]).exit_code == 0
+        assert keys() == ["a.md"]
+
+
+class TestReadOnlyVault:
+    @staticmethod
+    def _read_only(monkeypatch):
+        def refuse(search_path):
+            raise OSError(errno.EROFS, "Read-only file system", str(search_path))
+
+        monkeypatch.setattr(utils, "cache_dir", refuse)
+
+    def test_check_runs_uncached(self, tmp_path, monkeypatch):
+        (tmp_path / "d.md").write_text(
+            "---\ndeck: foo\n---\n---\n\nq ::: a\n\n---\n[^uid]: abc1234567\n"
+        )
+        self._read_only(monkeypatch)
+        for extra in ([], ["--cache"]):
+            result = runner.invoke(
+                app, ["check", "--all", "--path", str(tmp_path), *extra]
+            )
+            assert result.exit_code == 0
+            assert "no problems found" in result.stdout
+        assert not (tmp_path / ".ankc-cache").exists()
+
+    def test_list_runs_uncached(self, tmp_path, monkeypatch):
+        self._read_only(monkeypatch)
+        result = runner.invoke(app, ["list", "deck", "--path", "tests"])
+        assert result.exit_code == 0
+        assert "foo" in result.stdout
+
+
+class TestUidIndex:
+    @staticmethod
+    def _deck(path, *uids):
+        path.write_text(
+            "---\ndeck: foo\n---\n"
+            + "".join(f"---\n\nq ::: a\n\n---\n[^uid]: {uid}\n\n" for uid in uids)
+        )
+
+    def test_find(self, tmp_path):
+        self._deck(tmp_path / "a.md", "aaaaaaaaaa")
+        (tmp_path / "sub").mkdir()
+        self._deck(tmp_path / "sub" / "b.md", "bbbbbbbbbb", "cccccccccc")
+        result = runner.invoke(
+            app, ["uid", "--find", "cccccccccc", "--path", str(tmp_path)]
+        )
+        assert result.exit_code == 0
+        assert result.stdout == f"{tmp_path / 'sub' / 'b.md'}:11\n"
+
+        # an edit since the last lookup is picked up
+        self._deck(tmp_path / "a.md", "cccccccccc")
+        result = runner.invoke(
+            app, ["uid", "--find", "cccccccccc", "--path", str(tmp_path)]
+        )
+        assert result.stdout.splitlines() == [
+            f"{tmp_path / 'a.md'}:4",
+            f"{tmp_path / 'sub' / 'b.md'}:11",
+        ]
+
+    def test_find_missing(self, tmp_path):
+        self._deck(tmp_path / "a.md", "aaaaaaaaaa")
+        result = runner.invoke(
+            app, ["uid", "--find", "zzzzzzzzzz", "--path", str(tmp_path)]
+        )
+        assert result.exit_code == 1
+        assert "uid 'zzzzzzzzzz' not found" in result.stdout
+
+    def test_stamp_skips_indexed_uids(self, tmp_path, monkeypatch):
+        self._deck(tmp_path / "a.md", "aaaaaaaaaa")
+        (tmp_path / "b.md").write_text("---\ndeck: foo\n---\n---\n\nq ::: a\n\n---\n")
+        drawn = iter(["aaaaaaaaaa", "aaaaaaaaaa", "dddddddddd"])
+        monkeypatch.setattr(
+            "app.logic.cache.generate_random_string", lambda length: next(drawn)
+        )
+        result = runner.invoke(app, ["uid", "--force", "--path", str(tmp_path)])
+        assert result.exit_code == 0
+        assert "[^uid]: dddddddddd" in (tmp_path / "b.md").read_text()
+
+        result = runner.invoke(
+            app, ["uid", "--find", "dddddddddd", "--path", str(tmp_path)]
+        )
+        assert result.stdout == f"{tmp_path / 'b.md'}:4\n"
+
+
+class TestChangedSince:
+    @staticmethod
+    def _git(repo, *args):
+        subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+    def _vault(self, root):
+        self._git(root, "init")
+        self._git(root, "config", "user.email", "t@t.t")
+        self._git(root, "config", "user.name", "t")
+        for deck, uid in (("one", "aaaaaaaaaa"), ("two", "bbbbbbbbbb")):
+            (root / f"{deck}.md").write_text(
+                f"---\ndeck: {deck}\n---\n---\n\nq ::: a\n\n---\n[^uid]: {uid}\n"
+            )
+        self._git(root, "add", ".")
+        self._git(root, "commit", "-m", "base")
+
+    def test_check_only_changed_files(self, tmp_path):
+        self._vault(tmp_path)
+        (tmp_path / "one.md").write_text(
+            "---\ndeck: one\n---\n---\n\nq ::: a\n\n---\n"  # lost its uid
+        )
+        (tmp_path / "two.md").write_text("---\ntags: [x]\n---\n")  # not a deck now
+        result = runner.invoke(
+            app, ["check", "--path", str(tmp_path), "--changed-since", "HEAD"]
+        )
+        assert result.exit_code == 1
+        assert "one.md:4: error: card block missing uid" in result.stdout
+        assert "two.md" not in result.stdout
+
+    def test_check_catches_collision_with_indexed_file(self, tmp_path):
+        self._vault(tmp_path)
+        runner.invoke(app, ["check", "--all", "--path", str(tmp_path)])
+        (tmp_path / "one.md").write_text(
+            "---\ndeck: one\n---\n---\n\nq ::: a\n\n---\n[^uid]: bbbbbbbbbb\n"
+        )
+        result = runner.invoke(
+            app, ["check", "--path", str(tmp_path), "--changed-since", "HEAD"]
+        )
+        assert result.exit_code == 1
+        assert "duplicate uid 'bbbbbbbbbb'" in result.stdout
+        assert "two.md:4" in result.stdout
+
+    def test_check_catches_collision_on_fresh_checkout(self, tmp_path):
+        self._vault(tmp_path)
+        assert not (tmp_path / ".ankc-cache").exists()
+        (tmp_path / "one.md").write_text(
+            "---\ndeck: one\n---\n---\n\nq ::: a\n\n---\n[^uid]: bbbbbbbbbb\n"
+        )
+        result = runner.invoke(
+            app, ["check", "--path", str(tmp_path), "--changed-since", "HEAD"]
+        )
+        assert result.exit_code == 1
+        assert "duplicate uid 'bbbbbbbbbb'" in result.stdout
+        assert "two.md:4" in result.stdout
+
+    def test_uid_only_stamps_changed_files(self, tmp_path):
+        self._vault(tmp_path)
+        self._git(tmp_path, "tag", "base")
+        for name in ("one.md", "two.md"):
+            text = (tmp_path / name).read_text()
+            (tmp_path / name).write_text(text + "\n---\n\nnew ::: card\n\n---\n")
+        self._git(tmp_path, "commit", "-am", "untouched two")
+        self._git(tmp_path, "checkout", "-q", "base", "--", "two.md")
+        self._git(tmp_path, "commit", "-qm", "revert two")
+        result = runner.invoke(
+            app, ["uid", "--path", str(tmp_path), "--changed-since", "base"]
+        )
+        assert result.exit_code == 0
+        assert "one.md: stamped 1 uid(s)" in result.stdout
+        assert "two.md" not in result.stdout
+
+    def test_build_only_changed_decks(self, tmp_path):
+        self._vault(tmp_path)
+        (tmp_path / "two.md").write_text(
+            (tmp_path / "two.md").read_text().replace("q ::: a", "q2 ::: a2")
+        )
+        out = tmp_path / "dist"
+        out.mkdir()
+        args = ["build", "--path", str(tmp_path), "--output", str(out)]
+        result = runner.invoke(app, [*args, "--changed-since", "HEAD"])
+        assert result.exit_code == 0
+        assert [p.name for p in out.glob("*.apkg")] == ["two.apkg"]
+
+        self._git(tmp_path, "commit", "-qam", "two")
+        result = runner.invoke(app, [*args, "--changed-since", "HEAD"])
+        assert result.exit_code == 0
+        assert "No selected deck has changed" in result.stdout
+
+    def test_bad_ref_is_reported(self, tmp_path):
+        self._vault(tmp_path)
+        result = runner.invoke(
+            app, ["check", "--path", str(tmp_path), "--changed-since", "nope"]
+        )
+        assert result.exit_code == 1
+        assert "git could not diff against 'nope'" in result.stdout
+
+    def test_diff_revisions(self, tmp_path):
+        self._vault(tmp_path)
+        (tmp_path / "one.md").write_text(
+            "---\ndeck: one\n---\n---\n\nq ::: edited\n\n---\n[^uid]: aaaaaaaaaa\n"
+            "---\n\nnew ::: card\n\n---\n[^uid]: cccccccccc\n"
+        )
+        (tmp_path / "two.md").unlink()
+        self._git(tmp_path, "commit", "-qam", "edit")
+        (tmp_path / "one.md").write_text("")  # the working tree is not read
+
+        result = runner.invoke(
+            app, ["diff", "HEAD~1", "HEAD", "--path", str(tmp_path), "--format", "json"]
+        )
+        assert result.exit_code == 0
+        assert json.loads(result.stdout) == [
+            {"uid": "aaaaaaaaaa", "change": "changed"},
+            {"uid": "cccccccccc", "change": "added"},
+            {"uid": "bbbbbbbbbb", "change": "removed"},
+        ]
+
+        package = tmp_path / "out"
+        package.mkdir()
+        self._git(tmp_path, "checkout", "-q", "HEAD~1", "--", ".")
+        runner.invoke(
+            app,
+            [
+                "build",
+                "--all",
+                "--path",
+                str(tmp_path),
+                "--bundle",
+                str(package / "all.apkg"),
+            ],
+        )
+        result = runner.invoke(
+            app, ["diff", str(package / "all.apkg"), "HEAD~1", "--path", str(tmp_path)]
+        )
+        assert result.exit_code == 0
+        assert result.stdout == "0 added, 0 changed, 0 removed\n"
+
+
+class TestSync:
+    @staticmethod
+    def test_sync_reports_changes(tmp_path):
+        collection = tmp_path / "collection.anki2"
+        conn = sqlite3.connect(collection)
+        conn.executescript(APKG_SCHEMA)
+        conn.executescript(APKG_COL)
+        conn.close()
+        args = ["sync", "--deck", "foo", "--path", "tests"]
+
+        result = runner.invoke(app, [*args, "--collection", str(collection)])
+        assert result.exit_code == 0
+        assert "0 updated, 0 unchanged" in result.stdout
+        result = runner.invoke(app, [*args, "--collection", str(collection)])
+        assert result.exit_code == 0
+        assert "0 note(s) added, 0 updated" in result.stdout
+
+        missing = tmp_path / "missing.anki2"
+        result = runner.invoke(app, [*args, "--collection", str(missing)])
+        assert result.exit_code == 1
+        assert "No Anki collection" in result.stdout
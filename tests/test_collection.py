@@ -0,0 +1,247 @@
+import hashlib
+import json
+import sqlite3
+
+import pytest
+from genanki.apkg_col import APKG_COL
+from genanki.apkg_schema import APKG_SCHEMA
+
+from app.logic.collection import _field_checksum, media_dir, sync_collection
+from app.logic.sources import Deck
+
+DECK = """---
+deck: synced
+---
+---
+
+first? ::: one ![img](pic.png)
+
+---
+[^uid]: aaaaaaaaaa
+---
+
+{{c1::second}} note
+
+---
+[^uid]: bbbbbbbbbb
+"""
+
+
+def make_collection(path):
+    """An empty collection in the legacy schema packages carry."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(APKG_SCHEMA)
+        conn.executescript(APKG_COL)
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def make_modern_collection(path, stores=()):
+    """A collection in the schema Anki 2.1.28+ migrates to, holding the
+    decks and note types of ``stores`` (as after importing their package).
+    Names use Anki's own ``unicase`` collation, which ankc does not have."""
+    make_collection(path)
+    conn = sqlite3.connect(path)
+    conn.create_collation(
+        "unicase",
+        lambda a, b: (a.casefold() > b.casefold()) - (a.casefold() < b.casefold()),
+    )
+    try:
+        conn.executescript("""
+            UPDATE col SET ver = 18, models = '', decks = '', conf = '';
+            CREATE TABLE config (KEY text NOT NULL PRIMARY KEY, usn integer
+                NOT NULL, mtime_secs integer NOT NULL, val blob NOT NULL);
+            INSERT INTO config VALUES ('nextPos', 0, 0, CAST('7' AS blob));
+            CREATE TABLE notetypes (id integer PRIMARY KEY, name text NOT NULL
+                COLLATE unicase, mtime_secs integer, usn integer, config blob);
+            CREATE UNIQUE INDEX idx_notetypes_name ON notetypes (name);
+            CREATE TABLE fields (ntid integer, ord integer, name text NOT NULL
+                COLLATE unicase, config blob, PRIMARY KEY (ntid, ord));
+            CREATE TABLE decks (id integer PRIMARY KEY, name text NOT NULL
+                COLLATE unicase, mtime_secs integer, usn integer, common blob,
+                kind blob);
+            CREATE UNIQUE INDEX idx_decks_name ON decks (name);
+            """)
+        for store in stores:
+            conn.execute(
+                "INSERT INTO decks VALUES (?, ?, 0, 0, x'', x'')",
+                (store.deck_id, store.name),
+            )
+            for model in store.models:
+                conn.execute(
+                    "INSERT OR IGNORE INTO notetypes VALUES (?, ?, 0, 0, x'')",
+                    (model.model_id, model.name),
+                )
+                for ord_, field in enumerate(model.fields):
+                    conn.execute(
+                        "INSERT OR IGNORE INTO fields VALUES (?, ?, ?, x'')",
+                        (model.model_id, ord_, field["name"]),
+                    )
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def package_contents(vault):
+    source = Deck(name="synced", source_search_path=vault, source_search_depth=None)
+    return source.package_contents()
+
+
+def sync(vault, collection, timestamp):
+    store, media = package_contents(vault)
+    return sync_collection(collection, [store], media, timestamp=timestamp)
+
+
+def rows(collection, query):
+    conn = sqlite3.connect(collection)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def vault(tmp_path):
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "deck.md").write_text(DECK)
+    (vault / "pic.png").write_bytes(b"png")
+    return vault
+
+
+class TestSyncCollection:
+    @staticmethod
+    def test_first_sync_adds_notes_models_and_media(vault, tmp_path):
+        collection = make_collection(tmp_path / "collection.anki2")
+        result = sync(vault, collection, timestamp=1000)
+        assert (result.added, result.updated, result.unchanged) == (2, 0, 0)
+        assert result.cards_added == 2
+        assert result.media_copied == 1
+        assert (media_dir(collection) / "pic.png").read_bytes() == b"png"
+
+        models, decks = rows(collection, "SELECT models, decks FROM col")[0]
+        assert {"1764365620", "1783507665"} <= set(json.loads(models))
+        assert "synced" in {deck["name"] for deck in json.loads(decks).values()}
+        assert sorted(rows(collection, "SELECT guid FROM notes")) == [
+            ("aaaaaaaaaa",),
+            ("bbbbbbbbbb",),
+        ]
+
+    @staticmethod
+    def test_resync_touches_only_changed_notes(vault, tmp_path):
+        collection = make_collection(tmp_path / "collection.anki2")
+        sync(vault, collection, timestamp=1000)
+        cards_before = rows(collection, "SELECT id, nid, ord FROM cards ORDER BY id")
+
+        result = sync(vault, collection, timestamp=2000)
+        assert (result.added, result.updated, result.unchanged) == (0, 0, 2)
+        assert result.media_copied == 0
+        # col.mod (milliseconds) only moves when something changed
+        assert rows(collection, "SELECT mod FROM col") == [(1000 * 1000,)]
+
+        edited = DECK.replace("{{c1::second}} note", "{{c1::second}} {{c2::x}}")
+        (vault / "deck.md").write_text(edited)
+        result = sync(vault, collection, timestamp=3000)
+        assert (result.added, result.updated, result.unchanged) == (0, 1, 1)
+        assert result.cards_added == 1  # just the new cloze
+
+        mods = dict(rows(collection, "SELECT guid, mod FROM notes"))
+        assert mods == {"aaaaaaaaaa": 1000, "bbbbbbbbbb": 3000}
+        cards_after = rows(collection, "SELECT id, nid, ord FROM cards ORDER BY id")
+        assert cards_after[:2] == cards_before  # review history kept
+        assert cards_after[2][2] == 1
+
+    @staticmethod
+    def test_new_cards_queue_after_next_pos(vault, tmp_path):
+        collection = make_collection(tmp_path / "collection.anki2")
+        sync(vault, collection, timestamp=1000)
+        dues = rows(
+            collection, "SELECT n.guid, c.due FROM notes n JOIN cards c ON c.nid = n.id"
+        )
+        assert sorted(dues) == [("aaaaaaaaaa", 1), ("bbbbbbbbbb", 2)]
+
+        # A new sibling joins its note's position; a new note takes the next.
+        edited = DECK.replace("{{c1::second}} note", "{{c1::second}} {{c2::x}}")
+        (vault / "deck.md").write_text(
+            edited + "---\n\nq ::: a\n\n---\n[^uid]: cccccccccc\n"
+        )
+        sync(vault, collection, timestamp=2000)
+        dues = rows(
+            collection,
+            "SELECT n.guid, c.ord, c.due FROM notes n JOIN cards c ON c.nid = n.id",
+        )
+        assert sorted(dues) == [
+            ("aaaaaaaaaa", 0, 1),
+            ("bbbbbbbbbb", 0, 2),
+            ("bbbbbbbbbb", 1, 2),
+            ("cccccccccc", 0, 3),
+        ]
+        (conf,) = rows(collection, "SELECT conf FROM col")[0]
+        assert json.loads(conf)["nextPos"] == 4
+
+    @staticmethod
+    def test_notes_carry_first_field_checksum(vault, tmp_path):
+        collection = make_collection(tmp_path / "collection.anki2")
+        sync(vault, collection, timestamp=1000)
+        for flds, csum in rows(collection, "SELECT flds, csum FROM notes"):
+            assert csum == _field_checksum(flds.split("\x1f")[0]) != 0
+
+        field = '<p>a &amp; b<img src="pic.png"><!-- x --></p>'
+        expected = hashlib.sha1(b"a & b pic.png ").hexdigest()[:8]
+        assert _field_checksum(field) == int(expected, 16)
+
+    @staticmethod
+    def test_ids_stay_clear_of_existing_rows(vault, tmp_path):
+        collection = make_collection(tmp_path / "collection.anki2")
+        sync(vault, collection, timestamp=5000)
+        (vault / "more.md").write_text(
+            "---\ndeck: synced\n---\n---\n\nq ::: a\n\n---\n[^uid]: cccccccccc\n"
+        )
+        sync(vault, collection, timestamp=1000)  # clock went backwards
+        ids = rows(collection, "SELECT id FROM notes UNION ALL SELECT id FROM cards")
+        assert len(ids) == len(set(ids))
+
+    @staticmethod
+    def test_modern_schema_with_existing_entries(vault, tmp_path):
+        store, _ = package_contents(vault)
+        collection = make_modern_collection(tmp_path / "modern.anki2", [store])
+        result = sync(vault, collection, timestamp=1000)
+        assert (result.added, result.cards_added) == (2, 2)
+        assert rows(collection, "SELECT mod, models, decks FROM col") == [
+            (1000 * 1000, "", "")
+        ]
+        assert sorted(rows(collection, "SELECT due FROM cards")) == [(7,), (8,)]
+        assert rows(collection, "SELECT val FROM config") == [(b"9",)]
+
+        (vault / "deck.md").write_text(DECK.replace("one", "uno"))
+        result = sync(vault, collection, timestamp=2000)
+        assert (result.added, result.updated, result.unchanged) == (0, 1, 1)
+
+    @staticmethod
+    def test_modern_schema_refuses_new_entries(vault, tmp_path):
+        store, _ = package_contents(vault)
+        bare = make_modern_collection(tmp_path / "bare.anki2")
+        with pytest.raises(ValueError, match="deck 'synced'"):
+            sync(vault, bare, timestamp=1000)
+
+        store.models = store.models[:1]
+        partial = make_modern_collection(tmp_path / "partial.anki2", [store])
+        with pytest.raises(ValueError, match="Anki 2.1.28 or later") as error:
+            sync(vault, partial, timestamp=1000)
+        assert "deck 'synced'" not in str(error.value)
+        assert rows(partial, "SELECT COUNT(*) FROM notes") == [(0,)]
+
+    @staticmethod
+    def test_rejects_non_collections(vault, tmp_path):
+
+        other = tmp_path / "other.anki2"
+        other.write_text("not a database" * 100)
+        with pytest.raises(ValueError, match="not an Anki collection"):
+            sync(vault, other, timestamp=1000)
+
+        with pytest.raises(ValueError, match="No Anki collection"):
+            sync(vault, tmp_path / "missing.anki2", timestamp=1000)
@@ -0,0 +1,77 @@
+import pytest
+
+from app.logic.fingerprints import (
+    changed_notes,
+    diff_fingerprints,
+    read_fingerprints,
+    store_fingerprints,
+    write_fingerprints,
+)
+from app.logic.packaging import write_package
+from app.logic.sources import NoteType
+from app.logic.store import NoteStore
+
+TYPES = {t.key: t.model for t in NoteType.get_types()}
+
+
+def make_store(answer="a", tags=("t",)):
+    store = NoteStore(deck_id=1, name="foo")
+    store.add(guid="aaaaaaaaaa", model=TYPES["qa"], fields=["q", answer, "s.md"])
+    store.add(
+        guid="bbbbbbbbbb",
+        model=TYPES["cloze"],
+        fields=["{{c1::x}}", "s.md"],
+        tags=tags,
+    )
+    return store
+
+
+def fingerprints(store):
+    return {guid: fingerprint for _, guid, fingerprint in store_fingerprints(store)}
+
+
+class TestFingerprints:
+    @staticmethod
+    def test_package_and_file_agree_with_store(tmp_path):
+        store = make_store()
+        package = tmp_path / "foo.apkg"
+        write_package(package, decks=[store], media_files=[])
+        assert read_fingerprints(package) == fingerprints(store)
+
+        written = tmp_path / "foo.json"
+        write_fingerprints(written, fingerprints(store).items())
+        assert read_fingerprints(written) == fingerprints(store)
+
+    @staticmethod
+    def test_fields_tags_and_model_all_count():
+        base = fingerprints(make_store())
+        assert fingerprints(make_store(answer="b")) != base
+        assert fingerprints(make_store(tags=("u",))) != base
+        assert fingerprints(make_store()) == base
+
+    @staticmethod
+    def test_changed_notes():
+        baseline = fingerprints(make_store())
+        delta = changed_notes(make_store(answer="b"), baseline)
+        assert delta.guids == ["aaaaaaaaaa"]
+        assert len(changed_notes(make_store(), baseline)) == 0
+        assert len(changed_notes(make_store(), {})) == 2
+
+    @staticmethod
+    def test_unreadable_baselines_raise(tmp_path):
+        with pytest.raises(ValueError, match="No package or fingerprint file"):
+            read_fingerprints(tmp_path / "missing.apkg")
+        other = tmp_path / "other.json"
+        other.write_text('{"version": 99, "notes": {}}')
+        with pytest.raises(ValueError, match="unsupported version"):
+            read_fingerprints(other)
+
+    @staticmethod
+    def test_diff():
+        old = {"a": "1", "b": "2", "c": "3"}
+        new = {"b": "2", "c": "4", "d": "5"}
+        assert list(diff_fingerprints(old, new)) == [
+            ("changed", "c"),
+            ("added", "d"),
+            ("removed", "a"),
+        ]
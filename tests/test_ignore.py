@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import pytest
+
+from app.logic.ignore import IgnoreRules
+
+
+def rules(tmp_path, text, where=""):
+    (tmp_path / where).mkdir(parents=True, exist_ok=True)
+    (tmp_path / where / ".ankcignore").write_text(text)
+    return IgnoreRules.for_walk(gitignore=False).enter(tmp_path / where, where)
+
+
+class TestIgnoreRules:
+    @staticmethod
+    @pytest.mark.parametrize(
+        "pattern, path, is_dir, expected",
+        [
+            ("attachments", "attachments", True, True),
+            ("attachments", "a/b/attachments", True, True),
+            ("attachments/", "attachments", False, False),
+            ("/exports", "exports", True, True),
+            ("/exports", "a/exports", True, False),
+            ("a/exports", "a/exports", True, True),
+            ("a/exports", "b/a/exports", True, False),
+            ("*.md", "x/notes.md", False, True),
+            ("draft-?.md", "draft-1.md", False, True),
+            ("draft-?.md", "draft-10.md", False, False),
+            ("draft-[0-9].md", "draft-7.md", False, True),
+            ("draft-[!0-9].md", "draft-7.md", False, False),
+            ("**/build", "a/b/build", True, True),
+            ("a/**/b", "a/b", True, True),
+            ("a/**/b", "a/x/y/b", True, True),
+            ("a/**", "a/x/y", False, True),
+            ("a/*", "a/x/y", False, False),
+            ("\\#hash.md", "#hash.md", False, True),
+            ("# comment", "# comment", False, False),
+            ("trailing.md   ", "trailing.md", False, True),
+        ],
+    )
+    def test_patterns(tmp_path, pattern, path, is_dir, expected):
+        assert rules(tmp_path, pattern + "\n").ignored(path, is_dir) is expected
+
+    @staticmethod
+    def test_last_match_wins(tmp_path):
+        ignore = rules(tmp_path, "*.md\n!keep.md\n")
+        assert ignore.ignored("drop.md", False)
+        assert not ignore.ignored("keep.md", False)
+
+    @staticmethod
+    def test_nested_file_is_relative_to_its_directory(tmp_path):
+        ignore = rules(tmp_path, "/draft.md\n", where="sub")
+        assert ignore.ignored("sub/draft.md", False)
+        assert not ignore.ignored("draft.md", False)
+        assert not ignore.ignored("sub/deeper/draft.md", False)
+
+    @staticmethod
+    def test_gitignore_only_when_asked(tmp_path):
+        (tmp_path / ".gitignore").write_text("node_modules\n")
+        path = Path("node_modules/x.md")
+        assert IgnoreRules.for_walk(gitignore=True).ignored_path(tmp_path, path)
+        assert not IgnoreRules.for_walk(gitignore=False).ignored_path(tmp_path, path)
@@ -0,0 +1,91 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.logic.loader import prefetch
+
+PATHS = [Path(f"{i}.md") for i in range(50)]
+
+
+class Tracker:
+    """A load function that records how far ahead of the consumer it runs.
+
+    With a ``gate``, loads of every path but the first wait for it to be set.
+    """
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.changed = threading.Condition()
+        self.started = 0
+        self.loaded = 0
+        self.consumed = 0
+        self.max_ahead = 0
+        self.threads = set()
+
+    def __call__(self, path):
+        with self.changed:
+            self.started += 1
+        if self.gate is not None and path != PATHS[0]:
+            assert self.gate.wait(timeout=5)
+        with self.changed:
+            self.loaded += 1
+            self.max_ahead = max(self.max_ahead, self.loaded - self.consumed)
+            self.threads.add(threading.get_ident())
+            self.changed.notify_all()
+        return path.stem
+
+    def wait_for(self, predicate):
+        with self.changed:
+            assert self.changed.wait_for(predicate, timeout=5)
+
+
+class TestPrefetch:
+    @staticmethod
+    def test_preserves_order():
+        tracker = Tracker()
+        result = list(prefetch(PATHS, tracker, concurrency=4, window=8))
+        assert result == [(path, path.stem) for path in PATHS]
+
+    @staticmethod
+    def test_window_bounds_read_ahead():
+        tracker = Tracker()
+        loader = prefetch(PATHS, tracker, concurrency=4, window=6)
+        for index, _ in enumerate(loader):
+            # Let the loader run as far ahead as the window allows before
+            # consuming; it times out if the loader falls short of that.
+            ahead = min(index + 6, len(PATHS))
+            tracker.wait_for(lambda: tracker.loaded >= ahead)
+            with tracker.changed:
+                tracker.consumed += 1
+        assert tracker.max_ahead == 6
+
+    @staticmethod
+    def test_concurrency_one_loads_on_calling_thread():
+        tracker = Tracker()
+        assert len(list(prefetch(PATHS, tracker, concurrency=1))) == len(PATHS)
+        assert tracker.threads == {threading.get_ident()}
+
+    @staticmethod
+    def test_error_surfaces_at_its_path():
+        def load(path):
+            if path.stem == "3":
+                raise ValueError("bad file")
+            return path.stem
+
+        seen = []
+        with pytest.raises(ValueError, match="bad file"):
+            for _, value in prefetch(PATHS, load, concurrency=4, window=8):
+                seen.append(value)
+        assert seen == ["0", "1", "2"]
+
+    @staticmethod
+    def test_early_stop_leaves_the_rest_unloaded():
+        gate = threading.Event()
+        tracker = Tracker(gate=gate)
+        loader = prefetch(PATHS, tracker, concurrency=2, window=4)
+        next(loader)
+        loader.close()  # while the loads after the first wait at the gate
+        gate.set()
+        tracker.wait_for(lambda: tracker.loaded == tracker.started)
+        assert tracker.loaded <= 4
@@ -0,0 +1,99 @@
+import datetime
+import sqlite3
+
+from app.logic import manifest as manifest_module
+from app.logic.manifest import DeckManifest, ManifestEntry, source_decks
+
+
+def write(tmp_path, name, frontmatter):
+    path = tmp_path / name
+    path.write_text(f"---\n{frontmatter}\n---\n---\n\nq ::: a\n\n---\n")
+    return path
+
+
+def count_reads(monkeypatch):
+    read = []
+    original = manifest_module.read_markdown_meta
+
+    def record(path):
+        read.append(path.name)
+        return original(path)
+
+    monkeypatch.setattr(manifest_module, "read_markdown_meta", record)
+    return read
+
+
+class TestDeckManifest:
+    @staticmethod
+    def test_warm_lookup_reads_only_changed_files(tmp_path, monkeypatch):
+        a = write(tmp_path, "a.md", "deck: one\ntags: [x, y]")
+        b = write(tmp_path, "b.md", "tags: z")
+        read = count_reads(monkeypatch)
+        assert source_decks([a, b], tmp_path) == {a: "one", b: None}
+        assert sorted(read) == ["a.md", "b.md"]
+
+        read.clear()
+        assert source_decks([a, b], tmp_path) == {a: "one", b: None}
+        assert read == []
+
+        write(tmp_path, "b.md", "deck: two")
+        assert source_decks([a, b], tmp_path) == {a: "one", b: "two"}
+        assert read == ["b.md"]
+
+    @staticmethod
+    def test_entries_keep_order(tmp_path):
+        paths = [
+            write(tmp_path, f"{i}.md", f"deck: d{i}\ntags: [t{i}]") for i in (3, 1, 2)
+        ]
+        manifest = DeckManifest.open(tmp_path)
+        manifest.entries(paths[:1])
+        entries = manifest.entries(paths)  # one cached, two fresh
+        manifest.close()
+        assert list(entries) == paths
+        assert entries[paths[0]] == ManifestEntry("d3")
+
+    @staticmethod
+    def test_files_deleted_since_the_search_are_left_out(tmp_path):
+        a = write(tmp_path, "a.md", "deck: one")
+        gone = tmp_path / "gone.md"
+        assert source_decks([a, gone], tmp_path, complete=True) == {a: "one"}
+
+    @staticmethod
+    def test_rows_of_another_layout_are_reread(tmp_path, monkeypatch):
+        a = write(tmp_path, "a.md", "deck: one")
+        manifest = DeckManifest.open(tmp_path)
+        manifest.entries([a])
+        manifest._conn.execute("UPDATE files SET entry = ?", ('["one", null]',))
+        manifest.close()
+        read = count_reads(monkeypatch)
+        assert source_decks([a], tmp_path) == {a: "one"}
+        assert read == ["a.md"]
+
+    @staticmethod
+    def test_complete_lookup_forgets_other_files(tmp_path):
+        a = write(tmp_path, "a.md", "deck: one")
+        b = write(tmp_path, "b.md", "deck: two")
+        manifest = DeckManifest.open(tmp_path)
+        manifest.entries([a, b])
+        manifest.entries([a], complete=True)
+        rows = manifest._conn.execute("SELECT path FROM files").fetchall()
+        manifest.close()
+        assert rows == [("a.md",)]
+
+    @staticmethod
+    def test_values_json_cannot_hold_are_reread(tmp_path, monkeypatch):
+        a = write(tmp_path, "a.md", "deck: 2024-01-01")
+        read = count_reads(monkeypatch)
+        assert source_decks([a], tmp_path) == {a: datetime.date(2024, 1, 1)}
+        assert source_decks([a], tmp_path) == {a: datetime.date(2024, 1, 1)}
+        assert read == ["a.md", "a.md"]
+
+    @staticmethod
+    def test_failing_manifest_falls_back_to_reading(tmp_path, monkeypatch):
+        paths = [write(tmp_path, "a.md", "deck: a"), write(tmp_path, "b.md", "x: 1")]
+
+        def locked(self, paths, complete=False):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(DeckManifest, "entries", locked)
+        assert source_decks(paths, tmp_path) == {paths[0]: "a", paths[1]: None}
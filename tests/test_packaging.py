@@ -0,0 +1,336 @@
+import json
+import os
+import sqlite3
+import zipfile
+
+from genanki.deck import Deck as GenAnkiDeck
+from genanki.note import Note as GenAnkiNote
+from genanki.package import Package as GenAnkiPackage
+
+from app.logic import packaging
+from app.logic.packaging import Compression, compression_for, write_package
+from app.logic.sources import NoteType
+
+TIMESTAMP = 1700000000.0
+
+
+def make_deck():
+    """A deck exercising every model, including a multi-card cloze."""
+    types = {t.key: t.model for t in NoteType.get_types()}
+    deck = GenAnkiDeck(deck_id=1234567890, name="foo::bar")
+    deck.add_note(
+        GenAnkiNote(model=types["qa"], fields=["q", "a", "s.md"], guid="aaaaaaaaaa")
+    )
+    deck.add_note(
+        GenAnkiNote(
+            model=types["cloze"],
+            fields=["{{c1::x}} {{c2::y}}", "s.md"],
+            tags=["t1", "t2"],
+            guid="bbbbbbbbbb",
+        )
+    )
+    deck.add_note(
+        GenAnkiNote(
+            model=types["reversed"], fields=["f", "b", "s.md"], guid="cccccccccc"
+        )
+    )
+    return deck
+
+
+def read_collection(apkg, tmp_path):
+    """Returns every table's rows from a package's collection."""
+    db_path = tmp_path / f"{apkg.stem}.anki2"
+    with zipfile.ZipFile(apkg) as package:
+        db_path.write_bytes(package.read("collection.anki2"))
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            table: conn.execute(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+            for table in ("col", "notes", "cards")
+        }
+    finally:
+        conn.close()
+
+
+class TestWritePackage:
+    def test_collection_matches_genanki(self, tmp_path):
+        media = tmp_path / "image.png"
+        media.write_bytes(b"png")
+
+        ours = tmp_path / "ours.apkg"
+        write_package(
+            ours, decks=[make_deck()], media_files=[media], timestamp=TIMESTAMP
+        )
+        theirs = tmp_path / "theirs.apkg"
+        GenAnkiPackage(make_deck(), media_files=[str(media)]).write_to_file(
+            theirs, timestamp=TIMESTAMP
+        )
+
+        ours_rows = read_collection(ours, tmp_path)
+        theirs_rows = read_collection(theirs, tmp_path)
+        assert ours_rows["notes"] == theirs_rows["notes"]
+        assert ours_rows["cards"] == theirs_rows["cards"]
+        # col holds JSON blobs; compare them parsed so key order doesn't matter
+        for ours_col, theirs_col in zip(ours_rows["col"][0], theirs_rows["col"][0]):
+            if isinstance(ours_col, str) and ours_col.startswith("{"):
+                assert json.loads(ours_col) == json.loads(theirs_col)
+            else:
+                assert ours_col == theirs_col
+
+    def test_media_map_and_contents(self, tmp_path):
+        png = tmp_path / "image.png"
+        png.write_bytes(b"\x89PNG" * 1000)
+        svg = tmp_path / "figure.svg"
+        svg.write_text("<svg/>" * 1000)
+
+        apkg = tmp_path / "out.apkg"
+        write_package(apkg, decks=[make_deck()], media_files=[png, svg])
+
+        with zipfile.ZipFile(apkg) as package:
+            assert json.loads(package.read("media")) == {
+                "0": "image.png",
+                "1": "figure.svg",
+            }
+            assert package.read("0") == png.read_bytes()
+            assert package.read("1") == svg.read_bytes()
+            assert package.getinfo("0").compress_type == zipfile.ZIP_STORED
+            assert package.getinfo("1").compress_type == zipfile.ZIP_DEFLATED
+            collection = package.getinfo("collection.anki2")
+            assert collection.compress_type == zipfile.ZIP_DEFLATED
+
+    @staticmethod
+    def test_file_mode(tmp_path):
+        apkg = tmp_path / "out.apkg"
+        umask = os.umask(0o022)
+        try:
+            write_package(apkg, decks=[make_deck()], media_files=[])
+        finally:
+            os.umask(umask)
+        assert apkg.stat().st_mode & 0o777 == 0o644
+
+        apkg.chmod(0o640)
+        write_package(apkg, decks=[make_deck()], media_files=[], previous=apkg)
+        assert apkg.stat().st_mode & 0o777 == 0o640
+
+
+class TestCompressionFor:
+    @staticmethod
+    def test_compressed_formats_stored(tmp_path):
+        for name in ("a.png", "b.JPG", "c.mp3"):
+            assert compression_for(tmp_path / name) == (zipfile.ZIP_STORED, None)
+
+    @staticmethod
+    def test_other_formats_deflated(tmp_path):
+        for name in ("a.svg", "b.css", "collection.anki2"):
+            assert compression_for(tmp_path / name) == (zipfile.ZIP_DEFLATED, None)
+
+    @staticmethod
+    def test_store_strategy_stores_everything(tmp_path):
+        for name in ("a.png", "collection.anki2"):
+            assert compression_for(tmp_path / name, Compression.STORE) == (
+                zipfile.ZIP_STORED,
+                None,
+            )
+
+    @staticmethod
+    def test_levels_by_strategy(tmp_path):
+        svg = tmp_path / "a.svg"
+        assert compression_for(svg, Compression.FAST)[1] == 1
+        assert compression_for(svg, Compression.BEST)[1] == 9
+        # images stay stored whatever the deflate level
+        png = tmp_path / "a.png"
+        assert compression_for(png, Compression.BEST) == (zipfile.ZIP_STORED, None)
+
+    @staticmethod
+    def test_best_is_smaller_than_fast(tmp_path):
+        svg = tmp_path / "figure.svg"
+        svg.write_text("".join(f"<rect x='{i}'/>" for i in range(5000)))
+        sizes = {}
+        for compression in (Compression.FAST, Compression.BEST, Compression.STORE):
+            apkg = tmp_path / f"{compression.value}.apkg"
+            write_package(
+                apkg, decks=[make_deck()], media_files=[svg], compression=compression
+            )
+            with zipfile.ZipFile(apkg) as package:
+                sizes[compression] = package.getinfo("0").compress_size
+        assert sizes[Compression.BEST] < sizes[Compression.FAST]  # level applied
+        assert sizes[Compression.FAST] < sizes[Compression.STORE]
+
+
+class TestIncrementalWrite:
+    @staticmethod
+    def _media(tmp_path):
+        svg = tmp_path / "figure.svg"
+        svg.write_text("<svg>" + "<rect/>" * 500 + "</svg>")
+        css = tmp_path / "extra.css"
+        css.write_text("p { color: red; }\n" * 100)
+        png = tmp_path / "image.png"
+        png.write_bytes(b"\x89PNG" * 100)
+        return [svg, css, png]
+
+    @staticmethod
+    def _streamed(monkeypatch):
+        streamed = []
+        original = packaging._stream_media
+
+        def record(package, media, arcname, compression):
+            streamed.append(media.name)
+            original(package, media, arcname, compression)
+
+        monkeypatch.setattr(packaging, "_stream_media", record)
+        return streamed
+
+    def test_unchanged_media_copied_raw(self, tmp_path, monkeypatch):
+        media = self._media(tmp_path)
+        apkg = tmp_path / "out.apkg"
+        write_package(apkg, decks=[make_deck()], media_files=media)
+
+        streamed = self._streamed(monkeypatch)
+        write_package(apkg, decks=[make_deck()], media_files=media, previous=apkg)
+
+        assert streamed == []
+        with zipfile.ZipFile(apkg) as package:
+            assert package.testzip() is None
+            for index, path in enumerate(media):
+                assert package.read(str(index)) == path.read_bytes()
+
+    def test_changed_media_rewritten(self, tmp_path, monkeypatch):
+        svg, css, png = self._media(tmp_path)
+        apkg = tmp_path / "out.apkg"
+        write_package(apkg, decks=[make_deck()], media_files=[svg, css, png])
+        # same size and mtime, different content: only the checksum tells
+        # them apart
+        stat = css.stat()
+        css.write_text("p { color: blu; }\n" * 100)
+        os.utime(css, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        streamed = self._streamed(monkeypatch)
+        write_package(
+            apkg, decks=[make_deck()], media_files=[css, svg, png], previous=apkg
+        )
+
+        assert streamed == ["extra.css"]
+        with zipfile.ZipFile(apkg) as package:
+            assert package.testzip() is None
+            assert json.loads(package.read("media")) == {
+                "0": "extra.css",
+                "1": "figure.svg",
+                "2": "image.png",
+            }
+            assert package.read("0") == css.read_bytes()
+            assert package.read("1") == svg.read_bytes()
+
+    def test_strategy_change_rewrites(self, tmp_path, monkeypatch):
+        media = self._media(tmp_path)
+        apkg = tmp_path / "out.apkg"
+        write_package(apkg, decks=[make_deck()], media_files=media)
+
+        streamed = self._streamed(monkeypatch)
+        write_package(
+            apkg,
+            decks=[make_deck()],
+            media_files=media,
+            compression=Compression.STORE,
+            previous=apkg,
+        )
+        assert streamed == ["figure.svg", "extra.css"]  # the png is stored either way
+
+    def test_level_or_mtime_change_rewrites(self, tmp_path, monkeypatch):
+        svg, css, png = self._media(tmp_path)
+        apkg = tmp_path / "out.apkg"
+        write_package(
+            apkg,
+            decks=[make_deck()],
+            media_files=[svg, css, png],
+            compression=Compression.FAST,
+        )
+        mtime = png.stat().st_mtime
+        os.utime(png, (mtime + 10, mtime + 10))
+
+        streamed = self._streamed(monkeypatch)
+        write_package(
+            apkg,
+            decks=[make_deck()],
+            media_files=[svg, css, png],
+            compression=Compression.BEST,
+            previous=apkg,
+        )
+        assert streamed == ["figure.svg", "extra.css", "image.png"]
+
+    def test_recompresses_without_raw_copy(self, tmp_path, monkeypatch):
+        media = self._media(tmp_path)
+        apkg = tmp_path / "out.apkg"
+        write_package(apkg, decks=[make_deck()], media_files=media)
+
+        monkeypatch.setattr(packaging, "_RAW_ZIPFILE_ATTRS", ("no_such_attr",))
+        streamed = self._streamed(monkeypatch)
+        write_package(apkg, decks=[make_deck()], media_files=media, previous=apkg)
+        assert streamed == ["figure.svg", "extra.css", "image.png"]
+
+    @staticmethod
+    def test_raw_copy_supported(tmp_path):
+        # Guards the zipfile internals _append_raw relies on, on every Python
+        # CI runs.
+        with zipfile.ZipFile(tmp_path / "out.zip", "w") as package:
+            assert packaging._can_append_raw(package)
+
+    def test_raw_copy_as_first_write(self, tmp_path):
+        # An archive opened to append is not marked modified until something
+        # is written, so _append_raw must mark it or close() drops the entry.
+        media = self._media(tmp_path)
+        apkg = tmp_path / "out.apkg"
+        write_package(apkg, decks=[make_deck()], media_files=media)
+        target = tmp_path / "target.zip"
+        zipfile.ZipFile(target, "w").close()
+
+        old = packaging._PreviousPackage.open(apkg)
+        try:
+            with zipfile.ZipFile(target, "a") as package:
+                entry = old.reusable(media[1], Compression.DEFLATE)
+                old.copy_raw(entry, package, "copied")
+        finally:
+            old.close()
+        with zipfile.ZipFile(target) as package:
+            assert package.testzip() is None
+            assert package.read("copied") == media[1].read_bytes()
+
+    @staticmethod
+    def test_missing_or_invalid_previous_ignored(tmp_path):
+        media = [tmp_path / "figure.svg"]
+        media[0].write_text("<svg/>")
+        apkg = tmp_path / "out.apkg"
+        write_package(
+            apkg, decks=[make_deck()], media_files=media, previous=tmp_path / "none"
+        )
+        bogus = tmp_path / "bogus.apkg"
+        bogus.write_text("not a zip")
+        write_package(apkg, decks=[make_deck()], media_files=media, previous=bogus)
+        with zipfile.ZipFile(apkg) as package:
+            assert package.read("0") == b"<svg/>"
+
+
+class TestMultiDeck:
+    @staticmethod
+    def test_collection_matches_genanki(tmp_path):
+        def decks():
+            first = make_deck()
+            second = GenAnkiDeck(deck_id=987654321, name="foo::baz")
+            qa = NoteType.get_types()[0].model
+            second.add_note(
+                GenAnkiNote(model=qa, fields=["q2", "a2", "t.md"], guid="dddddddddd")
+            )
+            return [first, second]
+
+        ours = tmp_path / "ours.apkg"
+        write_package(ours, decks=decks(), media_files=[], timestamp=TIMESTAMP)
+        theirs = tmp_path / "theirs.apkg"
+        GenAnkiPackage(decks()).write_to_file(theirs, timestamp=TIMESTAMP)
+
+        ours_rows = read_collection(ours, tmp_path)
+        theirs_rows = read_collection(theirs, tmp_path)
+        assert ours_rows["notes"] == theirs_rows["notes"]
+        assert ours_rows["cards"] == theirs_rows["cards"]
+        decks_column = 10  # col.decks
+        assert json.loads(ours_rows["col"][0][decks_column]) == json.loads(
+            theirs_rows["col"][0][decks_column]
+        )
@@ -0,0 +1,151 @@
+import difflib
+import html
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import unquote
+
+import pytest
+
+from app.config import settings
+from app.logic.render import Renderer, get_renderer, render_markdown
+from app.logic.sources import File
+from app.logic.utils import parse_markdown_file
+
+EXAMPLES = sorted(Path(__file__).parent.parent.glob("examples/*.md"))
+
+# Constructs card fields use that examples/ does not cover.
+CORPUS = [
+    "plain text",
+    "**bold**, *em*, `code` and a [link](https://example.com)",
+    '![diagram](media/plot.png "Plot")',
+    "![résumé](résumé.png)",
+    "![a pic](<my pic.png>) and [a link](<some page.html>)",
+    "- one\n- two\n    - nested\n\nafter the list",
+    "1. first\n2. second",
+    "> quoted\n> text",
+    "# Heading\n\nparagraph\n\n---\n\nafter rule",
+    "```python\nif a < b:\n    print('<tag>')\n```",
+    "    indented code",
+    "| f | val |\n|---|---|\n| $x^2$ | y |",
+    "| left | center | right |\n|:---|:---:|---:|\n| a | b | c |",
+    r"$E = mc^2$",
+    r"$$A = \pi r^2$$",
+    r"\(a + b\) and \[c\]",
+    "\\begin{align}\nx &= 1 \\\\\ny &= 2\n\\end{align}",
+    r"it costs $5 and $10",
+    r"$x < y$ and $a_1 * b_2$",
+    r"escaped \$ dollar",
+    "line one\nline two",
+    "a & b < c",
+]
+
+# Where Python-Markdown departs from CommonMark, markdown-it follows
+# CommonMark; fields like these render differently under --renderer.
+KNOWN_DIFFERENCES = [
+    "- one\n- two\n  - nested with a two-space indent",
+    "- bullets\n\n1. then numbers",
+    "- item\n\n    continued\n- next item",
+]
+
+
+class _Normalizer(HTMLParser):
+    """Flattens HTML to comparable events: attributes sorted, style
+    declarations without spacing, entities resolved, URLs percent-decoded and
+    whitespace-only text dropped. What is left is what a browser (or Anki)
+    would render."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.events = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = sorted((name, _attribute(name, value or "")) for name, value in attrs)
+        self.events.append(f"<{tag} {attrs}>" if attrs else f"<{tag}>")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.events.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if data.strip():
+            self.events.append(html.unescape(data).strip())
+
+
+def _attribute(name, value):
+    if name == "style":
+        return _style(value)
+    if name in ("src", "href"):
+        return unquote(value)
+    return value
+
+
+def _style(value):
+    return ";".join(
+        "".join(declaration.split()) for declaration in value.split(";") if declaration
+    )
+
+
+def normalize(markup):
+    parser = _Normalizer()
+    parser.feed(markup)
+    parser.close()
+    return parser.events
+
+
+def example_fields():
+    """Every markdown field of every card in examples/."""
+    for path in EXAMPLES:
+        meta, body = parse_markdown_file(path)
+        for chunk in File(path=path, meta=meta, body=body).extract_chunks():
+            note_type = chunk._resolve_type(chunk._extract_meta())
+            for index, field in enumerate(chunk._extract_md_fields(note_type)):
+                yield pytest.param(field, id=f"{path.stem}-{chunk.uid}-{index}")
+
+
+class TestConformance:
+    @staticmethod
+    @pytest.mark.parametrize(
+        "text",
+        [
+            *example_fields(),
+            *CORPUS,
+            *(
+                pytest.param(text, marks=pytest.mark.xfail(strict=True))
+                for text in KNOWN_DIFFERENCES
+            ),
+        ],
+    )
+    def test_markdown_it_renders_like_the_reference(text):
+        expected = render_markdown(text, Renderer.MARKDOWN)
+        actual = render_markdown(text, Renderer.MARKDOWN_IT)
+        if normalize(actual) != normalize(expected):
+            diff = difflib.unified_diff(
+                expected.splitlines(),
+                actual.splitlines(),
+                "markdown",
+                "markdown-it",
+                lineterm="",
+            )
+            pytest.fail(f"{text!r} renders differently:\n" + "\n".join(diff))
+
+
+class TestGetRenderer:
+    @staticmethod
+    def test_unknown_renderer_raises():
+        with pytest.raises(ValueError, match="Unknown renderer 'mistune'"):
+            get_renderer("mistune")
+
+    @staticmethod
+    def test_reuses_parser_and_resets_it():
+        render = get_renderer(Renderer.MARKDOWN)
+        assert get_renderer("markdown") is render
+        # Reuse must not leak state such as link references between fields.
+        assert "href" in render("[a]: https://example.com\n\n[a]")
+        assert render("[a]") == "<p>[a]</p>"
+
+    @staticmethod
+    def test_default_comes_from_settings(monkeypatch):
+        monkeypatch.setattr(settings, "RENDERER", "markdown-it")
+        assert get_renderer() is get_renderer(Renderer.MARKDOWN_IT)
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from app.logic import schedule
+from app.logic.schedule import (
+    CARD_BYTES,
+    DeckCost,
+    assign_shards,
+    estimate_costs,
+    largest_first,
+    merge_manifests,
+    parse_shard,
+    stat_cost,
+    write_shard_manifest,
+)
+
+
+def deck(name, cost):
+    return DeckCost(name=name, bytes=cost, cards=0)
+
+
+class TestSchedule:
+    @staticmethod
+    def test_estimate_costs(tmp_path):
+        source = tmp_path / "a.md"
+        source.write_text(
+            "---\ndeck: a\n---\n" + "---\n\nq ::: a\n\n---\n[^uid]: aaaaaaaaaa\n" * 3
+        )
+        (cost,) = estimate_costs({"a": [source, tmp_path / "missing.md"]})
+        assert (cost.bytes, cost.cards) == (source.stat().st_size, 3)
+        assert cost.cost == cost.bytes + 3 * CARD_BYTES
+
+    @staticmethod
+    def test_estimate_costs_reads_only_uncounted_files(tmp_path, monkeypatch):
+        a, b = tmp_path / "a.md", tmp_path / "b.md"
+        a.write_text("x" * 100)
+        b.write_text("---\n\nq ::: a\n\n---\n[^uid]: bbbbbbbbbb\n")
+        read = []
+        monkeypatch.setattr(
+            schedule, "scan_uids", lambda path: read.append(path.name) or [("u", 1)]
+        )
+        (cost,) = estimate_costs({"a": [a, b]}, card_counts={a: 4})
+        assert (cost.bytes, cost.cards) == (100 + b.stat().st_size, 5)
+        assert read == ["b.md"]
+
+    @staticmethod
+    def test_stat_cost(tmp_path):
+        source = tmp_path / "a.md"
+        source.write_text("x" * 100)
+        cost = stat_cost("a", [source, tmp_path / "missing.md"], cards=2)
+        assert (cost.bytes, cost.cards) == (100, 2)
+
+    @staticmethod
+    def test_largest_first():
+        costs = [deck("b", 1), deck("c", 5), deck("a", 1)]
+        assert [d.name for d in largest_first(costs)] == ["c", "a", "b"]
+
+    @staticmethod
+    def test_assign_shards_balances_cost():
+        costs = [deck(f"d{i}", size) for i, size in enumerate([8, 7, 6, 5, 4, 3, 2, 1])]
+        groups = assign_shards(costs, 3)
+        assert sorted(name for group in groups for name in group) == sorted(
+            d.name for d in costs
+        )
+        sizes = {d.name: d.cost for d in costs}
+        loads = [sum(sizes[name] for name in group) for group in groups]
+        assert loads == [13, 12, 11]
+        assert assign_shards(list(reversed(costs)), 3) == groups
+        assert assign_shards(costs[:1], 3) == [["d0"], [], []]
+
+    @staticmethod
+    def test_parse_shard():
+        assert parse_shard("2/4") == (2, 4)
+        for text in ("0/4", "5/4", "2", "a/b", "-1/2"):
+            with pytest.raises(ValueError, match="Not a shard"):
+                parse_shard(text)
+
+
+class TestMergeManifests:
+    @staticmethod
+    def _manifests(tmp_path, shards, decks):
+        paths = []
+        for shard, names in enumerate(decks, start=1):
+            path = tmp_path / f"shard-{shard}-{shards}.json"
+            write_shard_manifest(
+                path,
+                shard,
+                shards,
+                {
+                    name: {"package": f"{name}.apkg", "notes": 1, "cards": 2}
+                    for name in names
+                },
+            )
+            paths.append(path)
+        return paths
+
+    def test_merge(self, tmp_path):
+        paths = self._manifests(tmp_path, 2, [["b"], ["a", "c"]])
+        merged = merge_manifests(paths)
+        assert merged["shards"] == 2
+        assert list(merged["decks"]) == ["a", "b", "c"]
+        assert merged["decks"]["a"] == {"package": "a.apkg", "notes": 1, "cards": 2}
+
+    def test_incomplete_or_inconsistent(self, tmp_path):
+        paths = self._manifests(tmp_path, 3, [["a"], ["b"], ["a"]])
+        with pytest.raises(ValueError, match=r"Missing shard\(s\) \[2\] of 3"):
+            merge_manifests([paths[0], paths[2]])
+        with pytest.raises(ValueError, match="more than once"):
+            merge_manifests([paths[0], paths[0], paths[1], paths[2]])
+        with pytest.raises(ValueError, match="Deck a was built by shards 1 and 3"):
+            merge_manifests(paths)
+
+        (tmp_path / "other").mkdir()
+        other = self._manifests(tmp_path / "other", 2, [["x"], ["y"]])
+        with pytest.raises(ValueError, match="different shard counts"):
+            merge_manifests([paths[0], other[0]])
+
+        bad = tmp_path / "bad.json"
+        bad.write_text(json.dumps({"version": 1, "shard": 3, "shards": 2}))
+        with pytest.raises(ValueError, match="not a shard manifest"):
+            merge_manifests([bad])
+        with pytest.raises(ValueError, match="No shard manifests"):
+            merge_manifests([])
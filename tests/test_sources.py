@@ -1,6 +1,12 @@
+import random
+import re
+from pathlib import Path
+
 import pytest
 
-from app.logic.sources import Chunk, File
+from app.config import settings
+from app.logic import sources
+from app.logic.sources import Chunk, Deck, File, NoteType
 from app.logic.utils import parse_markdown_file
 
 
@@ -73,6 +79,105 @@ class TestExtractType:
         assert any("Found more than one note type" in e for e in chunk.validate())
 
 
+# Pieces random bodies are built from: note-type syntax, its near misses and
+# filler, including a non-ASCII digit (\d matches it) and newlines.
+SYNTAX_PIECES = [
+    ":",
+    "::",
+    ":::",
+    "::::",
+    "{",
+    "{{",
+    "}",
+    "}}",
+    "c",
+    "c1",
+    "c12",
+    "c\u0663",
+    " ",
+    "  ",
+    "\n",
+    "x",
+    "{{c1::",
+    "{{ c2 ::",
+    "{{c::",
+    "}} ",
+]
+
+
+def regex_resolution(body):
+    """Type key (or error) and each type's fields, by the per-type regexes."""
+    types = NoteType.get_types()
+    matches = [
+        t.key
+        for t in types
+        if t.auto_detect and re.compile(t.regex, re.DOTALL).findall(body)
+    ]
+    if len(matches) == 0:
+        resolved = "Could not find a note type for chunk"
+    elif len(matches) > 1:
+        resolved = "Found more than one note type for chunk"
+    else:
+        resolved = matches[0]
+
+    fields = {}
+    for t in types:
+        found = re.compile(t.regex, re.DOTALL).findall(body)
+        if len(found) != 1:
+            fields[t.key] = None
+        elif isinstance(found[0], tuple):
+            fields[t.key] = list(found[0])
+        else:
+            fields[t.key] = found
+    return resolved, fields
+
+
+def scanned_resolution(body):
+    """The same, through the chunk's single-scan classifier."""
+    chunk = Chunk(meta="", body=body, file=None)
+    try:
+        resolved = chunk._resolve_type({settings.TYPE_KEY: None}).key
+    except ValueError as exc:
+        resolved = str(exc)
+
+    fields = {}
+    for t in NoteType.get_types():
+        try:
+            fields[t.key] = chunk._extract_md_fields(t)
+        except ValueError:
+            fields[t.key] = None
+    return resolved, fields
+
+
+class TestCardSyntax:
+    @staticmethod
+    @pytest.mark.parametrize(
+        "body",
+        [
+            "q ::: a",
+            "q\n:::\na ::: b",
+            ":::a",
+            "a:::",
+            "a::::b",
+            "{{c1::x}}",
+            "{{c1::}}",
+            "{{c1:: }}",
+            "{{c1:::x}}",
+            "a {{ c12 ::b}} c ::: d",
+            "{{c1::x}} {{c2::y",
+        ],
+    )
+    def test_matches_type_regexes(body):
+        assert scanned_resolution(body) == regex_resolution(body)
+
+    @staticmethod
+    def test_matches_type_regexes_on_random_bodies():
+        rng = random.Random(42)
+        for _ in range(3000):
+            body = "".join(rng.choices(SYNTAX_PIECES, k=rng.randint(1, 12)))
+            assert scanned_resolution(body) == regex_resolution(body), repr(body)
+
+
 class TestChunkValidate:
     @staticmethod
     def test_valid_chunk_has_no_errors_and_exposes_uid():
@@ -197,3 +302,73 @@ class TestExtractImages:
         note = self._note_with_body(tmp_path, "q ::: ![a](one.png) and ![b](two.png)")
         names = [p.name for p in note.images]
         assert names == ["one.png", "two.png"]
+
+
+class TestFileTags:
+    @staticmethod
+    def _file(tags):
+        return File(path=Path("a.md"), body="", meta={"deck": "foo", "tags": tags})
+
+    def test_file_tags_normalized_once(self):
+        file = self._file([" shared ", "dup", "dup"])
+        assert file.tags == ("shared", "dup")
+        assert file.tags is file.tags
+        assert file.get_tags() == ["shared", "dup"]
+
+    def test_tags_interned_across_files(self):
+        first = self._file(["".join(["sha", "red"])])
+        second = self._file(["".join(["shar", "ed"])])
+        assert first.tags[0] is second.tags[0]
+
+    def test_notes_with_same_tags_share_merge(self):
+        file = self._file(["shared", "dup"])
+        merged = file.merge_tags(["dup", "own"])
+        assert merged == ("dup", "own", "shared")
+        assert file.merge_tags(("dup", "own")) is merged
+        assert file.merge_tags([]) == file.tags
+
+
+class TestLargeFiles:
+    @staticmethod
+    def _notes(tmp_path):
+        deck = Deck(name="foo", source_search_path=tmp_path, source_search_depth=None)
+        return [
+            (note.guid, note.fields, note.tags)
+            for file in deck.get_source_files()
+            for note in (chunk.extract_note() for chunk in file.extract_chunks())
+        ]
+
+    def test_mapped_file_yields_same_notes(self, tmp_path, monkeypatch):
+        (tmp_path / "deck.md").write_text(
+            "---\ndeck: foo\ntags: [t]\n---\n"
+            "A long transcript — with prose, and --- rules.\n---\n"
+            "---\n\nq ::: a ✓\n\n---\n[^uid]: abc1234567\n[^tag]: x\n\n"
+            "between cards\n\n"
+            "---\n\nA {{c1::cloze}}\n\n---\n[^uid]: def1234567\n"
+        )
+        expected = self._notes(tmp_path)
+        assert len(expected) == 2
+
+        monkeypatch.setattr(settings, "MMAP_THRESHOLD", 1)
+        monkeypatch.setattr(
+            sources,
+            "parse_markdown_file",
+            lambda file_path: pytest.fail(f"{file_path} was read whole"),
+        )
+        assert self._notes(tmp_path) == expected
+
+    @staticmethod
+    def test_unparsable_frontmatter_read_as_text(tmp_path, monkeypatch):
+        # The YAML fallback drops the whole file; a mapped scan would not.
+        path = tmp_path / "deck.md"
+        path.write_text(
+            "---\ndeck: !!python/name:os.system\n---\n"
+            "---\n\nq ::: a\n\n---\n[^uid]: abc1234567\n"
+        )
+        deck = Deck(name="foo", source_search_path=tmp_path, source_search_depth=None)
+        expected = deck._extract_source_file(path)
+        assert (expected.meta, expected.body) == ({}, "")
+
+        monkeypatch.setattr(settings, "MMAP_THRESHOLD", 1)
+        file = deck._extract_source_file(path)
+        assert (file.meta, file.body) == (expected.meta, expected.body)
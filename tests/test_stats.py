@@ -0,0 +1,106 @@
+import json
+
+from app.logic.drivers import deck_stats
+from app.logic.sources import Deck, NoteType
+
+DECK = """---
+deck: foo
+tags:
+  - shared
+---
+
+---
+
+Q ::: A
+
+---
+[^uid]: aaaaaaaaaa
+[^tag]: one
+
+---
+
+{{c1::x}} {{c2::y}} {{c1::z}}
+
+---
+[^uid]: bbbbbbbbbb
+
+---
+
+Front ::: Back
+
+---
+[^uid]: cccccccccc
+[^type]: reversed
+[^tag]: one
+[^tag]: two
+"""
+
+UNTYPED = """
+---
+
+Not a card at all
+
+---
+[^uid]: eeeeeeeeee
+"""
+
+
+def write_deck(tmp_path):
+    (tmp_path / "foo.md").write_text(DECK)
+    (tmp_path / "bar.md").write_text(
+        "---\ndeck: bar\n---\n---\n\nq ::: a\n\n---\n[^uid]: ffffffffff\n"
+    )
+
+
+class TestVaultStats:
+    @staticmethod
+    def test_counts_match_build(tmp_path):
+        write_deck(tmp_path)
+        store, _ = Deck(
+            name="foo", source_search_path=tmp_path, source_search_depth=None
+        ).package_contents()
+        stats = deck_stats(["foo"], tmp_path, None)
+
+        type_names = {t.model.name: t.name for t in NoteType.get_types()}
+        built = {type_names[model.name]: 0 for model in store.models}
+        for row in range(len(store)):
+            built[type_names[store.models[store.model_index[row]].name]] += 1
+        types = stats.group("type")
+        assert {name: tally.notes for name, tally in types.items()} == built
+        assert stats.total.cards == len(store.card_ords)
+        assert types["Cloze"].cards == 2
+        assert types["Basic-Reversed"].cards == 2
+
+        with open(tmp_path / "foo.md", "a") as deck:
+            deck.write(UNTYPED)
+        stats = deck_stats(["foo"], tmp_path, None)
+        unknown = stats.group("type")["(unknown)"]
+        assert (unknown.notes, unknown.cards) == (1, 0)
+
+        tags = stats.group("tag")
+        assert {name: tally.notes for name, tally in tags.items()} == {
+            "shared": 4,
+            "one": 2,
+            "two": 1,
+        }
+        assert stats.total.bytes == sum(t.bytes for t in stats.group("file").values())
+
+    @staticmethod
+    def test_all_decks_and_output(tmp_path):
+        write_deck(tmp_path)
+        stats = deck_stats(None, tmp_path, None)
+        assert set(stats.group("deck")) == {"foo", "bar"}
+
+        data = json.loads(json.dumps(stats.to_dict()))
+        assert data["total"]["notes"] == 4
+        assert data["decks"]["bar"] == data["files"][str(tmp_path / "bar.md")]
+        assert data["decks"]["bar"]["cards"] == 1
+
+        lines = stats.format().splitlines()
+        assert lines[lines.index("deck:") + 1].endswith("  foo")
+        assert lines[-1].split() == [
+            "4",
+            str(stats.total.cards),
+            str(stats.total.bytes),
+            "total",
+        ]
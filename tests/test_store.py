@@ -0,0 +1,116 @@
+from pathlib import Path
+
+import pytest
+from genanki.deck import Deck as GenAnkiDeck
+from genanki.note import Note as GenAnkiNote
+from genanki.package import Package as GenAnkiPackage
+
+from app.logic.packaging import write_package
+from app.logic.sources import NoteType
+from app.logic.store import NoteStore
+from tests.test_packaging import read_collection
+
+TIMESTAMP = 1700000000.0
+TYPES = {t.key: t.model for t in NoteType.get_types()}
+
+
+class TestNoteStore:
+    @staticmethod
+    def test_package_matches_genanki(tmp_path):
+        deck = GenAnkiDeck(deck_id=42, name="foo")
+        store = NoteStore(deck_id=42, name="foo")
+        notes = [
+            (TYPES["qa"], ["q", "a", "s.md"], ["t1"], "aaaaaaaaaa"),
+            (
+                TYPES["cloze"],
+                ["{{c2::x}} {{c1::y}} {{c2::z}}", "s.md"],
+                [],
+                "bbbbbbbbbb",
+            ),
+            (TYPES["reversed"], ["f", "b", "s.md"], ["t1"], "cccccccccc"),
+            (TYPES["type-in"], ["q", "a", "s.md"], ["t2", "t1"], "dddddddddd"),
+        ]
+        for model, fields, tags, guid in notes:
+            deck.add_note(GenAnkiNote(model=model, fields=fields, tags=tags, guid=guid))
+            store.add(guid=guid, model=model, fields=fields, tags=tags)
+
+        ours, theirs = tmp_path / "ours.apkg", tmp_path / "theirs.apkg"
+        write_package(ours, decks=[store], media_files=[], timestamp=TIMESTAMP)
+        GenAnkiPackage(deck).write_to_file(theirs, timestamp=TIMESTAMP)
+        assert read_collection(ours, tmp_path) == read_collection(theirs, tmp_path)
+        assert [list(store.cards(row)) for row in range(len(store))] == [
+            [(card.ord, card.suspend) for card in note.cards] for note in deck.notes
+        ]
+
+    @staticmethod
+    def test_tag_sets_models_and_media_are_shared():
+        store = NoteStore(deck_id=1, name="foo")
+        image = Path("a/diagram.png")
+        for guid in ("a", "b", "c"):
+            store.add(
+                guid=guid,
+                model=TYPES["qa"],
+                fields=["q", "a", "s.md"],
+                tags=["x", "y"],
+                media=[image],
+            )
+        assert store.tag_sets == [" x y "]
+        assert store.models == [TYPES["qa"]]
+        assert store.media == [image]
+        assert store.note_media(2) == [image]
+
+    @staticmethod
+    def test_sort_field_override():
+        deck = GenAnkiDeck(deck_id=1, name="foo")
+        deck.add_note(
+            GenAnkiNote(model=TYPES["qa"], fields=["q", "a", "s.md"], sort_field="zz")
+        )
+        store = NoteStore.from_genanki(deck)
+        assert store.sort_field(0) == "zz"
+        assert store.sort_fields == {0: "zz"}
+
+    @staticmethod
+    def test_field_count_mismatch_raises():
+        store = NoteStore(deck_id=1, name="foo")
+        with pytest.raises(ValueError, match="has 2 fields"):
+            store.add(guid="a", model=TYPES["qa"], fields=["q", "a"])
+        assert len(store) == 0
+
+    @staticmethod
+    def test_tag_with_space_raises():
+        store = NoteStore(deck_id=1, name="foo")
+        with pytest.raises(ValueError, match="contains a space"):
+            store.add(
+                guid="a", model=TYPES["qa"], fields=["q", "a", "s.md"], tags=["a b"]
+            )
+
+    @staticmethod
+    def test_deck_id_must_be_an_integer():
+        with pytest.raises(TypeError):
+            NoteStore(deck_id="1", name="foo")
+
+    @staticmethod
+    def test_select_keeps_only_what_the_rows_use():
+        store = NoteStore(deck_id=1, name="foo")
+        store.add(
+            guid="a",
+            model=TYPES["qa"],
+            fields=["q", "a", "s.md"],
+            tags=["x"],
+            media=[Path("a.png")],
+        )
+        store.add(
+            guid="b",
+            model=TYPES["cloze"],
+            fields=["{{c1::x}} {{c2::y}}", "s.md"],
+            media=[Path("b.png")],
+            sort_field="zz",
+        )
+        subset = store.select([1])
+        assert subset.guids == ["b"]
+        assert subset.models == [TYPES["cloze"]]
+        assert subset.tag_sets == ["  "]
+        assert subset.media == [Path("b.png")]
+        assert list(subset.cards(0)) == list(store.cards(1))
+        assert subset.sort_field(0) == "zz"
+        assert len(store.select([])) == 0
@@ -0,0 +1,73 @@
+import re
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from app.logic.timing import BudgetExceeded, FileTimings, time_budget
+
+# Backtracks exponentially in the length of the run of "a"s.
+RUNAWAY_PATTERN = re.compile(r"(a+)+$")
+
+
+class TestTimeBudget:
+    @staticmethod
+    def test_stops_a_runaway_regex():
+        start = time.perf_counter()
+        with pytest.raises(BudgetExceeded):
+            with time_budget(0.1):
+                RUNAWAY_PATTERN.match("a" * 40 + "b")
+        assert time.perf_counter() - start < 2
+
+    @staticmethod
+    def test_no_budget_and_fast_blocks_pass():
+        with time_budget(None):
+            pass
+        with time_budget(5):
+            pass
+        time.sleep(0.05)  # the timer was disarmed on exit
+
+    @staticmethod
+    def test_zero_budget_fails_at_once():
+        with pytest.raises(BudgetExceeded):
+            with time_budget(0):
+                pass
+
+    @staticmethod
+    def test_off_main_thread_checks_after_the_block():
+        raised = []
+
+        def run():
+            try:
+                with time_budget(0.01):
+                    time.sleep(0.05)
+            except BudgetExceeded:
+                raised.append(True)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        assert raised == [True]
+
+
+class TestFileTimings:
+    @staticmethod
+    def test_slowest_sums_stages():
+        timings = FileTimings()
+        timings.add(Path("a.md"), "validate", 0.5)
+        timings.add(Path("b.md"), "validate", 0.2)
+        timings.add(Path("b.md"), "render", 0.4)
+        timings.add(Path("c.md"), "validate", 0.1)
+        assert [path.name for path, _ in timings.slowest(2)] == ["b.md", "a.md"]
+
+        report = timings.format_slowest(1).splitlines()
+        assert report[0] == "slowest 1 file(s):"
+        assert report[1].split() == [
+            "0.600s",
+            "b.md",
+            "(validate",
+            "0.200s,",
+            "render",
+            "0.400s)",
+        ]
@@ -1,8 +1,23 @@
+import hashlib
+import os
+import random
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.logic import utils
 from app.logic.utils import (
     clean_str_for_filename,
     convert_md_to_html,
+    export_git_revision,
     generate_integer_hash,
+    generate_integer_hashes,
     generate_random_string,
+    search_changed_markdown_files,
     search_files,
 )
 
@@ -18,6 +33,46 @@ class TestGenerateIntegerHash:
     def test_distinct_inputs_differ():
         assert generate_integer_hash("foo") != generate_integer_hash("bar")
 
+    # Deck ids already imported into users' collections; these must not move.
+    GOLDEN = {
+        "foo": 168299274,
+        "bar": 168495885,
+        "AnkCompiler Example": 218630412,
+        "Bench::Deck0": 168495368,
+        "Spanish::Vocab::Verbs": 101123084,
+        "": 117901834,
+        "日本語::漢字": 218762249,
+        "a" * 500: 168494859,
+    }
+
+    def test_golden_values(self):
+        for text, expected in self.GOLDEN.items():
+            assert generate_integer_hash(text) == expected
+
+    @staticmethod
+    def _reference(text):
+        """The original bit-by-bit implementation."""
+        sha256_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        hash_value = 0
+        for i in range(0, 40, 2):
+            byte = int(sha256_hash[i : i + 2], 16)
+            for bit in range(4):
+                if (byte & 1) == 1:
+                    hash_value += 1 << ((3 - bit) * 8)
+                byte >>= 1
+        return hash_value
+
+    def test_matches_reference_implementation(self):
+        rng = random.Random(0)
+        texts = [
+            "".join(chr(rng.randrange(32, 0x3000)) for _ in range(rng.randrange(40)))
+            for _ in range(2000)
+        ]
+        expected = [self._reference(text) for text in texts]
+        assert [generate_integer_hash(text) for text in texts] == expected
+        assert generate_integer_hashes(texts) == expected
+        assert generate_integer_hashes(iter(texts)) == expected
+
 
 class TestGenerateRandomString:
     @staticmethod
@@ -76,6 +131,25 @@ class TestConvertMdToHtml:
         assert r"\(x^2\)" in out
 
 
+class TestMappedFile:
+    @staticmethod
+    def test_str_only_whitespace_pattern():
+        # MappedFile declines exactly the characters a str \s matches and a
+        # bytes \s does not.
+        text = "".join(
+            chr(code)
+            for code in range(sys.maxunicode + 1)
+            if not 0xD800 <= code <= 0xDFFF  # surrogates have no UTF-8
+        )
+        str_only = [
+            char.encode()
+            for char in re.findall(r"\s", text)
+            if not re.match(rb"\s", char.encode())
+        ]
+        found = utils._STR_ONLY_SPACE_BYTES_RE.findall(text.encode())
+        assert found == str_only
+
+
 class TestSearchFiles:
     @staticmethod
     def _make_tree(root):
@@ -118,3 +192,132 @@ class TestSearchFiles:
         # must terminate (no infinite recursion) and ignore the symlinked dir
         found = sorted(p.name for p in search_files(".md", tmp_path))
         assert found == ["low.md", "mid.md", "top.md"]
+
+    def test_ignored_directories_are_never_listed(self, tmp_path, monkeypatch):
+        self._make_tree(tmp_path)
+        (tmp_path / ".ankcignore").write_text("deeper/\n")
+        (tmp_path / "sub" / ".ankcignore").write_text("mid.md\n")
+        listed = []
+        scandir = os.scandir
+
+        def recording_scandir(path):
+            listed.append(Path(path).name)
+            return scandir(path)
+
+        monkeypatch.setattr(os, "scandir", recording_scandir)
+        found = sorted(p.name for p in search_files(".md", tmp_path))
+        assert found == ["top.md"]
+        assert "deeper" not in listed
+
+    def test_gitignore_is_opt_in(self, tmp_path, monkeypatch):
+        self._make_tree(tmp_path)
+        (tmp_path / ".gitignore").write_text("sub\n")
+        found = sorted(p.name for p in search_files(".md", tmp_path))
+        assert found == ["low.md", "mid.md", "top.md"]
+        monkeypatch.setattr(settings, "GITIGNORE", True)
+        found = sorted(p.name for p in search_files(".md", tmp_path))
+        assert found == ["top.md"]
+
+
+class TestSearchChangedMarkdownFiles:
+    @staticmethod
+    def _git(repo, *args):
+        subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+    def _repo(self, root):
+        self._git(root, "init")
+        self._git(root, "config", "user.email", "t@t.t")
+        self._git(root, "config", "user.name", "t")
+        (root / "sub" / "deeper").mkdir(parents=True)
+        for name in ("a.md", "b.md", "sub/c.md", "sub/deeper/d.md", "e.txt"):
+            (root / name).write_text("x")
+        self._git(root, "add", ".")
+        self._git(root, "commit", "-m", "base")
+
+    def test_only_changed_markdown(self, tmp_path):
+        self._repo(tmp_path)
+        for name in ("a.md", "sub/deeper/d.md", "e.txt"):
+            (tmp_path / name).write_text("changed")
+        (tmp_path / "b.md").unlink()  # deletions are not sources to check
+
+        found = search_changed_markdown_files(tmp_path, "HEAD")
+        assert sorted(found) == [tmp_path / "a.md", tmp_path / "sub/deeper/d.md"]
+        limited = search_changed_markdown_files(tmp_path, "HEAD", search_depth=1)
+        assert limited == [tmp_path / "a.md"]
+
+    def test_untracked_files_included(self, tmp_path):
+        self._repo(tmp_path)
+        (tmp_path / "sub" / "new.md").write_text("x")
+        (tmp_path / "skipped.md").write_text("x")
+        (tmp_path / ".gitignore").write_text("skipped.md\n")
+        (tmp_path / "a.md").write_text("changed")
+
+        found = search_changed_markdown_files(tmp_path, "HEAD")
+        assert found == [tmp_path / "a.md", tmp_path / "sub" / "new.md"]
+        found = search_changed_markdown_files(tmp_path / "sub", "HEAD")
+        assert found == [tmp_path / "sub" / "new.md"]
+
+    def test_relative_to_search_path(self, tmp_path):
+        self._repo(tmp_path)
+        (tmp_path / "a.md").write_text("changed")
+        (tmp_path / "sub" / "c.md").write_text("changed")
+        found = search_changed_markdown_files(tmp_path / "sub", "HEAD")
+        assert found == [tmp_path / "sub" / "c.md"]
+
+    def test_ignored_files_skipped(self, tmp_path):
+        self._repo(tmp_path)
+        for name in ("a.md", "sub/c.md", "sub/deeper/d.md"):
+            (tmp_path / name).write_text("changed")
+        (tmp_path / "sub" / ".ankcignore").write_text("deeper\n/c.md\n")
+        assert search_changed_markdown_files(tmp_path, "HEAD") == [tmp_path / "a.md"]
+
+    def test_unknown_ref_raises(self, tmp_path):
+        self._repo(tmp_path)
+        with pytest.raises(ValueError, match="no-such-ref"):
+            search_changed_markdown_files(tmp_path, "no-such-ref")
+        with pytest.raises(ValueError, match="Not a git revision"):
+            search_changed_markdown_files(tmp_path, "--output=x")
+
+
+class TestExportGitRevision:
+    @staticmethod
+    def _git(repo, *args):
+        subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+    def test_exports_the_vault_subtree(self, tmp_path):
+        repo = tmp_path / "repo"
+        (repo / "vault" / "sub").mkdir(parents=True)
+        self._git(repo, "init")
+        self._git(repo, "config", "user.email", "t@t.t")
+        self._git(repo, "config", "user.name", "t")
+        (repo / "outside.md").write_text("x")
+        (repo / "vault" / "sub" / "a.md").write_text("old")
+        self._git(repo, "add", ".")
+        self._git(repo, "commit", "-m", "base")
+        (repo / "vault" / "sub" / "a.md").write_text("new")
+
+        target = tmp_path / "out"
+        export_git_revision(repo / "vault", "HEAD", target)
+        assert [p.relative_to(target).as_posix() for p in target.rglob("*")] == [
+            "sub",
+            "sub/a.md",
+        ]
+        assert (target / "sub" / "a.md").read_text() == "old"
+
+        with pytest.raises(ValueError, match="no-such-ref"):
+            export_git_revision(repo / "vault", "no-such-ref", tmp_path / "x")
+        with pytest.raises(ValueError, match="Not a git revision"):
+            export_git_revision(repo / "vault", "--output=x", tmp_path / "x")
+
+    def test_refuses_links_out_of_the_target(self, tmp_path):
+        repo = tmp_path / "repo"
+        repo.mkdir()
+        self._git(repo, "init")
+        self._git(repo, "config", "user.email", "t@t.t")
+        self._git(repo, "config", "user.name", "t")
+        (repo / "escape.md").symlink_to("../../../etc/passwd")
+        self._git(repo, "add", ".")
+        self._git(repo, "commit", "-m", "base")
+
+        with pytest.raises(ValueError, match="Unsafe file"):
+            export_git_revision(repo, "HEAD", tmp_path / "out")
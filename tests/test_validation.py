@@ -1,6 +1,21 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.logic import validation
+from app.logic.sources import File
+from app.logic.timing import FileTimings
+from app.logic.utils import parse_markdown_file
 from app.logic.validation import (
+    UidIndex,
     findings_to_dicts,
     format_findings,
+    iter_file_chunks,
+    iter_findings,
+    scan_uids,
     validate_files,
 )
 
@@ -130,3 +145,178 @@ class TestFormatting:
         dicts = findings_to_dicts(findings)
         assert dicts[0]["level"] == "error"
         assert dicts[0]["file"] == str(path)
+
+
+class TestIterFindings:
+    def test_lazy_per_file(self, tmp_path):
+        bad = write_deck(tmp_path, "---\ndeck: foo\n---\n---\n\nq ::: a\n\n---\n")
+        findings = iter_findings([bad, tmp_path / "missing.md"])
+        # the first file's findings arrive before the second file is read
+        assert "missing uid" in next(findings).message
+
+
+class TestUidIndex:
+    @staticmethod
+    def test_first_location_kept():
+        index = UidIndex()
+        index.add("abc1234567", Path("a.md"), 4)
+        index.add("abc1234567", Path("b.md"), 9)
+        index.add("zzz1234567", Path("a.md"), 12)
+        assert len(index) == 2
+        assert "abc1234567" in index
+        assert index.first_seen("abc1234567") == (Path("a.md"), 4)
+        assert index.first_seen("zzz1234567") == (Path("a.md"), 12)
+        assert index.first_seen("unknown123") is None
+
+
+class TestParallel:
+    def test_parallel_matches_serial(self, tmp_path):
+        card = "---\n\nq ::: a\n\n---\n[^uid]: {uid}\n\n"
+        paths = []
+        for index in range(6):
+            body = "---\ndeck: foo\n---\n"
+            body += card.format(uid="abc1234567")  # duplicated across files
+            body += card.format(uid=f"file{index:06d}")
+            body += card.format(uid=f"file{index:06d}")  # duplicated in-file
+            body += "---\n\nno uid ::: here\n\n---\n"
+            paths.append(write_deck(tmp_path, body, name=f"{5 - index}.md"))
+
+        serial = validate_files(paths)
+        assert validate_files(paths, jobs=2) == serial
+        dupes = [f for f in serial if "abc1234567" in f.message]
+        assert all(f"first seen at {paths[0]}:4" in f.message for f in dupes)
+        assert len(dupes) == 5
+
+    def test_pool_keeps_a_bounded_window_in_flight(self, tmp_path, monkeypatch):
+        paths = [
+            write_deck(tmp_path, "---\ndeck: foo\n---\n", name=f"{i:03d}.md")
+            for i in range(100)
+        ]
+        monkeypatch.setattr(settings, "READ_WINDOW", 16)
+        submitted = []
+
+        class Recording(ThreadPoolExecutor):
+            def submit(self, fn, batch):
+                submitted.extend(batch)
+                return super().submit(fn, batch)
+
+        with Recording(max_workers=2) as pool:
+            reports = validation._pool_reports(pool, paths, jobs=2)
+            assert next(reports).path == paths[0]
+            assert len(submitted) == 16
+            assert [report.path for report in reports] == paths[1:]
+
+
+MIXED_DECK = (
+    "---\ndeck: foo\ntags: [t]\n---\n"
+    "Transcript prose — naïve café, 日本語.\n\n"
+    "---\n\nq ::: a\n\n---\n[^uid]: abc1234567\n\n"
+    "more prose\n\n"
+    "---\n\nq2 ::: a2 ✓\n\n---\n[^uid]: abc1234567\n[^tag]: x\n\n"
+    "---\n\nno uid ::: here\n\n---\n\n"
+    "---\n\nq3 ::: a3\n\n---\n[^uid]: def1234567\n[^type]: nonsense\n\n"
+    "stray ::: card\n"
+    "---\n\nA {{c1::cloze}}\n\n---\n[^uid]: ghi1234567\n"
+)
+
+
+class TestMappedFiles:
+    @staticmethod
+    def mapped(monkeypatch):
+        """Maps every file, and fails any whole-file read."""
+        monkeypatch.setattr(settings, "MMAP_THRESHOLD", 1)
+
+        def no_read(path):
+            raise AssertionError(f"{path} was read whole")
+
+        monkeypatch.setattr(validation, "read_file", no_read)
+
+    def test_findings_match_text_path(self, tmp_path, monkeypatch):
+        paths = [
+            write_deck(tmp_path, MIXED_DECK, name="a.md"),
+            write_deck(tmp_path, "---\ntags: [t]\n---\nx ::: y\n", name="b.md"),
+        ]
+        expected = validate_files(paths)
+        assert len(expected) == 6
+
+        self.mapped(monkeypatch)
+        assert validate_files(paths) == expected
+
+    def test_scan_uids_match_text_path(self, tmp_path, monkeypatch):
+        path = write_deck(tmp_path, MIXED_DECK)
+        expected = scan_uids(path)
+        self.mapped(monkeypatch)
+        assert scan_uids(path) == expected
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            MIXED_DECK.replace("\n", "\r\n"),  # read_file translates CRLF
+            MIXED_DECK.rstrip("\n"),  # parse normalizes a missing final newline
+            # whitespace only a str \s matches, where the grammar allows it
+            MIXED_DECK.replace("---\n\nq2", "---\n\u3000\nq2"),
+            MIXED_DECK.replace("\n\n---\n[^uid]: abc", "\n\xa0\n---\n[^uid]: abc"),
+        ],
+    )
+    def test_files_bytes_cannot_match_are_read_as_text(
+        self, tmp_path, monkeypatch, body
+    ):
+        path = tmp_path / "d.md"
+        path.write_bytes(body.encode("utf-8"))
+        expected = validate_files([path])
+        monkeypatch.setattr(settings, "MMAP_THRESHOLD", 1)
+        assert validate_files([path]) == expected
+
+
+class TestFileChunks:
+    @staticmethod
+    def split(path):
+        meta, body = parse_markdown_file(path)
+        chunks = File(path=path, meta=meta, body=body).extract_chunks()
+        return [(chunk.body, chunk.meta) for chunk in chunks]
+
+    @pytest.mark.parametrize("threshold", [None, 1])
+    def test_chunks_and_findings_match_separate_passes(
+        self, tmp_path, monkeypatch, threshold
+    ):
+        paths = [
+            write_deck(tmp_path, MIXED_DECK, name="a.md"),
+            write_deck(tmp_path, MIXED_DECK, name="b.md"),  # duplicate uids
+        ]
+        expected_findings = validate_files(paths)
+        expected_chunks = [self.split(path) for path in paths]
+        if threshold is not None:
+            monkeypatch.setattr(settings, "MMAP_THRESHOLD", threshold)
+
+        findings, chunks = [], []
+        for _, file_findings, file_chunks in iter_file_chunks(paths):
+            findings.extend(file_findings)
+            chunks.append([(chunk.body, chunk.meta) for chunk in file_chunks])
+        assert findings == expected_findings
+        assert chunks == expected_chunks
+
+
+# Unbalanced cloze openings between thousands of "---" lines: the block
+# grammar backtracks quadratically over them.
+RUNAWAY_DECK = "---\ndeck: foo\n---\n" + "---\n\nx {{c1::y\n" * 8000
+
+
+class TestFileTimeout:
+    @staticmethod
+    def test_runaway_file_reported_and_others_validated(tmp_path):
+        slow = write_deck(tmp_path, RUNAWAY_DECK, name="slow.md")
+        fine = write_deck(
+            tmp_path, "---\ndeck: foo\n---\n---\n\nq ::: a\n\n---\n", name="ok.md"
+        )
+        timings = FileTimings()
+        start = time.perf_counter()
+        findings = list(iter_findings([slow, fine], file_timeout=0.2, timings=timings))
+        assert time.perf_counter() - start < 5
+
+        assert [(f.file.name, f.line) for f in findings] == [
+            ("slow.md", None),
+            ("ok.md", 4),
+        ]
+        assert "0.2s per-file budget" in findings[0].message
+        assert "missing uid" in findings[1].message
+        assert {path.name for path, _ in timings.slowest(2)} == {"slow.md", "ok.md"}